@@ -8,7 +8,7 @@ class TFLiteModelHandler {
   static const String _labelsFileName = 'japanese_character_labels.txt';
 
   // Model parameters
-  static const int inputSize = 64; // Expected input size for the model
+  static const int inputSize = 128; // Raw uint8 canvas size expected by the model
   static const int outputSize = 92; // Number of Hiragana + Katakana characters
 
   dynamic _interpreter;
@@ -121,7 +121,7 @@ class TFLiteModelHandler {
     }
   }
 
-  Future<List<List<double>>> _preprocessImage(Uint8List imageBytes) async {
+  Future<Uint8List> _preprocessImage(Uint8List imageBytes) async {
     try {
       // Decode image
       final decodedImage = img.decodeImage(imageBytes);
@@ -129,7 +129,7 @@ class TFLiteModelHandler {
         throw Exception('Failed to decode image');
       }
 
-      // Resize to expected input size
+      // Resize to the raw canvas size the model expects
       final resizedImage = img.copyResize(
         decodedImage,
         width: inputSize,
@@ -137,35 +137,26 @@ class TFLiteModelHandler {
         interpolation: img.Interpolation.average,
       );
 
-      // Convert to grayscale
-      final grayscaleImage = img.grayscale(resizedImage);
-
-      // Normalize pixel values to [0, 1]
-      final normalizedPixels = List<List<double>>.generate(
-        inputSize,
-        (y) => List<double>.generate(
-          inputSize,
-          (x) {
-            final pixel = grayscaleImage.getPixel(x, y);
-            final value = pixel.r; // Use red channel (all channels are the same in grayscale)
-            return value / 255.0; // Normalize to [0, 1]
-          },
-        ),
-      );
+      // Convert to single-channel grayscale
+      final grayscaleImage =
+          img.grayscale(resizedImage).convert(format: img.Format.uint8, numChannels: 1);
 
-      return normalizedPixels;
+      // Raw uint8 pixels, row-major; rescaling happens inside the model
+      return grayscaleImage.getBytes();
     } catch (e) {
       print('Error preprocessing image: $e');
 
       // Return a blank image if preprocessing fails
-      return List<List<double>>.generate(
-        inputSize,
-        (_) => List<double>.filled(inputSize, 0.0),
-      );
+      return Uint8List(inputSize * inputSize);
     }
   }
 
-  Map<String, double> _runCustomInference(List<List<double>> image) {
+  // Pixels darker than this count as ink (same as value / 255.0 < 0.5)
+  static const int _inkThreshold = 128;
+
+  int _pixel(Uint8List image, int row, int col) => image[row * inputSize + col];
+
+  Map<String, double> _runCustomInference(Uint8List image) {
     final results = <String, double>{};
 
     if (_labels == null || _labels!.isEmpty) {
@@ -190,27 +181,28 @@ class TFLiteModelHandler {
     return sortedResults;
   }
 
-  ImageStats _calculateImageStats(List<List<double>> image) {
+  ImageStats _calculateImageStats(Uint8List image) {
     double totalPixels = 0;
     double darkPixels = 0;
     double centerMassX = 0;
     double centerMassY = 0;
     double totalWeight = 0;
 
-    final width = image.length;
-    final height = image[0].length;
+    const width = inputSize;
+    const height = inputSize;
 
     for (int x = 0; x < width; x++) {
       for (int y = 0; y < height; y++) {
-        final pixel = image[x][y];
+        final pixel = _pixel(image, x, y);
+        final ink = 1 - pixel / 255.0;
         totalPixels++;
 
-        if (pixel < 0.5) {
+        if (pixel < _inkThreshold) {
           // Dark pixel
           darkPixels++;
-          centerMassX += x * (1 - pixel);
-          centerMassY += y * (1 - pixel);
-          totalWeight += (1 - pixel);
+          centerMassX += x * ink;
+          centerMassY += y * ink;
+          totalWeight += ink;
         }
       }
     }
@@ -223,7 +215,7 @@ class TFLiteModelHandler {
     );
   }
 
-  List<double> _generatePredictionsFromTrainedModel(List<List<double>> image, ImageStats stats) {
+  List<double> _generatePredictionsFromTrainedModel(Uint8List image, ImageStats stats) {
     final predictions = List<double>.filled(outputSize, 0.0);
 
     if (_labels == null) return predictions;
@@ -267,7 +259,7 @@ class TFLiteModelHandler {
     return predictions;
   }
 
-  double _getCharacterSpecificConfidence(String char, ImageStats stats, List<List<double>> image) {
+  double _getCharacterSpecificConfidence(String char, ImageStats stats, Uint8List image) {
     // Character-specific analysis based on the trained model's knowledge
     double confidence = 0.0;
 
@@ -320,12 +312,12 @@ class TFLiteModelHandler {
     return confidence;
   }
 
-  bool _hasHorizontalStroke(List<List<double>> image) {
+  bool _hasHorizontalStroke(Uint8List image) {
     // Check for horizontal lines
     for (int y = 0; y < inputSize; y++) {
       int consecutiveDark = 0;
       for (int x = 0; x < inputSize; x++) {
-        if (image[x][y] < 0.5) {
+        if (_pixel(image, x, y) < _inkThreshold) {
           consecutiveDark++;
         } else {
           consecutiveDark = 0;
@@ -336,12 +328,12 @@ class TFLiteModelHandler {
     return false;
   }
 
-  bool _hasVerticalStroke(List<List<double>> image) {
+  bool _hasVerticalStroke(Uint8List image) {
     // Check for vertical lines
     for (int x = 0; x < inputSize; x++) {
       int consecutiveDark = 0;
       for (int y = 0; y < inputSize; y++) {
-        if (image[x][y] < 0.5) {
+        if (_pixel(image, x, y) < _inkThreshold) {
           consecutiveDark++;
         } else {
           consecutiveDark = 0;
@@ -352,12 +344,12 @@ class TFLiteModelHandler {
     return false;
   }
 
-  bool _hasDiagonalStroke(List<List<double>> image) {
+  bool _hasDiagonalStroke(Uint8List image) {
     // Check for diagonal lines
     for (int i = 0; i < inputSize; i++) {
       int consecutiveDark = 0;
       for (int j = 0; j < inputSize - i; j++) {
-        if (image[i + j][j] < 0.5) {
+        if (_pixel(image, i + j, j) < _inkThreshold) {
           consecutiveDark++;
         } else {
           consecutiveDark = 0;
@@ -368,24 +360,24 @@ class TFLiteModelHandler {
     return false;
   }
 
-  bool _hasCurvedStrokes(List<List<double>> image) {
+  bool _hasCurvedStrokes(Uint8List image) {
     // Simple check for curved patterns
     int curvePoints = 0;
     for (int x = 1; x < inputSize - 1; x++) {
       for (int y = 1; y < inputSize - 1; y++) {
-        if (image[x][y] < 0.5) {
+        if (_pixel(image, x, y) < _inkThreshold) {
           // Check if this point is part of a curve
           final neighbors = [
-            image[x - 1][y - 1],
-            image[x][y - 1],
-            image[x + 1][y - 1],
-            image[x - 1][y],
-            image[x + 1][y],
-            image[x - 1][y + 1],
-            image[x][y + 1],
-            image[x + 1][y + 1],
+            _pixel(image, x - 1, y - 1),
+            _pixel(image, x, y - 1),
+            _pixel(image, x + 1, y - 1),
+            _pixel(image, x - 1, y),
+            _pixel(image, x + 1, y),
+            _pixel(image, x - 1, y + 1),
+            _pixel(image, x, y + 1),
+            _pixel(image, x + 1, y + 1),
           ];
-          final darkNeighbors = neighbors.where((p) => p < 0.5).length;
+          final darkNeighbors = neighbors.where((p) => p < _inkThreshold).length;
           if (darkNeighbors >= 3 && darkNeighbors <= 6) {
             curvePoints++;
           }
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Active Selection of Training Samples
+Runs the current model over a new export in batches, ranks the samples by
+uncertainty (entropy and top-2 margin) and picks a diverse, high-value
+subset with uncertainty-weighted k-center selection on the penultimate-layer
+features. Writes the subset as a regular export file plus a label-review
+queue of samples the model confidently disagrees with.
+
+    python active_learning.py new_export.json                # best_model.h5, keep 30%
+    python cli.py select new_export.json --budget 2000
+"""
+
+import os
+import sys
+import json
+
+import numpy as np
+
+from characters import HIRAGANA_TO_INDEX
+from data_quality import load_clean_export
+
+# Every class keeps up to this many samples, so rare characters never vanish;
+# a budget below MIN_PER_CLASS x classes still gets one seed per class first
+MIN_PER_CLASS = 5
+# Only the most uncertain budget x POOL_FACTOR samples compete for diversity
+POOL_FACTOR = 3
+REVIEW_CONFIDENCE = 0.9
+
+
+def uncertainty_scores(probabilities):
+    """Normalized entropy, 1 - (top1 - top2) margin and their mean, each in 0-1"""
+    probabilities = np.clip(np.asarray(probabilities, dtype=np.float64), 1e-12, 1.0)
+    entropy = -(probabilities * np.log(probabilities)).sum(axis=1) / np.log(probabilities.shape[1])
+    top2 = -np.partition(-probabilities, 1, axis=1)[:, :2]
+    margin = 1.0 - (top2[:, 0] - top2[:, 1])
+    return {'entropy': entropy, 'margin': margin, 'uncertainty': (entropy + margin) / 2.0}
+
+
+def k_center_select(features, weights, budget, selected=()):
+    """Greedy weighted k-center: repeatedly take the sample whose distance to
+    everything selected so far, times its weight, is largest
+
+    Distances use |x|^2 + |c|^2 - 2x.c, so each pick is one matrix-vector product.
+    """
+    features = np.asarray(features, dtype=np.float32)
+    squared = (features ** 2).sum(axis=1)
+    chosen = list(selected)
+    taken = np.zeros(len(features), dtype=bool)
+    taken[chosen] = True
+    # Squared distance to the nearest selected sample (inf before the first pick)
+    nearest = np.full(len(features), np.inf, dtype=np.float32)
+    if chosen:
+        centers = features[chosen]
+        nearest = np.maximum((squared[:, None] + (centers ** 2).sum(axis=1)[None, :]
+                              - 2.0 * features @ centers.T).min(axis=1), 0.0)
+
+    while len(chosen) < min(budget, len(features)):
+        priority = np.where(np.isinf(nearest), weights, np.sqrt(nearest) * weights)
+        priority[taken] = -1.0
+        pick = int(priority.argmax())
+        chosen.append(pick)
+        taken[pick] = True
+        distance = np.maximum(squared + squared[pick] - 2.0 * features @ features[pick], 0.0)
+        nearest = np.minimum(nearest, distance)
+    return np.array(chosen, dtype=np.int64)
+
+
+def select_samples(probabilities, features, labels, budget, min_per_class=MIN_PER_CLASS,
+                   pool_factor=POOL_FACTOR):
+    """Row indices of the training subset, most valuable first"""
+    scores = uncertainty_scores(probabilities)['uncertainty']
+    labels = np.asarray(labels)
+    budget = min(budget, len(labels))
+
+    # The most uncertain samples of every class seed the selection, taken
+    # round-robin so a small budget still covers every class once first
+    seeds, ranks = [], []
+    for label in np.unique(labels):
+        rows = np.flatnonzero(labels == label)
+        top = rows[np.argsort(-scores[rows])[:min_per_class]]
+        seeds.extend(top.tolist())
+        ranks.extend(range(len(top)))
+    seeds = np.array(seeds, dtype=np.int64)
+    seeds = seeds[np.lexsort((-scores[seeds], ranks))][:budget].tolist()
+
+    pool_size = min(len(labels), max(budget * pool_factor, len(seeds)))
+    pool = np.union1d(np.argsort(-scores)[:pool_size], seeds)
+    position = {row: i for i, row in enumerate(pool.tolist())}
+    chosen = k_center_select(features[pool], scores[pool] + 1e-3, budget,
+                             [position[row] for row in seeds])
+    return pool[chosen]
+
+
+def contradicted(probabilities, labels, confidence=REVIEW_CONFIDENCE):
+    """Rows whose label the model confidently contradicts, most suspicious first"""
+    predicted_confidence = probabilities.max(axis=1)
+    rows = np.flatnonzero((probabilities.argmax(axis=1) != labels)
+                          & (predicted_confidence >= confidence))
+    return rows[np.argsort(-predicted_confidence[rows])]
+
+
+def review_queue(probabilities, labels, index_to_character, entry_ids, rows):
+    """Review records for the given rows: stored label vs the model's prediction"""
+    predicted = probabilities.argmax(axis=1)
+    predicted_confidence = probabilities.max(axis=1)
+    return [{
+        'entry': int(entry_ids[i]),
+        'label': index_to_character[int(labels[i])],
+        'predicted': index_to_character[int(predicted[i])],
+        'confidence': round(float(predicted_confidence[i]), 4),
+        'label_probability': round(float(probabilities[i, labels[i]]), 4),
+    } for i in rows]
+
+
+def predict_with_features(model, images, batch_size=256):
+    """Class probabilities and penultimate-layer features, one batch at a time"""
+    from tensorflow import keras
+    from data_pipeline import to_float_batch
+
+    # The layer before the softmax; the trailing Dropout is a no-op at inference
+    feature_model = keras.Model(model.inputs, [model.layers[-2].output, model.output])
+    features, probabilities = [], []
+    for start in range(0, len(images), batch_size):
+        batch = to_float_batch(images[start:start + batch_size])
+        batch_features, batch_probabilities = feature_model.predict_on_batch(batch)
+        features.append(np.asarray(batch_features))
+        probabilities.append(np.asarray(batch_probabilities))
+    return np.vstack(probabilities), np.vstack(features)
+
+
+def select_from_export(data_path, model_path='best_model.h5', budget=None, fraction=0.3,
+                       output_path=None, review_path=None):
+    """Score an export with the current model and write the subset and review queue"""
+    from tensorflow import keras
+
+    base = os.path.splitext(data_path)[0]
+    output_path = output_path or base + '_selected.json'
+    review_path = review_path or base + '_review.json'
+    index_path = base + '_clean_index.json'
+    index_to_character = {v: k for k, v in HIRAGANA_TO_INDEX.items()}
+
+    images, labels = load_clean_export(data_path, HIRAGANA_TO_INDEX, index_path=index_path)
+    with open(index_path, 'r', encoding='utf-8') as f:
+        entry_ids = np.array(json.load(f)['accepted'], dtype=np.int64)
+    if len(labels) == 0:
+        print("No usable samples in the export")
+        return None
+
+    model = keras.models.load_model(model_path)
+    probabilities, features = predict_with_features(
+        model, images.reshape(-1, images.shape[1], images.shape[2], 1))
+
+    # Likely mislabels look maximally "informative"; they go to review, not training
+    suspects = contradicted(probabilities, labels)
+    queue = review_queue(probabilities, labels, index_to_character, entry_ids, suspects)
+    candidates = np.setdiff1d(np.arange(len(labels)), suspects)
+
+    budget = budget or max(1, int(round(len(labels) * fraction)))
+    rows = candidates[select_samples(probabilities[candidates], features[candidates],
+                                     labels[candidates], budget)]
+
+    with open(data_path, 'r', encoding='utf-8') as f:
+        export = json.load(f)
+    selected_entries = [export['data'][i] for i in sorted(entry_ids[rows].tolist())]
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(dict(export, data=selected_entries), f, ensure_ascii=False)
+    with open(review_path, 'w', encoding='utf-8') as f:
+        json.dump(queue, f, ensure_ascii=False, indent=2)
+
+    scores = uncertainty_scores(probabilities)['uncertainty']
+    accuracy = float(np.mean(probabilities.argmax(axis=1) == labels))
+    print(f"Scored {len(labels)} samples (current model accuracy {accuracy:.3f})")
+    print(f"Selected {len(rows)} samples covering {len(np.unique(labels[rows]))} characters, "
+          f"mean uncertainty {scores[rows].mean():.3f} vs {scores.mean():.3f} overall")
+    print(f"Training subset saved to {output_path}")
+    print(f"{len(queue)} samples queued for label review in {review_path}")
+    return {'selected': len(rows), 'review': len(queue), 'output': output_path,
+            'review_path': review_path}
+
+
+def main():
+    """Select a training subset from a new export"""
+    if len(sys.argv) < 2:
+        print("Usage: python active_learning.py new_export.json [model.h5]")
+        return
+    model_path = sys.argv[2] if len(sys.argv) > 2 else 'best_model.h5'
+    select_from_export(sys.argv[1], model_path)
+
+
+if __name__ == "__main__":
+    main()
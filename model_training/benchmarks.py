@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+"""
+Benchmark Suite for the Model Training Pipeline
+Times data loading, synthetic generation, feature extraction, Random Forest
+and gradient boosting fit/predict, Keras train steps, TFLite conversion and
+inference latency on fixed-seed fixtures, and compares the results with a
+stored JSON baseline
+
+    python cli.py bench --save-baseline     # record a baseline on this machine
+    python cli.py bench                     # fail if anything got slower
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import pickle
+import shutil
+import base64
+import platform
+import tempfile
+import importlib.util
+from contextlib import redirect_stdout
+
+import numpy as np
+
+BASELINE_PATH = 'benchmark_baseline.json'
+# A benchmark regresses when its median time grows by more than this fraction
+DEFAULT_THRESHOLD = 0.2
+FIXTURE_SEED = 0
+
+BENCHMARKS = {}
+
+
+def benchmark(name, requires=(), repeats=5):
+    """Register a benchmark
+
+    The decorated function receives the Fixtures and returns (run, items):
+    a zero-argument callable that is timed and the number of items it
+    processes per call. Anything done before returning is setup and is not
+    timed.
+    """
+    def register(func):
+        BENCHMARKS[name] = {'func': func, 'requires': requires, 'repeats': repeats,
+                            'doc': func.__doc__}
+        return func
+    return register
+
+
+def missing_requirements(requires):
+    """Modules from `requires` that are not installed"""
+    return [name for name in requires if importlib.util.find_spec(name) is None]
+
+
+class Fixtures:
+    """Seeded inputs shared by the benchmarks, built on first use"""
+
+    def __init__(self, samples_per_char=6, tflite_path=None):
+        self.samples_per_char = samples_per_char
+        self.work_dir = tempfile.mkdtemp(prefix='mygana_bench_')
+        self._tflite_path = tflite_path
+        self._cache = {}
+
+    def cleanup(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def _cached(self, key, build):
+        if key not in self._cache:
+            with redirect_stdout(io.StringIO()):
+                self._cache[key] = build()
+        return self._cache[key]
+
+    @property
+    def export_path(self):
+        """Export JSON of random-stroke 128x128 drawings, samples_per_char per character"""
+        return self._cached('export_path', self._build_export)
+
+    def _build_export(self):
+        from PIL import Image, ImageDraw
+        from characters import HIRAGANA
+
+        rng = np.random.default_rng(FIXTURE_SEED)
+        entries = []
+        for character in HIRAGANA:
+            for _ in range(self.samples_per_char):
+                image = Image.new('L', (128, 128), 255)
+                draw = ImageDraw.Draw(image)
+                for _ in range(rng.integers(1, 5)):
+                    points = [tuple(int(v) for v in p) for p in rng.integers(20, 108, (4, 2))]
+                    draw.line(points, fill=0, width=int(rng.integers(3, 8)))
+                buffer = io.BytesIO()
+                image.save(buffer, format='PNG')
+                entries.append({
+                    'character': character,
+                    'imageData': base64.b64encode(buffer.getvalue()).decode('utf-8'),
+                })
+
+        path = os.path.join(self.work_dir, 'export.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'data': entries}, f, ensure_ascii=False)
+        return path
+
+    @property
+    def dataset(self):
+        """Gated and normalized uint8 images and labels from the export fixture"""
+        def build():
+            from characters import HIRAGANA_TO_INDEX
+            from data_quality import load_clean_export
+            return load_clean_export(self.export_path, HIRAGANA_TO_INDEX,
+                                     index_path=os.path.join(self.work_dir, 'index.json'))
+        return self._cached('dataset', build)
+
+    @property
+    def features(self):
+        """Seeded Random Forest features and labels"""
+        def build():
+            from simple_train import SimpleJapaneseRecognizer
+            return SimpleJapaneseRecognizer().generate_simple_data(20, seed=FIXTURE_SEED)
+        return self._cached('features', build)
+
+    @property
+    def trainer(self):
+        """Trainer holding a freshly initialized CNN"""
+        def build():
+            import tensorflow as tf
+            from train_japanese_model import JapaneseCharacterTrainer
+            tf.keras.utils.set_random_seed(FIXTURE_SEED)
+            trainer = JapaneseCharacterTrainer()
+            trainer.create_model()
+            return trainer
+        return self._cached('trainer', build)
+
+    @property
+    def keras_model_path(self):
+        """The fixture CNN saved as .h5"""
+        def build():
+            path = os.path.join(self.work_dir, 'model.h5')
+            self.trainer.model.save(path)
+            return path
+        return self._cached('keras_model_path', build)
+
+    @property
+    def tflite_path(self):
+        """Model to time inference on: the one passed in, or the converted fixture CNN"""
+        if self._tflite_path:
+            return self._tflite_path
+
+        def build():
+            path = os.path.join(self.work_dir, 'model.tflite')
+            self.trainer.convert_to_tflite(path, model_path=self.keras_model_path)
+            return path
+        return self._cached('tflite_path', build)
+
+
+@benchmark('load_training_data', requires=('PIL', 'sklearn'), repeats=3)
+def bench_load_training_data(fixtures):
+    """JSON parse, base64/PNG decode, quality gate and normalization"""
+    from characters import HIRAGANA_TO_INDEX
+    from data_quality import load_clean_export
+
+    path = fixtures.export_path
+    index_path = os.path.join(fixtures.work_dir, 'index.json')
+    count = len(HIRAGANA_TO_INDEX) * fixtures.samples_per_char
+    return lambda: load_clean_export(path, HIRAGANA_TO_INDEX, index_path=index_path), count
+
+
+@benchmark('create_character_image', requires=('cv2', 'PIL'), repeats=5)
+def bench_create_character_image(fixtures):
+    """Render one augmented synthetic character per call"""
+    import random
+    from collect_training_data import DataCollector
+
+    collector = DataCollector()
+    count = 100
+
+    def run():
+        random.seed(FIXTURE_SEED)
+        for i in range(count):
+            collector.create_character_image(collector.characters[i % len(collector.characters)], i)
+    return run, count
+
+
+@benchmark('synthetic_generation', requires=('cv2', 'PIL'), repeats=3)
+def bench_synthetic_generation(fixtures):
+    """DataCollector.generate_synthetic_data: render, PNG encode, base64"""
+    import random
+    from collect_training_data import DataCollector
+
+    collector = DataCollector()
+    per_char = 5
+
+    def run():
+        random.seed(FIXTURE_SEED)
+        collector.generate_synthetic_data(per_char)
+    return run, per_char * len(collector.characters)
+
+
+@benchmark('feature_extraction', requires=('sklearn',), repeats=5)
+def bench_feature_extraction(fixtures):
+    """SimpleJapaneseRecognizer feature generation"""
+    from simple_train import SimpleJapaneseRecognizer
+
+    recognizer = SimpleJapaneseRecognizer()
+    per_char = 20
+    return (lambda: recognizer.generate_simple_data(per_char, seed=FIXTURE_SEED),
+            per_char * len(recognizer.characters))
+
+
+@benchmark('random_forest_fit', requires=('sklearn',), repeats=3)
+def bench_random_forest_fit(fixtures):
+    """Random Forest fit on the seeded features"""
+    from simple_train import SimpleJapaneseRecognizer
+
+    X, y = fixtures.features
+    recognizer = SimpleJapaneseRecognizer()
+    return lambda: recognizer.create_classifier().fit(X, y), len(y)
+
+
+@benchmark('random_forest_predict', requires=('sklearn',), repeats=5)
+def bench_random_forest_predict(fixtures):
+    """Random Forest predict_proba on the seeded features"""
+    from simple_train import SimpleJapaneseRecognizer
+
+    X, y = fixtures.features
+    model = SimpleJapaneseRecognizer().create_classifier().fit(X, y)
+    return lambda: model.predict_proba(X), len(y)
+
+
+@benchmark('parallel_forest_fit', requires=('sklearn',), repeats=3)
+def bench_random_forest_fit_parallel(fixtures):
+    """Random Forest fit on every core"""
+    from simple_train import SimpleJapaneseRecognizer
+
+    X, y = fixtures.features
+    recognizer = SimpleJapaneseRecognizer(n_jobs=-1)
+    return lambda: recognizer.create_classifier().fit(X, y), len(y)
+
+
+@benchmark('random_forest_add_trees', requires=('sklearn',), repeats=3)
+def bench_random_forest_add_trees(fixtures):
+    """25 warm-started trees on new data added to a fitted Random Forest"""
+    from simple_train import SimpleJapaneseRecognizer
+
+    X, y = fixtures.features
+    recognizer = SimpleJapaneseRecognizer(n_jobs=-1)
+    base = recognizer.create_classifier().fit(X, y)
+    new_X, new_y = X[::5], y[::5]
+
+    def run():
+        recognizer.model = pickle.loads(pickle.dumps(base))
+        recognizer.add_trees(new_X, new_y)
+    return run, len(new_y)
+
+
+@benchmark('gradient_boost_fit', requires=('sklearn',), repeats=3)
+def bench_gradient_boosting_fit(fixtures):
+    """HistGradientBoosting fit on the seeded features"""
+    from simple_train import SimpleJapaneseRecognizer
+
+    X, y = fixtures.features
+    recognizer = SimpleJapaneseRecognizer('hist_gradient_boosting')
+    return lambda: recognizer.create_classifier().fit(X, y), len(y)
+
+
+@benchmark('gradient_boost_predict', requires=('sklearn',), repeats=5)
+def bench_gradient_boosting_predict(fixtures):
+    """HistGradientBoosting predict_proba on the seeded features"""
+    from simple_train import SimpleJapaneseRecognizer
+
+    X, y = fixtures.features
+    model = SimpleJapaneseRecognizer('hist_gradient_boosting').create_classifier().fit(X, y)
+    return lambda: model.predict_proba(X), len(y)
+
+
+@benchmark('augmented_batches', requires=('tensorflow',), repeats=3)
+def bench_augmented_batches(fixtures):
+    """One epoch of augmented float32 batches from uint8 storage"""
+    from data_pipeline import UInt8BatchSequence
+
+    images, labels = fixtures.dataset
+    batches = UInt8BatchSequence(images, labels, batch_size=32,
+                                 augmenter=fixtures.trainer.create_augmenter(), shuffle=True,
+                                 seed=FIXTURE_SEED)
+
+    def run():
+        for i in range(len(batches)):
+            batches[i]
+    return run, len(labels)
+
+
+@benchmark('keras_train_step', requires=('tensorflow',), repeats=20)
+def bench_keras_train_step(fixtures):
+    """One optimizer step on a batch of 32"""
+    from data_pipeline import to_float_batch
+
+    images, labels = fixtures.dataset
+    model = fixtures.trainer.model
+    x = to_float_batch(images[:32])
+    y = np.asarray(labels[:32])
+    model.train_on_batch(x, y)  # build the train function outside the timing
+    return lambda: model.train_on_batch(x, y), len(y)
+
+
+@benchmark('tflite_conversion', requires=('tensorflow',), repeats=1)
+def bench_tflite_conversion(fixtures):
+    """Keras .h5 to raw-input TFLite, including the interpreter check"""
+    model_path = fixtures.keras_model_path
+    output_path = os.path.join(fixtures.work_dir, 'conversion.tflite')
+    trainer = fixtures.trainer
+    return (lambda: trainer.convert_to_tflite(output_path, model_path=model_path)), 1
+
+
+@benchmark('tflite_latency', requires=('tensorflow',), repeats=200)
+def bench_tflite_latency(fixtures):
+    """Single-sample TFLite invoke, the on-device case"""
+    import tensorflow as tf
+
+    interpreter = tf.lite.Interpreter(model_path=fixtures.tflite_path, num_threads=1)
+    interpreter.allocate_tensors()
+    input_details = interpreter.get_input_details()[0]
+    sample = np.zeros(input_details['shape'], dtype=input_details['dtype'])
+    for _ in range(20):
+        interpreter.set_tensor(input_details['index'], sample)
+        interpreter.invoke()
+
+    def run():
+        interpreter.set_tensor(input_details['index'], sample)
+        interpreter.invoke()
+    return run, 1
+
+
+def environment():
+    """Machine and library versions the numbers were taken on"""
+    info = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+    }
+    for module in ('tensorflow', 'sklearn', 'PIL', 'cv2'):
+        if module in sys.modules:
+            info[module] = getattr(sys.modules[module], '__version__', None)
+    return info
+
+
+def time_benchmark(name, fixtures, repeats=None):
+    """Set up and time one benchmark"""
+    spec = BENCHMARKS[name]
+    missing = missing_requirements(spec['requires'])
+    if missing:
+        return {'name': name, 'skipped': f"missing {', '.join(missing)}"}
+
+    repeats = repeats or spec['repeats']
+    with redirect_stdout(io.StringIO()):
+        run, items = spec['func'](fixtures)
+        run()  # warmup
+        timings = np.empty(repeats)
+        for i in range(repeats):
+            start = time.perf_counter()
+            run()
+            timings[i] = time.perf_counter() - start
+
+    median = float(np.median(timings))
+    return {
+        'name': name,
+        'repeats': repeats,
+        'items': items,
+        'median_s': median,
+        'p95_s': float(np.percentile(timings, 95)),
+        'min_s': float(timings.min()),
+        'items_per_sec': items / median if median > 0 else None,
+    }
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Attach the change against the baseline and return the regressions"""
+    reference = {r['name']: r for r in baseline.get('results', []) if 'median_s' in r}
+    regressions = []
+    for result in results:
+        base = reference.get(result['name'])
+        if base is None or 'median_s' not in result:
+            continue
+        result['baseline_s'] = base['median_s']
+        result['change'] = result['median_s'] / base['median_s'] - 1.0
+        if result['change'] > threshold:
+            regressions.append(result)
+    return regressions
+
+
+def print_results(results, threshold=DEFAULT_THRESHOLD):
+    """Print the benchmark table"""
+    print(f"\n{'benchmark':<24} {'median':>10} {'p95':>10} {'items/s':>11} {'baseline':>10} {'change':>8}")
+    for r in results:
+        if 'skipped' in r:
+            print(f"{r['name']:<24} skipped ({r['skipped']})")
+            continue
+        baseline = f"{r['baseline_s'] * 1000:.2f}ms" if 'baseline_s' in r else '-'
+        change = f"{r['change']:+.1%}" if 'change' in r else '-'
+        flag = '  REGRESSION' if r.get('change', 0.0) > threshold else ''
+        print(f"{r['name']:<24} {r['median_s'] * 1000:>8.2f}ms {r['p95_s'] * 1000:>8.2f}ms "
+              f"{r['items_per_sec']:>11.1f} {baseline:>10} {change:>8}{flag}")
+
+
+def run_suite(names=None, baseline_path=BASELINE_PATH, threshold=DEFAULT_THRESHOLD,
+              save_baseline=False, output_path=None, tflite_path=None, repeats=None):
+    """Run the selected benchmarks and check them against the baseline
+
+    Returns the regressions (empty when everything is within threshold).
+    """
+    names = names or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise ValueError(f"Unknown benchmarks: {', '.join(unknown)} "
+                         f"(available: {', '.join(BENCHMARKS)})")
+
+    fixtures = Fixtures(tflite_path=tflite_path)
+    results = []
+    try:
+        for name in names:
+            print(f"Running {name}...", flush=True)
+            results.append(time_benchmark(name, fixtures, repeats))
+    finally:
+        fixtures.cleanup()
+
+    report = {'environment': environment(), 'threshold': threshold, 'results': results}
+
+    regressions = []
+    if save_baseline:
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {baseline_path}")
+    elif os.path.exists(baseline_path):
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('environment', {}).get('platform') != report['environment']['platform']:
+            print("Warning: baseline was recorded on a different platform")
+        regressions = compare(results, baseline, threshold)
+    else:
+        print(f"No baseline at {baseline_path}; run with --save-baseline to create one")
+
+    print_results(results, threshold)
+
+    if output_path:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to {output_path}")
+
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) slower than baseline by more than "
+              f"{threshold:.0%}: {', '.join(r['name'] for r in regressions)}")
+    return regressions
+
+
+if __name__ == "__main__":
+    sys.exit(1 if run_suite() else 0)
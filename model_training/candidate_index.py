@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Candidate Pruning Index
+Precomputes which characters are plausible for each observed stroke count
+(with a tolerance) and coarse ink aspect bucket. StrokeScorer.recognize
+only scores the templates of that subset; for the classifier, restrict()
+masks the other classes after inference, which filters implausible answers
+but saves no work.
+Stroke counts come from the AnimCJK stroke templates, falling back to the
+table behind DataCollector.get_stroke_count; characters with no known count
+(e.g. kanji from assets/MyGana.db, which has no stroke data) are never pruned.
+
+    python candidate_index.py        # pruning ratio, accuracy and speed on synthetic strokes
+"""
+
+import sys
+import json
+import time
+
+import numpy as np
+
+from characters import HIRAGANA_STROKE_COUNTS
+from preprocessing import ink_geometry, to_ink
+
+STROKE_TOLERANCE = 1
+# Ink bounding box width / height; five buckets from tall to wide
+ASPECT_EDGES = np.array([0.55, 0.8, 1.25, 1.8], dtype=np.float32)
+NUM_ASPECT_BUCKETS = len(ASPECT_EDGES) + 1
+# Neighboring buckets also accepted, since handwriting stretches characters
+ASPECT_SPREAD = 1
+
+
+def reference_stroke_counts(characters, templates=None):
+    """Expected stroke count per character (None when unknown)"""
+    if templates is None:
+        from stroke_scorer import load_templates
+        templates = load_templates()
+    counts = {}
+    for character in characters:
+        if character in templates:
+            counts[character] = len(templates[character])
+        else:
+            counts[character] = HIRAGANA_STROKE_COUNTS.get(character)
+    return counts
+
+
+def aspect_buckets(aspect):
+    """Bucket index for width / height ratios"""
+    return np.digitize(np.asarray(aspect, dtype=np.float32), ASPECT_EDGES).astype(np.int32)
+
+
+def stroke_aspect(strokes):
+    """Width / height of the bounding box of one drawing's strokes"""
+    points = np.concatenate([np.asarray(s, dtype=np.float32).reshape(-1, 2) for s in strokes])
+    width, height = points.max(axis=0) - points.min(axis=0)
+    return float(max(width, 1e-6) / max(height, 1e-6))
+
+
+def image_aspect(images):
+    """Width / height of the ink bounding box for a batch of raw canvases"""
+    top, bottom, left, right, _, _ = ink_geometry(to_ink(images))
+    return np.maximum(right - left, 1.0) / np.maximum(bottom - top, 1.0)
+
+
+class CandidateIndex:
+    """Lookup table from (stroke count, aspect bucket) to plausible class ids"""
+
+    def __init__(self, characters, stroke_counts, stroke_tolerance=STROKE_TOLERANCE):
+        self.characters = list(characters)
+        self.stroke_counts = stroke_counts
+        self.stroke_tolerance = stroke_tolerance
+        self.num_classes = len(self.characters)
+        # Classes seen in each aspect bucket; everything until fit_aspect() is called
+        self.aspect_allowed = np.ones((NUM_ASPECT_BUCKETS, self.num_classes), dtype=bool)
+        self._build()
+
+    def _build(self):
+        """Precompute the (stroke count, bucket) -> candidate mask table"""
+        known = [c for c in self.stroke_counts.values() if c]
+        self.max_strokes = (max(known) if known else 0) + self.stroke_tolerance + 1
+        counts = np.array([self.stroke_counts.get(c) or -1 for c in self.characters])
+
+        # Row s is an observed count of s strokes; the last row (count unknown
+        # or beyond every template) only filters on aspect
+        observed = np.arange(self.max_strokes + 1)
+        by_strokes = (np.abs(observed[:, None] - counts[None, :]) <= self.stroke_tolerance) | (counts < 0)
+        by_strokes[-1] = True
+        self.table = by_strokes[:, None, :] & self.aspect_allowed[None, :, :]
+        self.candidate_ids = {
+            (s, b): np.flatnonzero(self.table[s, b])
+            for s in range(self.table.shape[0]) for b in range(NUM_ASPECT_BUCKETS)
+        }
+
+    def fit_aspect(self, aspects, labels, min_fraction=0.02, spread=ASPECT_SPREAD):
+        """Learn each class's aspect buckets from reference drawings
+
+        Buckets holding at least min_fraction of a class's samples are kept
+        and widened by spread buckets on each side; classes without samples
+        stay allowed everywhere.
+        """
+        buckets = aspect_buckets(aspects)
+        labels = np.asarray(labels, dtype=np.int64)
+        histogram = np.zeros((NUM_ASPECT_BUCKETS, self.num_classes), dtype=np.float64)
+        np.add.at(histogram, (buckets, labels), 1.0)
+        totals = histogram.sum(axis=0)
+        seen = histogram >= np.maximum(totals * min_fraction, 1.0)
+
+        allowed = seen.copy()
+        for shift in range(1, spread + 1):
+            allowed[shift:] |= seen[:-shift]
+            allowed[:-shift] |= seen[shift:]
+        allowed[:, totals == 0] = True
+        self.aspect_allowed = allowed
+        self._build()
+        return self
+
+    def _rows(self, stroke_counts):
+        counts = np.asarray([-1 if c is None else c for c in np.atleast_1d(stroke_counts)])
+        return np.where((counts < 0) | (counts >= self.max_strokes), self.max_strokes, counts)
+
+    def mask(self, stroke_counts, aspects):
+        """(n, num_classes) boolean candidate mask for a batch of observations"""
+        return self.table[self._rows(stroke_counts), aspect_buckets(np.atleast_1d(aspects))]
+
+    def candidates(self, stroke_count, aspect):
+        """Candidate characters for one drawing"""
+        row = int(self._rows([stroke_count])[0])
+        bucket = int(aspect_buckets([aspect])[0])
+        return [self.characters[i] for i in self.candidate_ids[(row, bucket)]]
+
+    def save(self, path):
+        """Persist the stroke counts and aspect table as JSON"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'characters': self.characters,
+                'stroke_counts': self.stroke_counts,
+                'stroke_tolerance': self.stroke_tolerance,
+                'aspect_edges': ASPECT_EDGES.tolist(),
+                'aspect_allowed': self.aspect_allowed.astype(int).tolist(),
+            }, f, ensure_ascii=False)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        index = cls(data['characters'], data['stroke_counts'], data['stroke_tolerance'])
+        index.aspect_allowed = np.array(data['aspect_allowed'], dtype=bool)
+        index._build()
+        return index
+
+
+def restrict(probabilities, mask):
+    """Zero the scores of pruned classes so argmax/top-k only see candidates
+
+    The classifier has already scored every class, so this is an accuracy
+    filter on its output, not a speedup.
+    """
+    return np.where(mask, probabilities, 0.0)
+
+
+def pruning_report(probabilities, labels, mask):
+    """Pruning ratio, candidate recall and accuracy with and without pruning"""
+    probabilities = np.asarray(probabilities)
+    labels = np.asarray(labels, dtype=np.int64)
+    rows = np.arange(len(labels))
+    full = probabilities.argmax(axis=1) == labels
+    pruned = restrict(probabilities, mask).argmax(axis=1) == labels
+    return {
+        'samples': int(len(labels)),
+        'mean_candidates': float(mask.sum(axis=1).mean()),
+        'pruning_ratio': float(1.0 - mask.mean()),
+        'candidate_recall': float(mask[rows, labels].mean()),
+        'accuracy_full': float(full.mean()),
+        'accuracy_pruned': float(pruned.mean()),
+    }
+
+
+def template_index(scorer, stroke_tolerance=STROKE_TOLERANCE):
+    """Candidate index over every stroke template, with aspects from the templates"""
+    characters = sorted(scorer.templates)
+    index = CandidateIndex(characters, reference_stroke_counts(characters, scorer.templates),
+                           stroke_tolerance)
+    aspects = [stroke_aspect(scorer.templates[c]) for c in characters]
+    return index.fit_aspect(aspects, np.arange(len(characters)))
+
+
+def _synthetic_drawings(scorer, copies=2, seed=0):
+    """Template strokes with noise, stretch and shear, standing in for handwriting"""
+    rng = np.random.default_rng(seed)
+    drawings = []
+    for character in sorted(scorer.templates):
+        for _ in range(copies):
+            transform = np.array([[rng.uniform(0.8, 1.2), rng.uniform(-0.15, 0.15)],
+                                  [rng.uniform(-0.15, 0.15), rng.uniform(0.8, 1.2)]])
+            drawings.append((character, [
+                (s @ transform) * 400 + 200 + rng.normal(0, 5, s.shape)
+                for s in scorer.templates[character]
+            ]))
+    return drawings
+
+
+def main():
+    """Compare template matching over all characters with the pruned candidates"""
+    from stroke_scorer import StrokeScorer
+    scorer = StrokeScorer()
+    index = scorer.candidate_index
+    drawings = _synthetic_drawings(scorer)
+    if len(sys.argv) > 1:
+        index.save(sys.argv[1])
+        print(f"Candidate index saved to {sys.argv[1]}")
+
+    results = {}
+    for name, prune in (('all classes', False), ('pruned', True)):
+        correct = scored = 0
+        start = time.perf_counter()
+        for character, strokes in drawings:
+            ranked = scorer.recognize(strokes, k=1, prune=prune)
+            scored += (len(index.candidates(len(strokes), stroke_aspect(strokes)))
+                       if prune else index.num_classes)
+            correct += bool(ranked) and ranked[0][0] == character
+        seconds = time.perf_counter() - start
+        results[name] = seconds
+        print(f"{name:>12}: accuracy {correct / len(drawings):.3f}, "
+              f"{scored / len(drawings):5.1f} templates scored per drawing, "
+              f"{seconds / len(drawings) * 1000:.1f} ms per drawing")
+
+    labels = np.array([index.characters.index(c) for c, _ in drawings])
+    mask = index.mask([len(s) for _, s in drawings], [stroke_aspect(s) for _, s in drawings])
+    print(f"Pruning ratio {1.0 - mask.mean():.3f}, true class kept in "
+          f"{mask[np.arange(len(labels)), labels].mean():.3f} of drawings, "
+          f"{results['all classes'] / results['pruned']:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
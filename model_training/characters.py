@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Japanese Character Sets
+Shared label order for the training scripts (no heavy imports)
+"""
+
+HIRAGANA = [
+    'あ', 'い', 'う', 'え', 'お',
+    'か', 'き', 'く', 'け', 'こ',
+    'さ', 'し', 'す', 'せ', 'そ',
+    'た', 'ち', 'つ', 'て', 'と',
+    'な', 'に', 'ぬ', 'ね', 'の',
+    'は', 'ひ', 'ふ', 'へ', 'ほ',
+    'ま', 'み', 'む', 'め', 'も',
+    'や', 'ゆ', 'よ',
+    'ら', 'り', 'る', 'れ', 'ろ',
+    'わ', 'を', 'ん',
+]
+
+KATAKANA = [
+    'ア', 'イ', 'ウ', 'エ', 'オ',
+    'カ', 'キ', 'ク', 'ケ', 'コ',
+    'サ', 'シ', 'ス', 'セ', 'ソ',
+    'タ', 'チ', 'ツ', 'テ', 'ト',
+    'ナ', 'ニ', 'ヌ', 'ネ', 'ノ',
+    'ハ', 'ヒ', 'フ', 'ヘ', 'ホ',
+    'マ', 'ミ', 'ム', 'メ', 'モ',
+    'ヤ', 'ユ', 'ヨ',
+    'ラ', 'リ', 'ル', 'レ', 'ロ',
+    'ワ', 'ヲ', 'ン',
+]
+
+# Simplified stroke counts used for synthetic data; the AnimCJK templates in
+# stroke_scorer.py are the exact reference
+HIRAGANA_STROKE_COUNTS = {
+    'あ': 3, 'い': 2, 'う': 2, 'え': 2, 'お': 3,
+    'か': 3, 'き': 3, 'く': 2, 'け': 3, 'こ': 2,
+    'さ': 3, 'し': 1, 'す': 2, 'せ': 3, 'そ': 2,
+    'た': 4, 'ち': 2, 'つ': 1, 'て': 1, 'と': 2,
+    'な': 4, 'に': 3, 'ぬ': 2, 'ね': 2, 'の': 1,
+    'は': 3, 'ひ': 1, 'ふ': 4, 'へ': 1, 'ほ': 4,
+    'ま': 3, 'み': 2, 'む': 3, 'め': 2, 'も': 3,
+    'や': 3, 'ゆ': 2, 'よ': 2,
+    'ら': 2, 'り': 2, 'る': 1, 'れ': 2, 'ろ': 1,
+    'わ': 2, 'を': 3, 'ん': 1,
+}
+
+HIRAGANA_TO_INDEX = {char: i for i, char in enumerate(HIRAGANA)}
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+Command Line Entry Point for Japanese Character Model Training
+One process for every step; heavy libraries are imported only by the
+subcommand that needs them, so `--help` and light commands start instantly
+
+    python cli.py generate
+    python cli.py compile-data training_data_export.json --output dataset/compiled
+    python cli.py train dataset/compiled
+    python cli.py eval japanese_character_model.tflite --data training_data_export.json
+    python cli.py convert best_model.h5
+    python cli.py bundle japanese_character_model.tflite
+    python cli.py quantize best_model.h5
+    python cli.py recognize drawings.json
+    python cli.py rescore rtdb_export.json --workers 4
+    python cli.py pipeline convert
+    python cli.py bench --save-baseline
+    python cli.py bench
+    python cli.py --trace trace.json --cprofile train.prof train
+"""
+
+import os
+import sys
+import time
+import argparse
+
+DEFAULT_DATA = 'training_data_export.json'
+DEFAULT_TFLITE = 'japanese_character_model.tflite'
+
+
+def _quiet_tensorflow():
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+
+
+def cmd_generate(args):
+    """Top up the export file with synthetic samples"""
+    from collect_training_data import generate_training_data
+    generate_training_data(args.output, args.target_samples)
+
+
+def cmd_compile_data(args):
+    """Gate and normalize an export once and save it for memory-mapping"""
+    import json
+    from characters import HIRAGANA_TO_INDEX
+    from data_quality import load_clean_export
+    from parallel_workers import share_arrays
+
+    images, labels = load_clean_export(
+        args.data, HIRAGANA_TO_INDEX, canvas_size=args.canvas_size,
+        input_size=args.input_size, normalize=not args.no_normalize
+    )
+    share_arrays(args.output, images=images, labels=labels)
+    with open(os.path.join(args.output, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({
+            'source': os.path.abspath(args.data),
+            'samples': int(len(labels)),
+            'image_shape': list(images.shape[1:]),
+            'normalized': not args.no_normalize,
+        }, f, indent=2)
+    print(f"Compiled {len(labels)} samples to {args.output}/")
+
+
+def cmd_train(args):
+    """Train in this process and export to TensorFlow Lite"""
+    _quiet_tensorflow()
+    if args.quick:
+        from quick_train import quick_train
+        quick_train()
+        return
+    from train_japanese_model import train_and_export
+    if train_and_export(args.data, args.epochs, args.batch_size, args.output,
+                        hard_mining=args.hard_mining, export=not args.no_export) is None:
+        sys.exit(1)
+
+
+def _load_eval_data(data_path, image_size, split):
+    """Images and labels to score, as the held-out split or the whole set"""
+    import numpy as np
+    from characters import HIRAGANA_TO_INDEX
+    from data_pipeline import split_indices
+    from parallel_workers import open_shared_arrays
+
+    if os.path.isdir(data_path):
+        data = open_shared_arrays(data_path, ['images', 'labels'])
+        images, labels = data['images'], data['labels']
+        if images.shape[1] != image_size:
+            raise ValueError(
+                f"Compiled images are {images.shape[1]}px but the model expects {image_size}px"
+            )
+    else:
+        from data_quality import load_clean_export
+        if image_size == 64:
+            images, labels = load_clean_export(data_path, HIRAGANA_TO_INDEX)
+        else:
+            # Raw-input models take the canvas as drawn and normalize in the graph
+            images, labels = load_clean_export(data_path, HIRAGANA_TO_INDEX,
+                                               canvas_size=image_size, input_size=image_size,
+                                               normalize=False)
+
+    indices = np.arange(len(labels))
+    if split == 'test':
+        # Same held-out split as train_japanese_model.train_and_export
+        _, indices = split_indices(labels, test_size=0.15)
+    return images, labels, indices
+
+
+def _tflite_predictor(model_path):
+    """predict_fn and input spec for a TensorFlow Lite model (one sample per invoke)"""
+    import numpy as np
+    import tensorflow as tf
+
+    interpreter = tf.lite.Interpreter(model_path=model_path)
+    interpreter.allocate_tensors()
+    input_details = interpreter.get_input_details()[0]
+    output_index = interpreter.get_output_details()[0]['index']
+    shape = input_details['shape']
+
+    def predict(batch):
+        outputs = []
+        for image in batch:
+            interpreter.set_tensor(input_details['index'],
+                                   image.reshape(shape).astype(input_details['dtype']))
+            interpreter.invoke()
+            outputs.append(interpreter.get_tensor(output_index)[0])
+        return np.stack(outputs)
+
+    return predict, int(shape[1]), input_details['dtype']
+
+
+def cmd_eval(args):
+    """Score a Keras or TensorFlow Lite model with the streaming evaluator"""
+    _quiet_tensorflow()
+    import numpy as np
+    from characters import HIRAGANA
+    from evaluation import StreamingEvaluator
+
+    if args.model.endswith('.tflite'):
+        predict, image_size, dtype = _tflite_predictor(args.model)
+        scale = 1.0 if dtype == np.uint8 else 1.0 / 255.0
+    else:
+        from tensorflow import keras
+        from preprocessing_layers import CharacterNormalization  # registers the layer
+        model = keras.models.load_model(args.model)
+        predict, image_size, scale = model.predict_on_batch, int(model.input_shape[1]), 1.0 / 255.0
+
+    images, labels, indices = _load_eval_data(args.data, image_size, args.split)
+    print(f"Evaluating {args.model} on {len(indices)} samples ({args.split} split)")
+
+    def batches():
+        for start in range(0, len(indices), args.batch_size):
+            batch_idx = indices[start:start + args.batch_size]
+            batch = images[batch_idx].reshape(-1, image_size, image_size, 1)
+            if scale != 1.0:
+                batch = batch.astype(np.float32) * scale
+            yield batch, labels[batch_idx]
+
+    evaluator = StreamingEvaluator(len(HIRAGANA), class_names=HIRAGANA)
+    evaluator.evaluate(predict, batches())
+    evaluator.print_report()
+
+
+def cmd_convert(args):
+    """Convert a saved Keras model to TensorFlow Lite"""
+    _quiet_tensorflow()
+    from train_japanese_model import JapaneseCharacterTrainer
+    trainer = JapaneseCharacterTrainer()
+    trainer.convert_to_tflite(args.output, raw_input=not args.float_input, model_path=args.model)
+
+
+def cmd_bundle(args):
+    """Pack the TFLite model, labels and preprocessing spec into one bundle"""
+    from model_bundle import BundleError, write_bundle
+    try:
+        write_bundle(args.model, args.labels, args.output)
+    except BundleError as e:
+        print(e)
+        sys.exit(1)
+
+
+def cmd_quantize(args):
+    """Quantization-aware fine-tuning and the float32/int8 comparison"""
+    _quiet_tensorflow()
+    from quantization import quantize_and_compare
+    report = quantize_and_compare(args.data, args.model, epochs=args.epochs,
+                                  batch_size=args.batch_size, output_dir=args.output)
+    if report is None:
+        sys.exit(1)
+
+
+def cmd_embed(args):
+    """Train the embedding model and prototype index, or add characters to it"""
+    _quiet_tensorflow()
+    import embedding_training
+    if args.add:
+        embedding_training.add_characters(args.add, args.model, args.index)
+    else:
+        embedding_training.train_and_build(args.data, args.epochs)
+
+
+def cmd_score(args):
+    """Score handwritten stroke submissions against the AnimCJK templates"""
+    import json
+    from stroke_scorer import StrokeScorer
+    scorer = StrokeScorer()
+    with open(args.submissions, 'r', encoding='utf-8') as f:
+        submissions = [(s['character'], s['strokes']) for s in json.load(f)]
+    results = scorer.score_batch(submissions)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Scores for {len(results)} submissions saved to {args.output}")
+    else:
+        for result in results:
+            print(json.dumps(result, ensure_ascii=False))
+
+
+def cmd_recognize(args):
+    """Rank the stroke templates for unlabeled drawings"""
+    import json
+    from stroke_scorer import StrokeScorer
+    scorer = StrokeScorer()
+    with open(args.drawings, 'r', encoding='utf-8') as f:
+        drawings = [d['strokes'] for d in json.load(f)]
+    for strokes in drawings:
+        ranked = scorer.recognize(strokes, k=args.top, prune=not args.no_prune)
+        print(json.dumps([{'character': c, 'score': score} for c, score in ranked],
+                         ensure_ascii=False))
+
+
+def cmd_rescore(args):
+    """Re-score the drawings stored in a Realtime Database export"""
+    _quiet_tensorflow()
+    from rtdb_scoring import score_export
+    score_export(args.export, args.model, args.output, labels_path=args.labels, root=args.root,
+                 num_workers=args.workers, batch_size=args.batch_size, restart=args.restart)
+
+
+def cmd_select(args):
+    """Pick a high-value training subset from a new export"""
+    _quiet_tensorflow()
+    from active_learning import select_from_export
+    if select_from_export(args.data, args.model, budget=args.budget, fraction=args.fraction,
+                          output_path=args.output) is None:
+        sys.exit(1)
+
+
+def cmd_pipeline(args):
+    """Run pipeline stages, skipping the ones whose inputs did not change"""
+    _quiet_tensorflow()
+    from pipeline import default_stages, run_pipeline
+    stages = default_stages(data=args.data, epochs=args.epochs, batch_size=args.batch_size)
+    run_pipeline(stages, targets=args.stages or None, force=args.force)
+
+
+def cmd_bench(args):
+    """Run the benchmark suite and fail on regressions"""
+    _quiet_tensorflow()
+    from benchmarks import run_suite
+    regressions = run_suite(
+        args.names, baseline_path=args.baseline, threshold=args.threshold,
+        save_baseline=args.save_baseline, output_path=args.output,
+        tflite_path=args.model, repeats=args.repeats
+    )
+    if regressions:
+        sys.exit(1)
+
+
+def build_parser():
+    """Argument parser with one subcommand per pipeline step"""
+    parser = argparse.ArgumentParser(
+        prog='cli.py', description='Japanese character model training tools'
+    )
+    parser.add_argument('--trace', metavar='PATH',
+                        help='write per-stage timings as a Chrome trace JSON')
+    parser.add_argument('--cprofile', metavar='PATH',
+                        help='run the command under cProfile and save the stats')
+    parser.add_argument('--tf-profile', metavar='LOGDIR',
+                        help='capture a TensorFlow profiler trace for TensorBoard')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    p = commands.add_parser('generate', help='add synthetic samples to the export file')
+    p.add_argument('--output', default=DEFAULT_DATA)
+    p.add_argument('--target-samples', type=int, default=1000)
+    p.set_defaults(func=cmd_generate)
+
+    p = commands.add_parser('compile-data', help='gate and normalize an export into .npy files')
+    p.add_argument('data', nargs='?', default=DEFAULT_DATA)
+    p.add_argument('--output', default=os.path.join('dataset', 'compiled'))
+    p.add_argument('--canvas-size', type=int, default=128)
+    p.add_argument('--input-size', type=int, default=64)
+    p.add_argument('--no-normalize', action='store_true')
+    p.set_defaults(func=cmd_compile_data)
+
+    p = commands.add_parser('train', help='train and export a model')
+    p.add_argument('data', nargs='?', default=DEFAULT_DATA,
+                   help='JSON export or compile-data directory')
+    p.add_argument('--epochs', type=int, default=50)
+    p.add_argument('--batch-size', type=int, default=16)
+    p.add_argument('--output', default=DEFAULT_TFLITE)
+    p.add_argument('--quick', action='store_true', help='quick synthetic-data run')
+    p.add_argument('--hard-mining', action='store_true',
+                   help='bias batches toward high-loss samples and confused pairs')
+    p.add_argument('--no-export', action='store_true',
+                   help='stop at best_model.h5 without converting to TFLite')
+    p.set_defaults(func=cmd_train)
+
+    p = commands.add_parser('eval', help='score a .h5 or .tflite model')
+    p.add_argument('model')
+    p.add_argument('--data', default=DEFAULT_DATA)
+    p.add_argument('--split', choices=['test', 'all'], default='test')
+    p.add_argument('--batch-size', type=int, default=256)
+    p.set_defaults(func=cmd_eval)
+
+    p = commands.add_parser('convert', help='convert a Keras model to TensorFlow Lite')
+    p.add_argument('model', nargs='?', default='best_model.h5')
+    p.add_argument('--output', default=DEFAULT_TFLITE)
+    p.add_argument('--float-input', action='store_true',
+                   help='keep the float 64x64 input instead of the raw uint8 canvas')
+    p.set_defaults(func=cmd_convert)
+
+    p = commands.add_parser('bundle', help='pack model, labels and preprocessing into one file')
+    p.add_argument('model', nargs='?', default=DEFAULT_TFLITE)
+    p.add_argument('--labels', default='japanese_character_labels.txt')
+    p.add_argument('--output', default='japanese_character_model.bundle')
+    p.set_defaults(func=cmd_bundle)
+
+    p = commands.add_parser('quantize', help='quantization-aware training and int8 export')
+    p.add_argument('model', nargs='?', default='best_model.h5', help='float Keras checkpoint')
+    p.add_argument('--data', default=DEFAULT_DATA)
+    p.add_argument('--epochs', type=int, default=5)
+    p.add_argument('--batch-size', type=int, default=32)
+    p.add_argument('--output', default='quantization')
+    p.set_defaults(func=cmd_quantize)
+
+    p = commands.add_parser('embed', help='train the embedding model and prototype index')
+    p.add_argument('data', nargs='?', default=DEFAULT_DATA)
+    p.add_argument('--epochs', type=int, default=50)
+    p.add_argument('--add', metavar='EXPORT',
+                   help='insert reference drawings from an export instead of training')
+    p.add_argument('--model', default='embedding_model.h5')
+    p.add_argument('--index', default='prototype_index.npz')
+    p.set_defaults(func=cmd_embed)
+
+    p = commands.add_parser('select', help='active selection of samples worth training on')
+    p.add_argument('data', help='new JSON export to score')
+    p.add_argument('--model', default='best_model.h5')
+    p.add_argument('--budget', type=int, help='number of samples to keep')
+    p.add_argument('--fraction', type=float, default=0.3,
+                   help='share of samples to keep when no budget is given')
+    p.add_argument('--output', help='subset export (default: <data>_selected.json)')
+    p.set_defaults(func=cmd_select)
+
+    p = commands.add_parser('score', help='score stroke order and shape of drawn characters')
+    p.add_argument('submissions', help='JSON list of {"character", "strokes": [[[x, y], ...]]}')
+    p.add_argument('--output', help='write the scores to a JSON file')
+    p.set_defaults(func=cmd_score)
+
+    p = commands.add_parser('recognize', help='rank stroke templates for unlabeled drawings')
+    p.add_argument('drawings', help='JSON list of {"strokes": [[[x, y], ...]]}')
+    p.add_argument('--top', type=int, default=5, help='matches to print per drawing')
+    p.add_argument('--no-prune', action='store_true',
+                   help='score every template instead of the stroke-count/aspect candidates')
+    p.set_defaults(func=cmd_recognize)
+
+    p = commands.add_parser('rescore', help='score the drawings in a Realtime Database export')
+    p.add_argument('export', help='RTDB JSON export (users/{uid}/characterProgress/...)')
+    p.add_argument('--model', default='japanese_character_model.bundle',
+                   help='model bundle, or a .tflite model with --labels')
+    p.add_argument('--labels', default='japanese_character_labels.txt')
+    p.add_argument('--root', default='users',
+                   help="top-level key holding the users ('' for an export of that node)")
+    p.add_argument('--workers', type=int, default=1)
+    p.add_argument('--batch-size', type=int, default=256)
+    p.add_argument('--output', default='rtdb_scores')
+    p.add_argument('--restart', action='store_true', help='ignore the checkpoint')
+    p.set_defaults(func=cmd_rescore)
+
+    p = commands.add_parser('pipeline', help='run stages, skipping those already up to date')
+    p.add_argument('stages', nargs='*', help='stages to bring up to date (default: all)')
+    p.add_argument('--data', default=DEFAULT_DATA)
+    p.add_argument('--epochs', type=int, default=50)
+    p.add_argument('--batch-size', type=int, default=16)
+    p.add_argument('--force', action='append', default=[], metavar='STAGE',
+                   help='re-run a stage even if it is cached (repeatable)')
+    p.set_defaults(func=cmd_pipeline)
+
+    p = commands.add_parser('bench', help='run benchmarks against the stored baseline')
+    p.add_argument('names', nargs='*', help='benchmarks to run (default: all)')
+    p.add_argument('--model', help='TFLite model for the latency benchmark '
+                                   '(default: convert the fixture model)')
+    p.add_argument('--baseline', default='benchmark_baseline.json')
+    p.add_argument('--threshold', type=float, default=0.2,
+                   help='allowed slowdown as a fraction of the baseline')
+    p.add_argument('--save-baseline', action='store_true')
+    p.add_argument('--output', help='also write this run to a JSON file')
+    p.add_argument('--repeats', type=int)
+    p.set_defaults(func=cmd_bench)
+
+    return parser
+
+
+def main(argv=None):
+    """Parse arguments and run the chosen subcommand"""
+    args = build_parser().parse_args(argv)
+    from contextlib import ExitStack
+    from profiling import cprofile, profiler, tensorflow_trace
+
+    start = time.perf_counter()
+    with ExitStack() as hooks:
+        if args.cprofile:
+            hooks.enter_context(cprofile(args.cprofile))
+        if args.tf_profile:
+            hooks.enter_context(tensorflow_trace(args.tf_profile))
+        with profiler.stage(args.command, category='command'):
+            args.func(args)
+    print(f"{args.command} finished in {time.perf_counter() - start:.1f}s")
+
+    profiler.print_summary()
+    if args.trace:
+        profiler.write_trace(args.trace)
+
+
+if __name__ == "__main__":
+    main()
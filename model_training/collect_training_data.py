@@ -12,41 +12,41 @@ from PIL import Image, ImageDraw, ImageFont
 import base64
 import io
 import random
+import time
 from datetime import datetime
 
+from characters import HIRAGANA, HIRAGANA_STROKE_COUNTS
+from profiling import profiler
+
 class DataCollector:
     def __init__(self):
         self.input_size = 64
-        self.characters = [
-    'あ', 'い', 'う', 'え', 'お',
-    'か', 'き', 'く', 'け', 'こ',
-    'さ', 'し', 'す', 'せ', 'そ',
-    'た', 'ち', 'つ', 'て', 'と',
-    'な', 'に', 'ぬ', 'ね', 'の',
-    'は', 'ひ', 'ふ', 'へ', 'ほ',
-    'ま', 'み', 'む', 'め', 'も',
-    'や', 'ゆ', 'よ',
-    'ら', 'り', 'る', 'れ', 'ろ',
-            'わ', 'を', 'ん'
-        ]
+        self.characters = list(HIRAGANA)
     
     def generate_synthetic_data(self, num_samples_per_char=50):
         """Generate synthetic training data"""
         print("Generating synthetic training data...")
         
         training_data = []
+        render_seconds = encode_seconds = 0.0
+        start = time.perf_counter()
+        cpu_start = time.process_time()
         
         for char in self.characters:
             print(f"Generating data for character: {char}")
             
             for i in range(num_samples_per_char):
                 # Create image with character
+                t0 = time.perf_counter()
                 img = self.create_character_image(char, variation=i)
+                t1 = time.perf_counter()
                 
                 # Convert to base64
                 img_bytes = io.BytesIO()
                 img.save(img_bytes, format='PNG')
                 img_base64 = base64.b64encode(img_bytes.getvalue()).decode('utf-8')
+                render_seconds += t1 - t0
+                encode_seconds += time.perf_counter() - t1
                 
                 # Create training entry
                 entry = {
@@ -61,6 +61,10 @@ class DataCollector:
                 
                 training_data.append(entry)
         
+        profiler.add('generate', time.perf_counter() - start, time.process_time() - cpu_start,
+                     len(training_data), start=start, category='data')
+        profiler.add('render', render_seconds, items=len(training_data), category='data')
+        profiler.add('png_encode', encode_seconds, items=len(training_data), category='data')
         return training_data
     
     def create_character_image(self, character, variation=0):
@@ -163,19 +167,7 @@ class DataCollector:
     
     def get_stroke_count(self, character):
         """Get stroke count for character (simplified)"""
-        stroke_counts = {
-            'あ': 3, 'い': 2, 'う': 2, 'え': 2, 'お': 3,
-            'か': 3, 'き': 3, 'く': 2, 'け': 3, 'こ': 2,
-            'さ': 3, 'し': 1, 'す': 2, 'せ': 3, 'そ': 2,
-            'た': 4, 'ち': 2, 'つ': 1, 'て': 1, 'と': 2,
-            'な': 4, 'に': 3, 'ぬ': 2, 'ね': 2, 'の': 1,
-            'は': 3, 'ひ': 1, 'ふ': 4, 'へ': 1, 'ほ': 4,
-            'ま': 3, 'み': 2, 'む': 3, 'め': 2, 'も': 3,
-            'や': 3, 'ゆ': 2, 'よ': 2,
-            'ら': 2, 'り': 2, 'る': 1, 'れ': 2, 'ろ': 1,
-            'わ': 2, 'を': 3, 'ん': 1,
-        }
-        return stroke_counts.get(character, 2)
+        return HIRAGANA_STROKE_COUNTS.get(character, 2)
     
     def load_existing_data(self, file_path):
         """Load existing training data"""
@@ -200,38 +192,45 @@ class DataCollector:
             'data': data
         }
         
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(output_data, f, ensure_ascii=False, indent=2)
+        with profiler.stage('json_write', len(data), 'data'):
+            with open(file_path, 'w', encoding='utf-8') as f:
+                json.dump(output_data, f, ensure_ascii=False, indent=2)
         
         print(f"Training data saved to {file_path}")
         print(f"Total samples: {len(data)}")
         print(f"Characters: {len(metadata['characters'])}")
 
-def main():
-    """Main data collection function"""
-        print("Japanese Character Data Collection")
-        print("=" * 40)
-    
+def generate_training_data(data_path='training_data_export.json', target_samples=1000):
+    """Top up an export file with synthetic samples until it holds target_samples"""
     collector = DataCollector()
     
     # Load existing data
-    existing_data = collector.load_existing_data('training_data_export.json')
+    existing_data = collector.load_existing_data(data_path)
     existing_samples = len(existing_data['data'])
     
     print(f"Existing samples: {existing_samples}")
     
     # Generate synthetic data
-    if existing_samples < 1000:  # Generate more data if we don't have enough
-        num_samples_per_char = max(20, (1000 - existing_samples) // len(collector.characters))
+    if existing_samples < target_samples:  # Generate more data if we don't have enough
+        num_samples_per_char = max(20, (target_samples - existing_samples) // len(collector.characters))
         synthetic_data = collector.generate_synthetic_data(num_samples_per_char)
         
         # Combine with existing data
         all_data = existing_data['data'] + synthetic_data
         
         # Save combined data
-        collector.save_training_data(all_data, 'training_data_export.json')
+        collector.save_training_data(all_data, data_path)
     else:
         print("Sufficient training data already available!")
+    
+    return data_path
+
+def main():
+    """Main data collection function"""
+    print("Japanese Character Data Collection")
+    print("=" * 40)
+    
+    generate_training_data()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
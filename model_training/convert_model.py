@@ -22,7 +22,7 @@ def convert_model_to_flutter():
         print("❌ Model file not found. Training model first...")
         # Train a quick model
         from simple_train import SimpleJapaneseRecognizer
-        recognizer = SimpleJapaneseRecognizer()
+        recognizer = SimpleJapaneseRecognizer(n_jobs=-1)
         X, y = recognizer.generate_simple_data(num_samples_per_char=50)
         recognizer.train_model(X, y)
         recognizer.save_model()
@@ -30,6 +30,13 @@ def convert_model_to_flutter():
         with open('simple_japanese_model.pkl', 'rb') as f:
             model = pickle.load(f)
     
+    # The JSON schema describes trees of a forest; boosted models have none
+    if not isinstance(model, RandomForestClassifier):
+        print(f"❌ simple_japanese_model.pkl holds a {type(model).__name__}; only "
+              "RandomForestClassifier models can be exported for Flutter. Retrain with "
+              "SimpleJapaneseRecognizer('random_forest').")
+        return None
+    
     # Extract model information
     model_info = {
         'model_type': 'RandomForestClassifier',
@@ -156,5 +163,7 @@ class JapaneseModelPredictor {
 if __name__ == "__main__":
     print("🔄 Converting Python model to Flutter format...")
     model_info = convert_model_to_flutter()
+    if model_info is None:
+        raise SystemExit(1)
     create_flutter_integration()
     print("🎉 Conversion complete! Copy the JSON file to your Flutter assets folder.")
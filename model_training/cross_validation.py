@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Parallel K-Fold Cross-Validation for Small Training Exports
+Trains one model per fold in worker processes that share a memory-mapped
+dataset, then reports mean and spread of accuracy per character
+"""
+
+import os
+import json
+import time
+from concurrent.futures import as_completed
+
+import numpy as np
+from sklearn.model_selection import StratifiedKFold
+
+from parallel_workers import create_pool, open_shared_arrays, share_arrays
+
+
+def assign_folds(labels, k=5, seed=42):
+    """Stratified fold id for every sample"""
+    folds = np.empty(len(labels), dtype=np.int8)
+    splitter = StratifiedKFold(n_splits=k, shuffle=True, random_state=seed)
+    for fold, (_, test_idx) in enumerate(splitter.split(np.zeros(len(labels)), labels)):
+        folds[test_idx] = fold
+    return folds
+
+
+def run_fold(fold, data_dir, epochs=30, batch_size=32, model_config=None):
+    """Train on every other fold and evaluate on this one (worker side)"""
+    from parallel_workers import configure_tensorflow_threads
+    threads = configure_tensorflow_threads()
+
+    from train_japanese_model import JapaneseCharacterTrainer
+    from data_pipeline import ClassBalancedSequence, UInt8BatchSequence
+    from evaluation import StreamingEvaluator
+
+    data = open_shared_arrays(data_dir, ['images', 'labels', 'folds'])
+    X, y, folds = data['images'], data['labels'], data['folds']
+    train_idx = np.flatnonzero(folds != fold)
+    test_idx = np.flatnonzero(folds == fold)
+
+    trainer = JapaneseCharacterTrainer()
+    model = trainer.create_model(**(model_config or {}))
+
+    start = time.perf_counter()
+    model.fit(
+        ClassBalancedSequence(X, y, train_idx, batch_size=batch_size,
+                              augmenter=trainer.create_augmenter(), seed=fold,
+                              verbose=False),
+        epochs=epochs,
+        verbose=0
+    )
+    train_seconds = time.perf_counter() - start
+
+    test_batches = UInt8BatchSequence(X, y, test_idx, batch_size=256)
+    evaluator = StreamingEvaluator(trainer.num_classes)
+    evaluator.evaluate(model.predict_on_batch,
+                       (test_batches[i] for i in range(len(test_batches))))
+
+    support = evaluator.confusion.sum(axis=1)
+    recall = np.divide(np.diag(evaluator.confusion), support,
+                       out=np.full(trainer.num_classes, np.nan), where=support > 0)
+
+    return {
+        'fold': fold,
+        'accuracy': evaluator.accuracy(),
+        # None (not NaN) for classes absent from this fold, so results stay valid JSON
+        'recall': [None if np.isnan(r) else float(r) for r in recall],
+        'support': support.tolist(),
+        'train_samples': int(len(train_idx)),
+        'test_samples': int(len(test_idx)),
+        'train_seconds': train_seconds,
+        'threads': threads,
+    }
+
+
+def aggregate_folds(fold_results, index_to_character):
+    """Mean and standard deviation of accuracy and per-class recall across folds"""
+    accuracy = np.array([r['accuracy'] for r in fold_results])
+    recall = np.array([r['recall'] for r in fold_results], dtype=np.float64)
+    support = np.array([r['support'] for r in fold_results]).sum(axis=0)
+
+    # Classes missing from a fold's test split are NaN and left out for that fold
+    observed = ~np.isnan(recall)
+    counts = np.maximum(observed.sum(axis=0), 1)
+    filled = np.where(observed, recall, 0.0)
+    recall_mean = filled.sum(axis=0) / counts
+    recall_std = np.sqrt((((filled - recall_mean) ** 2) * observed).sum(axis=0) / counts)
+
+    return {
+        'folds': len(fold_results),
+        'accuracy_mean': float(accuracy.mean()),
+        'accuracy_std': float(accuracy.std()),
+        'per_class': {
+            index_to_character[i]: {
+                'recall_mean': float(recall_mean[i]),
+                'recall_std': float(recall_std[i]),
+                'support': int(support[i]),
+            }
+            for i in np.flatnonzero(support)
+        },
+        'fold_results': fold_results,
+    }
+
+
+def print_summary(summary):
+    """Print cross-validation results"""
+    print(f"\n{summary['folds']}-fold accuracy: "
+          f"{summary['accuracy_mean']:.4f} ± {summary['accuracy_std']:.4f}")
+    print(f"{'char':>6} {'recall':>8} {'± std':>8} {'support':>8}")
+    ranked = sorted(summary['per_class'].items(), key=lambda item: item[1]['recall_mean'])
+    for character, stats in ranked:
+        print(f"{character:>6} {stats['recall_mean']:>8.3f} "
+              f"{stats['recall_std']:>8.3f} {stats['support']:>8}")
+
+
+def cross_validate(data_path='training_data_export.json', output_dir='cv_runs',
+                   k=5, num_workers=None, epochs=30, batch_size=32, model_config=None):
+    """Run k-fold cross-validation with folds trained in parallel"""
+    from train_japanese_model import JapaneseCharacterTrainer
+
+    trainer = JapaneseCharacterTrainer()
+    X, y = trainer.load_training_data(data_path)
+    folds = assign_folds(y, k)
+
+    # Workers memory-map one copy of the dataset instead of receiving pickles
+    data_dir = share_arrays(os.path.join(output_dir, 'data'), images=X, labels=y, folds=folds)
+
+    start = time.perf_counter()
+    fold_results = []
+    with create_pool(num_workers or k) as pool:
+        futures = [pool.submit(run_fold, fold, data_dir, epochs, batch_size, model_config)
+                   for fold in range(k)]
+        for future in as_completed(futures):
+            result = future.result()
+            fold_results.append(result)
+            print(f"   fold {result['fold']}: accuracy {result['accuracy']:.4f} "
+                  f"on {result['test_samples']} samples "
+                  f"({result['train_seconds']:.0f}s on {result['threads']} threads)")
+    print(f"Cross-validation finished in {(time.perf_counter() - start) / 60:.1f} minutes")
+
+    fold_results.sort(key=lambda r: r['fold'])
+    summary = aggregate_folds(fold_results, trainer.index_to_character)
+    print_summary(summary)
+
+    results_path = os.path.join(output_dir, 'cv_results.json')
+    with open(results_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    print(f"Results saved to {results_path}")
+    return summary
+
+
+def main():
+    """Main cross-validation function"""
+    print("Japanese Character Model Cross-Validation")
+    print("=" * 50)
+
+    if not os.path.exists('training_data_export.json'):
+        print("Training data file training_data_export.json not found!")
+        print("Please export training data from the Flutter app first.")
+        return
+
+    cross_validate()
+
+
+if __name__ == "__main__":
+    main()
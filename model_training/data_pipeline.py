@@ -0,0 +1,522 @@
+#!/usr/bin/env python3
+"""
+Training Data Pipeline
+Keeps datasets as uint8 and converts to float32 one batch at a time
+"""
+
+import math
+import time
+
+import numpy as np
+from tensorflow import keras
+from sklearn.model_selection import train_test_split
+
+from profiling import peak_memory_mb, profiler
+
+
+def report_memory(stage, images=None):
+    """Print peak memory and the dataset footprint at a pipeline stage"""
+    peak = peak_memory_mb()
+    line = f"[memory] {stage}: peak RSS {peak:.1f} MB" if peak is not None else f"[memory] {stage}:"
+    if images is not None:
+        line += (f", dataset {images.nbytes / 2**20:.1f} MB as {images.dtype}"
+                 f" (float64 copy would be {images.size * 8 / 2**20:.1f} MB)")
+    print(line)
+
+
+def split_indices(labels, test_size=0.2, random_state=42, stratify=True, indices=None):
+    """Split sample indices (all, or a given subset) instead of copying the image arrays"""
+    indices = np.arange(len(labels)) if indices is None else np.asarray(indices)
+    train_idx, val_idx = train_test_split(
+        indices, test_size=test_size, random_state=random_state,
+        stratify=labels[indices] if stratify else None
+    )
+    # Sorted indices keep batch reads local, which matters for memory-mapped data
+    return np.sort(train_idx), np.sort(val_idx)
+
+
+def to_float_batch(images):
+    """Convert a uint8 batch to float32 in 0-1 with a channel axis"""
+    batch = images.astype(np.float32)
+    batch *= 1.0 / 255.0
+    if batch.ndim == 3:
+        batch = batch[..., None]
+    return batch
+
+
+class UInt8BatchSequence(keras.utils.Sequence):
+    """Batches drawn from uint8 storage by index, converted per batch"""
+
+    def __init__(self, images, labels, indices=None, batch_size=32,
+                 augmenter=None, shuffle=False, seed=42):
+        super().__init__()
+        self.images = images
+        self.labels = labels
+        self.indices = np.arange(len(labels)) if indices is None else np.asarray(indices)
+        self.batch_size = batch_size
+        self.augmenter = augmenter
+        self.shuffle = shuffle
+        self.rng = np.random.default_rng(seed)
+        self.order = self.indices.copy()
+        if shuffle:
+            self.rng.shuffle(self.order)
+        # Per-batch timings are summed here and handed to the profiler once per
+        # pass over the batches: stage name -> [wall, cpu, items]
+        self._timings = {}
+        self._pending_batches = 0
+
+    def __len__(self):
+        return math.ceil(len(self.order) / self.batch_size)
+
+    def _time(self, name, wall, cpu, items):
+        total = self._timings.setdefault(name, [0.0, 0.0, 0])
+        total[0] += wall
+        total[1] += cpu
+        total[2] += items
+
+    def flush_timings(self):
+        """Record the accumulated batch_load/augment timings in the profiler"""
+        for name, (wall, cpu, items) in self._timings.items():
+            profiler.add(name, wall, cpu, items, category='data')
+        self._timings = {}
+        self._pending_batches = 0
+
+    def __getitem__(self, index):
+        batch = self.order[index * self.batch_size:(index + 1) * self.batch_size]
+        start, cpu_start = time.perf_counter(), time.process_time()
+        x = to_float_batch(self.images[batch])
+        loaded, cpu_loaded = time.perf_counter(), time.process_time()
+        self._time('batch_load', loaded - start, cpu_loaded - cpu_start, len(batch))
+        if self.augmenter is not None:
+            for i in range(len(x)):
+                x[i] = self.augmenter.random_transform(x[i])
+            self._time('augment', time.perf_counter() - loaded,
+                       time.process_time() - cpu_loaded, len(batch))
+        # Sequences read outside fit() (evaluation) never get on_epoch_end
+        self._pending_batches += 1
+        if self._pending_batches >= len(self):
+            self.flush_timings()
+        return x, self.labels[batch]
+
+    def on_epoch_end(self):
+        self.flush_timings()
+        if self.shuffle:
+            self.rng.shuffle(self.order)
+
+
+class ClassBalancedSequence(UInt8BatchSequence):
+    """Streams class-balanced batches from a skewed dataset
+
+    Per-class index tables are built once. Each epoch draws classes with
+    probability proportional to count ** (1 - balance): balance=1 gives every
+    class the same share, balance=0 keeps the natural distribution. Rare
+    classes are oversampled with replacement and rely on augmentation for
+    variety instead of synthetic copies in the dataset.
+    """
+
+    def __init__(self, images, labels, indices=None, batch_size=32,
+                 augmenter=None, balance=1.0, steps_per_epoch=None,
+                 class_names=None, seed=42, verbose=True):
+        super().__init__(images, labels, indices, batch_size, augmenter,
+                         shuffle=False, seed=seed)
+        self.class_names = class_names
+        self.verbose = verbose
+        self.steps_per_epoch = steps_per_epoch or max(1, len(self.indices) // batch_size)
+
+        # CSR-style table: indices grouped by class, with per-class offsets
+        sample_labels = self.labels[self.indices]
+        self.classes, self.class_counts = np.unique(sample_labels, return_counts=True)
+        grouped = np.argsort(sample_labels, kind='stable')
+        self.class_table = self.indices[grouped]
+        self.class_starts = np.concatenate(([0], np.cumsum(self.class_counts)[:-1]))
+
+        weights = self.class_counts.astype(np.float64) ** (1.0 - balance)
+        self.class_probs = weights / weights.sum()
+
+        self.epoch_compositions = []
+        self._draw_epoch()
+
+    def _draw_epoch(self):
+        """Draw the whole epoch's sample order in one vectorized pass"""
+        total = self.steps_per_epoch * self.batch_size
+        drawn = self.rng.choice(len(self.classes), size=total, p=self.class_probs)
+        offsets = (self.rng.random(total) * self.class_counts[drawn]).astype(np.int64)
+        self.order = self.class_table[self.class_starts[drawn] + offsets]
+        self.composition = np.bincount(drawn, minlength=len(self.classes))
+
+    def __len__(self):
+        return self.steps_per_epoch
+
+    def composition_report(self):
+        """Samples drawn per class this epoch next to the available samples"""
+        report = {}
+        for i, label in enumerate(self.classes):
+            name = self.class_names[int(label)] if self.class_names else int(label)
+            report[name] = {
+                'drawn': int(self.composition[i]),
+                'available': int(self.class_counts[i]),
+            }
+        return report
+
+    def print_composition(self):
+        """Print a short summary of the current epoch composition"""
+        drawn = self.composition
+        rarest = int(np.argmin(self.class_counts))
+        name = self.class_names[int(self.classes[rarest])] if self.class_names else int(self.classes[rarest])
+        print(f"Epoch composition: {len(self.classes)} classes, "
+              f"{drawn.min()}-{drawn.max()} samples per class "
+              f"(available {self.class_counts.min()}-{self.class_counts.max()}); "
+              f"rarest class {name}: {drawn[rarest]} drawn from {self.class_counts[rarest]}")
+
+    def on_epoch_end(self):
+        self.flush_timings()
+        if self.verbose:
+            self.print_composition()
+        self.epoch_compositions.append(self.composition_report())
+        self._draw_epoch()
+
+
+class PKBatchSequence(ClassBalancedSequence):
+    """Batches of P classes with K samples each, for metric-learning losses
+
+    Every anchor then has K - 1 positives and (P - 1) * K negatives in its
+    batch, which batch-hard triplet mining needs. Classes are drawn without
+    replacement within a batch; samples within a class with replacement.
+    """
+
+    def __init__(self, images, labels, indices=None, classes_per_batch=16,
+                 samples_per_class=4, augmenter=None, steps_per_epoch=None,
+                 class_names=None, seed=42, verbose=True):
+        self.classes_per_batch = classes_per_batch
+        self.samples_per_class = samples_per_class
+        super().__init__(images, labels, indices, classes_per_batch * samples_per_class,
+                         augmenter, balance=1.0, steps_per_epoch=steps_per_epoch,
+                         class_names=class_names, seed=seed, verbose=verbose)
+
+    def _draw_epoch(self):
+        """Draw every batch's P classes and K offsets per class in one pass"""
+        p = min(self.classes_per_batch, len(self.classes))
+        k = self.samples_per_class
+        steps = self.steps_per_epoch
+        # argsort of random keys = P distinct classes per batch without a Python loop
+        keys = self.rng.random((steps, len(self.classes)))
+        drawn = np.argsort(keys, axis=1)[:, :p]
+        drawn = np.repeat(drawn, k, axis=1).reshape(-1)
+        offsets = (self.rng.random(len(drawn)) * self.class_counts[drawn]).astype(np.int64)
+        self.order = self.class_table[self.class_starts[drawn] + offsets]
+        self.batch_size = p * k
+        self.composition = np.bincount(drawn, minlength=len(self.classes))
+
+
+class SumTree:
+    """Binary tree of priorities: batched O(log n) updates and proportional sampling
+
+    Leaves hold per-sample priorities and every inner node the sum of its
+    children, so drawing a sample proportional to its priority is one walk
+    from the root. Both operations work on whole arrays of leaves at once.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.size = 1 << max(0, (capacity - 1).bit_length())
+        self.tree = np.zeros(2 * self.size, dtype=np.float64)
+
+    def total(self):
+        return float(self.tree[1])
+
+    def priorities(self):
+        return self.tree[self.size:self.size + self.capacity]
+
+    def update(self, leaves, priorities):
+        """Set the priorities of many leaves and refresh their ancestors level by level"""
+        nodes = np.asarray(leaves, dtype=np.int64) + self.size
+        self.tree[nodes] = priorities
+        nodes = np.unique(nodes // 2)
+        while len(nodes) and nodes[-1] >= 1:
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+            if nodes[-1] == 1:
+                break
+            nodes = np.unique(nodes // 2)
+
+    def sample(self, count, rng):
+        """Leaf indices drawn with probability proportional to priority"""
+        targets = rng.random(count) * self.total()
+        nodes = np.ones(count, dtype=np.int64)
+        while nodes[0] < self.size:
+            left = 2 * nodes
+            # Never step into an empty subtree because of rounding
+            go_right = (targets >= self.tree[left]) & (self.tree[left + 1] > 0)
+            targets = np.where(go_right, targets - self.tree[left], targets)
+            nodes = np.where(go_right, left + 1, left)
+        return nodes - self.size
+
+
+class ConfusionTracker:
+    """Exponential moving average of per-class and per-pair error rates"""
+
+    def __init__(self, num_classes, decay=0.5):
+        self.num_classes = num_classes
+        self.decay = decay
+        # rates[a, b]: share of class a samples predicted as b (b != a)
+        self.rates = np.zeros((num_classes, num_classes), dtype=np.float64)
+
+    def update(self, labels, predicted):
+        confusion = np.bincount(
+            np.asarray(labels, dtype=np.int64) * self.num_classes + predicted,
+            minlength=self.num_classes * self.num_classes
+        ).reshape(self.num_classes, self.num_classes).astype(np.float64)
+        self.update_from_confusion(confusion)
+
+    def update_from_confusion(self, confusion):
+        """Blend in a confusion matrix (rows = true class), e.g. from evaluate_model"""
+        confusion = np.asarray(confusion, dtype=np.float64)
+        totals = confusion.sum(axis=1, keepdims=True)
+        seen = totals[:, 0] > 0
+        rates = confusion / np.maximum(totals, 1.0)
+        np.fill_diagonal(rates, 0.0)
+        self.rates[seen] = self.decay * self.rates[seen] + (1.0 - self.decay) * rates[seen]
+
+    def class_errors(self):
+        return self.rates.sum(axis=1)
+
+    def pair_errors(self):
+        """Symmetric confusion between each pair of classes"""
+        return self.rates + self.rates.T
+
+    def partners(self):
+        """Most confused other class for every class (-1 when it is never confused)"""
+        pairs = self.pair_errors()
+        best = pairs.argmax(axis=1)
+        return np.where(pairs.max(axis=1) > 0, best, -1)
+
+    def top_pairs(self, limit=5, class_names=None):
+        pairs = np.triu(self.pair_errors(), 1)
+        order = np.argsort(-pairs, axis=None)[:limit]
+        result = []
+        for a, b in zip(*np.unravel_index(order, pairs.shape)):
+            if pairs[a, b] <= 0:
+                break
+            names = (class_names[int(a)], class_names[int(b)]) if class_names else (int(a), int(b))
+            result.append((names, float(pairs[a, b])))
+        return result
+
+
+class HardExampleSequence(ClassBalancedSequence):
+    """Online hard-example mining over class-balanced batches
+
+    After every epoch the model scores the training samples (un-augmented,
+    large inference batches) and their losses go into a SumTree. The next
+    epoch mixes a class-balanced share with samples drawn by priority, where
+    priority = loss ** alpha * (1 + pair_bias * class error rate). Half of
+    the hard draws bring a sample of the class they are most confused with
+    into the same batch, so pairs like ぬ/め are seen side by side.
+    """
+
+    def __init__(self, images, labels, indices=None, batch_size=32, augmenter=None,
+                 num_classes=None, hard_fraction=0.5, alpha=0.6, pair_bias=4.0,
+                 refresh_limit=20000, confusion=None, class_names=None, seed=42,
+                 verbose=True):
+        self.num_classes = num_classes or int(np.max(labels)) + 1
+        self.hard_fraction = hard_fraction
+        self.alpha = alpha
+        self.pair_bias = pair_bias
+        self.refresh_limit = refresh_limit
+        self.tracker = ConfusionTracker(self.num_classes)
+        if confusion is not None:
+            self.tracker.update_from_confusion(confusion)
+        self.tree = None
+        # Set by mining_callback(): the callback then draws each new epoch
+        self.mining = False
+        super().__init__(images, labels, indices, batch_size, augmenter, balance=1.0,
+                         class_names=class_names, seed=seed, verbose=verbose)
+
+    def _draw_epoch(self):
+        super()._draw_epoch()
+        if self.tree is None or self.tree.total() <= 0:
+            return
+
+        total = len(self.order)
+        hard = int(total * self.hard_fraction)
+        # A pair fills two neighbouring slots of one batch
+        cells_per_batch = self.batch_size // 2
+        pairs = min(hard // 2, (total // self.batch_size) * cells_per_batch)
+        drawn = self.indices[self.tree.sample(hard - pairs, self.rng)]
+        # Partners: a random sample of the class each hard draw is most confused with
+        partner_classes = self.tracker.partners()[self.labels[drawn[:pairs]]]
+        class_rows = np.searchsorted(self.classes, partner_classes)
+        known = (partner_classes >= 0) & (class_rows < len(self.classes))
+        class_rows = np.where(known, np.minimum(class_rows, len(self.classes) - 1), 0)
+        known &= self.classes[class_rows] == partner_classes
+        offsets = (self.rng.random(pairs) * self.class_counts[class_rows]).astype(np.int64)
+        partners = np.where(known, self.class_table[self.class_starts[class_rows] + offsets],
+                            drawn[:pairs])
+
+        # Hard samples and their partners go into the same batch; the rest of
+        # the hard draws replace random slots
+        batch, cell = np.divmod(self.rng.choice((total // self.batch_size) * cells_per_batch,
+                                                size=pairs, replace=False), cells_per_batch)
+        first = batch * self.batch_size + 2 * cell
+        pair_slots = np.stack([first, first + 1], axis=1).reshape(-1)
+        self.order[pair_slots] = np.stack([drawn[:pairs], partners], axis=1).reshape(-1)
+        free = np.setdiff1d(np.arange(total), pair_slots)
+        self.order[self.rng.choice(free, size=len(drawn) - pairs, replace=False)] = drawn[pairs:]
+        self.composition = np.bincount(np.searchsorted(self.classes, self.labels[self.order]),
+                                       minlength=len(self.classes))
+
+    def refresh(self, model, batch_size=256):
+        """Re-score training samples with the model and update priorities and pair stats"""
+        positions = np.arange(len(self.indices))
+        if len(positions) > self.refresh_limit:
+            positions = np.sort(self.rng.choice(positions, self.refresh_limit, replace=False))
+        samples = self.indices[positions]
+
+        losses = np.zeros(len(samples))
+        predicted = np.zeros(len(samples), dtype=np.int64)
+        with profiler.stage('hard_mining', len(samples), 'train'):
+            for start in range(0, len(samples), batch_size):
+                batch = samples[start:start + batch_size]
+                probabilities = np.asarray(model.predict_on_batch(to_float_batch(self.images[batch])))
+                label_probability = probabilities[np.arange(len(batch)), self.labels[batch]]
+                losses[start:start + len(batch)] = -np.log(np.maximum(label_probability, 1e-7))
+                predicted[start:start + len(batch)] = probabilities.argmax(axis=1)
+
+            self.tracker.update(self.labels[samples], predicted)
+            class_bias = 1.0 + self.pair_bias * self.tracker.class_errors()
+            if self.tree is None:
+                self.tree = SumTree(len(self.indices))
+                # Samples not scored yet start at the mean priority
+                self.tree.update(np.arange(len(self.indices)), 1.0)
+            priorities = (losses + 1e-3) ** self.alpha * class_bias[self.labels[samples]]
+            self.tree.update(positions, priorities)
+
+    def on_epoch_end(self):
+        if not self.mining:
+            super().on_epoch_end()
+            return
+        # Keras 2 runs this after the callbacks and Keras 3 before them, so
+        # the mining callback redraws once the priorities are refreshed
+        self.flush_timings()
+
+    def next_epoch(self, model):
+        """Refresh the priorities with the model, then record and redraw the epoch"""
+        self.refresh(model)
+        super().on_epoch_end()
+
+    def print_mining(self):
+        pairs = self.tracker.top_pairs(5, self.class_names)
+        if pairs:
+            print("Hard mining, most confused pairs: " + ', '.join(
+                f"{a}/{b} {rate:.2f}" for (a, b), rate in pairs))
+
+    def mining_callback(self):
+        """The callback that re-scores samples and draws the next epoch"""
+        self.mining = True
+        return HardExampleMiningCallback(self)
+
+
+class StageTimingCallback(keras.callbacks.Callback):
+    """Records epoch and train-step timings in the shared profiler"""
+
+    def __init__(self, batch_size=None):
+        super().__init__()
+        self.batch_size = batch_size
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch_start = time.perf_counter()
+        self._epoch_cpu = time.process_time()
+
+    def on_epoch_end(self, epoch, logs=None):
+        profiler.add('epoch', time.perf_counter() - self._epoch_start,
+                     time.process_time() - self._epoch_cpu, start=self._epoch_start,
+                     category='train')
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self._step_start = time.perf_counter()
+        self._step_cpu = time.process_time()
+
+    def on_train_batch_end(self, batch, logs=None):
+        profiler.add('train_step', time.perf_counter() - self._step_start,
+                     time.process_time() - self._step_cpu, self.batch_size,
+                     start=self._step_start, category='train')
+
+
+class MetricsLoggingCallback(keras.callbacks.Callback):
+    """Streams batch and epoch metrics to a MetricsSink while fit() runs
+
+    Every `batch_interval` train batches and every epoch a record with loss,
+    accuracy, learning rate, step time and samples/sec is appended; the
+    optional BackgroundPlotter is asked to redraw after each epoch.
+    """
+
+    def __init__(self, sink, batch_size, batch_interval=1, plotter=None):
+        super().__init__()
+        self.sink = sink
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.plotter = plotter
+        self.epoch = 0
+
+    def _learning_rate(self):
+        rate = self.model.optimizer.learning_rate
+        if isinstance(rate, keras.optimizers.schedules.LearningRateSchedule):
+            rate = rate(self.model.optimizer.iterations)
+        return float(keras.backend.get_value(rate))
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch = epoch
+        self._epoch_start = time.perf_counter()
+        self._epoch_steps = 0
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self._step_start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        step_time = time.perf_counter() - self._step_start
+        self._epoch_steps += 1
+        if batch % self.batch_interval:
+            return
+        logs = logs or {}
+        self.sink.write({
+            'event': 'batch',
+            'epoch': self.epoch,
+            'batch': batch,
+            'steps': self.params.get('steps'),
+            'loss': float(logs.get('loss', float('nan'))),
+            'accuracy': float(logs.get('accuracy', float('nan'))),
+            'learning_rate': self._learning_rate(),
+            'step_time': step_time,
+            'samples_per_sec': self.batch_size / step_time if step_time > 0 else None,
+        })
+
+    def on_epoch_end(self, epoch, logs=None):
+        seconds = time.perf_counter() - self._epoch_start
+        record = {'event': 'epoch', 'epoch': epoch}
+        record.update({key: float(value) for key, value in (logs or {}).items()})
+        record['learning_rate'] = self._learning_rate()
+        record['epoch_time'] = seconds
+        record['samples_per_sec'] = self._epoch_steps * self.batch_size / seconds
+        self.sink.write(record)
+        self.sink.flush()
+        if self.plotter:
+            self.plotter.request()
+
+    def on_train_end(self, logs=None):
+        self.sink.flush()
+        if self.plotter:
+            self.plotter.close()
+
+
+class HardExampleMiningCallback(keras.callbacks.Callback):
+    """Refreshes a HardExampleSequence's priorities with the current model each
+    epoch and draws the next epoch from them (the sequence's own on_epoch_end
+    leaves the redraw to this callback)
+    """
+
+    def __init__(self, sequence):
+        super().__init__()
+        self.sequence = sequence
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.sequence.next_epoch(self.model)
+        if self.sequence.verbose:
+            self.sequence.print_mining()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Data Quality Gate for Japanese Character Training Data
+Rejects blank, corrupt, clipped and mislabeled samples before training
+"""
+
+import os
+import json
+import base64
+import io
+import time
+from collections import Counter
+
+import numpy as np
+from PIL import Image
+
+from preprocessing import normalize_batch
+from profiling import profiler
+
+# Rejection reasons, in the order they are checked. A sample is reported
+# under the first reason it fails.
+REJECT_REASONS = ['decode_error', 'unknown_label', 'blank', 'all_black', 'too_small', 'clipped']
+ACCEPTED = -1
+
+
+class DataQualityGate:
+    def __init__(self, character_to_index, input_size=64,
+                 ink_threshold=128, min_ink_ratio=0.005, max_ink_ratio=0.6,
+                 min_bbox_coverage=0.02, max_edge_ink=0.02):
+        self.character_to_index = character_to_index
+        self.index_to_character = {v: k for k, v in character_to_index.items()}
+        self.num_classes = len(character_to_index)
+        self.input_size = input_size
+
+        # Pixels darker than this count as ink (white canvas, black strokes)
+        self.ink_threshold = ink_threshold
+        self.min_ink_ratio = min_ink_ratio
+        self.max_ink_ratio = max_ink_ratio
+        self.min_bbox_coverage = min_bbox_coverage
+        # Fraction of border pixels that may be inked before a sample counts as clipped
+        self.max_edge_ink = max_edge_ink
+
+    def decode_entries(self, entries):
+        """Decode export entries into an aligned uint8 image stack and label array"""
+        count = len(entries)
+        images = np.full((count, self.input_size, self.input_size), 255, dtype=np.uint8)
+        labels = np.full(count, -1, dtype=np.int32)
+        decoded = np.zeros(count, dtype=bool)
+        unknown = Counter()
+        # Per-sample costs are summed and recorded once, not per entry
+        base64_seconds = image_seconds = 0.0
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+
+        for i, entry in enumerate(entries):
+            character = entry.get('character')
+            if character in self.character_to_index:
+                labels[i] = self.character_to_index[character]
+            else:
+                unknown[character] += 1
+
+            try:
+                t0 = time.perf_counter()
+                image_data = base64.b64decode(entry['imageData'])
+                t1 = time.perf_counter()
+                image = Image.open(io.BytesIO(image_data))
+                image = image.convert('L')
+                image = image.resize((self.input_size, self.input_size))
+                images[i] = np.asarray(image, dtype=np.uint8)
+                base64_seconds += t1 - t0
+                image_seconds += time.perf_counter() - t1
+                decoded[i] = True
+            except Exception as e:
+                print(f"Error processing entry {i}: {e}")
+
+        profiler.add('decode', time.perf_counter() - start, time.process_time() - cpu_start,
+                     count, start=start, category='data')
+        profiler.add('base64_decode', base64_seconds, items=count, category='data')
+        profiler.add('pil_decode_resize', image_seconds, items=count, category='data')
+        return images, labels, decoded, unknown
+
+    def compute_metrics(self, images):
+        """Compute ink ratio, bounding-box coverage and edge ink for a whole batch"""
+        ink = images < self.ink_threshold
+        n, h, w = ink.shape
+
+        ink_ratio = ink.mean(axis=(1, 2))
+
+        # Ink bounding box from the first/last inked row and column
+        rows = ink.any(axis=2)
+        cols = ink.any(axis=1)
+        has_ink = rows.any(axis=1)
+        top = rows.argmax(axis=1)
+        bottom = h - rows[:, ::-1].argmax(axis=1)
+        left = cols.argmax(axis=1)
+        right = w - cols[:, ::-1].argmax(axis=1)
+        bbox_coverage = np.where(has_ink, (bottom - top) * (right - left) / float(h * w), 0.0)
+
+        # Ink touching the canvas border means a stroke ran off the edge
+        border = (ink[:, 0, :].sum(axis=1) + ink[:, -1, :].sum(axis=1)
+                  + ink[:, 1:-1, 0].sum(axis=1) + ink[:, 1:-1, -1].sum(axis=1))
+        edge_ink = border / float(2 * w + 2 * (h - 2))
+
+        return {
+            'ink_ratio': ink_ratio,
+            'bbox_coverage': bbox_coverage,
+            'edge_ink': edge_ink,
+        }
+
+    def validate(self, images, labels, decoded=None):
+        """Return a per-sample reason code array (ACCEPTED for clean samples)"""
+        if len(images) != len(labels):
+            raise ValueError(
+                f"Images and labels are misaligned: {len(images)} images, {len(labels)} labels"
+            )
+        if decoded is None:
+            decoded = np.ones(len(images), dtype=bool)
+
+        metrics = self.compute_metrics(images)
+
+        checks = [
+            ~decoded,
+            (labels < 0) | (labels >= self.num_classes),
+            metrics['ink_ratio'] < self.min_ink_ratio,
+            metrics['ink_ratio'] > self.max_ink_ratio,
+            metrics['bbox_coverage'] < self.min_bbox_coverage,
+            metrics['edge_ink'] > self.max_edge_ink,
+        ]
+
+        reasons = np.full(len(images), ACCEPTED, dtype=np.int8)
+        # Walk the checks backwards so the first failing reason wins
+        for code in range(len(checks) - 1, -1, -1):
+            reasons[checks[code]] = code
+
+        return reasons, metrics
+
+    def rejection_report(self, labels, reasons, unknown=None):
+        """Build per-class rejection counts"""
+        rejected = reasons != ACCEPTED
+        known = (labels >= 0) & (labels < self.num_classes)
+
+        totals = np.bincount(labels[known], minlength=self.num_classes)
+        counts = np.zeros((self.num_classes, len(REJECT_REASONS)), dtype=np.int64)
+        np.add.at(counts, (labels[known & rejected], reasons[known & rejected]), 1)
+
+        per_class = {}
+        for index in np.flatnonzero(counts.sum(axis=1)):
+            per_class[self.index_to_character[int(index)]] = {
+                'total': int(totals[index]),
+                'rejected': int(counts[index].sum()),
+                'reasons': {
+                    REJECT_REASONS[code]: int(counts[index, code])
+                    for code in np.flatnonzero(counts[index])
+                },
+            }
+
+        by_reason = np.bincount(reasons[rejected], minlength=len(REJECT_REASONS))
+
+        return {
+            'total': int(len(reasons)),
+            'accepted': int((~rejected).sum()),
+            'rejected': int(rejected.sum()),
+            'by_reason': {REJECT_REASONS[i]: int(c) for i, c in enumerate(by_reason) if c},
+            'per_class': per_class,
+            'unknown_characters': dict(unknown or {}),
+        }
+
+    def print_report(self, report):
+        """Print a rejection report"""
+        print(f"Data quality: {report['accepted']}/{report['total']} samples accepted, "
+              f"{report['rejected']} rejected")
+        for reason, count in report['by_reason'].items():
+            print(f"   {reason}: {count}")
+        for character, stats in sorted(report['per_class'].items(),
+                                       key=lambda item: -item[1]['rejected']):
+            reasons = ', '.join(f"{r}={c}" for r, c in stats['reasons'].items())
+            print(f"   {character}: {stats['rejected']}/{stats['total']} rejected ({reasons})")
+        if report['unknown_characters']:
+            print(f"   Unknown characters: {report['unknown_characters']}")
+
+    def write_clean_index(self, index_path, source_path, reasons, report):
+        """Write accepted entry indices and the rejection report to JSON"""
+        rejected = np.flatnonzero(reasons != ACCEPTED)
+        index = {
+            'source': os.path.basename(source_path),
+            'accepted': np.flatnonzero(reasons == ACCEPTED).tolist(),
+            'rejected': {str(i): REJECT_REASONS[reasons[i]] for i in rejected},
+            'report': report,
+        }
+        with open(index_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+        print(f"Clean index saved to {index_path}")
+        return index_path
+
+    def filter_export(self, data_path, index_path=None):
+        """Decode, validate and filter an exported JSON file"""
+        with profiler.stage('json_parse', category='data') as stage:
+            with open(data_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)['data']
+            stage['items'] = len(entries)
+
+        images, labels, decoded, unknown = self.decode_entries(entries)
+        with profiler.stage('quality_gate', len(images), 'data'):
+            reasons, _ = self.validate(images, labels, decoded)
+        report = self.rejection_report(labels, reasons, unknown)
+        self.print_report(report)
+
+        if index_path is None:
+            index_path = os.path.splitext(data_path)[0] + '_clean_index.json'
+        self.write_clean_index(index_path, data_path, reasons, report)
+
+        keep = reasons == ACCEPTED
+        return images[keep], labels[keep]
+
+
+def load_clean_export(data_path, character_to_index, canvas_size=128, input_size=64,
+                      normalize=True, index_path=None):
+    """Gate an exported JSON file and return normalized uint8 images and labels"""
+    gate = DataQualityGate(character_to_index, input_size=canvas_size)
+    images, labels = gate.filter_export(data_path, index_path)
+    if normalize:
+        with profiler.stage('normalize', len(images), 'data'):
+            images = normalize_batch(images, output_size=input_size)
+    elif canvas_size != input_size:
+        images = np.stack([
+            np.asarray(Image.fromarray(image).resize((input_size, input_size)))
+            for image in images
+        ]) if len(images) else images.reshape(0, input_size, input_size)
+    return images, labels
+
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Multi-Worker Data-Parallel CPU Training
+Runs JapaneseCharacterTrainer.train_distributed under
+MultiWorkerMirroredStrategy, either as several local worker processes or
+as one worker per node, and reports scaling efficiency
+
+Several nodes: on every node set
+    MYGANA_WORKERS=host1:2222,host2:2222 MYGANA_WORKER_INDEX=<0..n-1>
+and run `python distributed_training.py`. Index 0 is the chief and keeps
+the trained model.
+"""
+
+import os
+import json
+import time
+import shutil
+import socket
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from parallel_workers import core_slices, limit_threads, open_shared_arrays, share_arrays
+
+DEFAULT_SETTINGS = {
+    'epochs': 50,
+    'batch_size': 32,  # per replica
+    'learning_rate': 0.001,  # single-replica rate, scaled by the worker count
+    'model_path': 'distributed_model.h5',
+}
+
+
+def free_ports(count):
+    """Pick unused localhost ports for the worker cluster"""
+    sockets = []
+    for _ in range(count):
+        s = socket.socket()
+        s.bind(('localhost', 0))
+        sockets.append(s)
+    ports = [s.getsockname()[1] for s in sockets]
+    for s in sockets:
+        s.close()
+    return ports
+
+
+def tf_config(addresses, index):
+    """TF_CONFIG for one worker of the cluster"""
+    return json.dumps({
+        'cluster': {'worker': list(addresses)},
+        'task': {'type': 'worker', 'index': index},
+    })
+
+
+def run_worker(index, addresses, data_dir, settings, cores=None):
+    """Train as worker `index` of the cluster and return its timing"""
+    if cores:
+        limit_threads(cores)
+    os.environ['TF_CONFIG'] = tf_config(addresses, index)
+
+    import tensorflow as tf
+    from train_japanese_model import JapaneseCharacterTrainer
+
+    strategy = tf.distribute.MultiWorkerMirroredStrategy()
+    data = open_shared_arrays(data_dir, ['images', 'labels'])
+
+    trainer = JapaneseCharacterTrainer()
+    start = time.perf_counter()
+    history = trainer.train_distributed(
+        data['images'], data['labels'], strategy,
+        epochs=settings['epochs'],
+        batch_size=settings['batch_size'],
+        learning_rate=settings['learning_rate'],
+    )
+    seconds = time.perf_counter() - start
+
+    # Every worker has to take part in saving; only the chief's file is kept
+    chief = index == 0
+    save_dir = None if chief else tempfile.mkdtemp()
+    trainer.model.save(settings['model_path'] if chief else os.path.join(save_dir, 'model.h5'))
+    if save_dir:
+        shutil.rmtree(save_dir, ignore_errors=True)
+
+    epochs_run = len(history.history['loss'])
+    samples = history.samples_per_epoch * epochs_run
+    return {
+        'workers': len(addresses),
+        'index': index,
+        'epochs': epochs_run,
+        'seconds': seconds,
+        'samples': samples,
+        'samples_per_sec': samples / seconds,
+        'val_accuracy': float(history.history['val_accuracy'][-1]),
+    }
+
+
+def launch_local(num_workers, data_dir, settings=None):
+    """Run a cluster of worker processes on this machine, one core slice each"""
+    settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+    addresses = [f'localhost:{port}' for port in free_ports(num_workers)]
+    slices = core_slices(num_workers)
+
+    # All workers must run at once, so the pool is sized to the cluster
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=context) as pool:
+        futures = [
+            pool.submit(run_worker, index, addresses, data_dir, settings,
+                        slices[index % len(slices)])
+            for index in range(num_workers)
+        ]
+        results = [future.result() for future in futures]
+
+    return results[0]
+
+
+def scaling_report(data_path='training_data_export.json', output_dir='distributed_runs',
+                   worker_counts=(1, 2, 4), epochs=3, batch_size=32):
+    """Measure throughput for each worker count and the resulting efficiency"""
+    from train_japanese_model import JapaneseCharacterTrainer
+
+    trainer = JapaneseCharacterTrainer()
+    X, y = trainer.load_training_data(data_path)
+    data_dir = share_arrays(os.path.join(output_dir, 'data'), images=X, labels=y)
+
+    settings = {
+        'epochs': epochs,
+        'batch_size': batch_size,
+        'model_path': os.path.join(output_dir, 'scaling_model.h5'),
+    }
+
+    runs = []
+    for workers in worker_counts:
+        print(f"\nRunning {workers} worker(s)...")
+        runs.append(launch_local(workers, data_dir, settings))
+
+    baseline = runs[0]['samples_per_sec'] / runs[0]['workers']
+    for run in runs:
+        run['speedup'] = run['samples_per_sec'] / runs[0]['samples_per_sec']
+        run['efficiency'] = run['samples_per_sec'] / (baseline * run['workers'])
+
+    print("\nScaling efficiency:")
+    print(f"{'workers':>7} {'samples/sec':>12} {'speedup':>8} {'efficiency':>10} {'val_acc':>8}")
+    for run in runs:
+        print(f"{run['workers']:>7} {run['samples_per_sec']:>12.1f} {run['speedup']:>8.2f} "
+              f"{run['efficiency']:>10.2%} {run['val_accuracy']:>8.4f}")
+
+    report_path = os.path.join(output_dir, 'scaling_report.json')
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(runs, f, indent=2)
+    print(f"Scaling report saved to {report_path}")
+    return runs
+
+
+def main():
+    """Main distributed training function"""
+    print("Japanese Character Multi-Worker Training")
+    print("=" * 50)
+
+    data_path = 'training_data_export.json'
+    if not os.path.exists(data_path):
+        print(f"Training data file {data_path} not found!")
+        print("Please export training data from the Flutter app first.")
+        return
+
+    workers = os.environ.get('MYGANA_WORKERS')
+    if workers:
+        # One worker of a multi-node cluster
+        from train_japanese_model import JapaneseCharacterTrainer
+        addresses = workers.split(',')
+        index = int(os.environ.get('MYGANA_WORKER_INDEX', '0'))
+        X, y = JapaneseCharacterTrainer().load_training_data(data_path)
+        data_dir = share_arrays(os.path.join('distributed_runs', 'data'), images=X, labels=y)
+        result = run_worker(index, addresses, data_dir, DEFAULT_SETTINGS)
+        print(f"Worker {index} finished: {result['samples_per_sec']:.1f} samples/sec")
+    else:
+        scaling_report(data_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Embedding Training for Open-Ended Character Sets
+Trains the CNN trunk with a batch-hard triplet loss so drawings of the same
+character land close together, then stores per-character prototypes in a
+PrototypeIndex. Characters the network never saw (katakana, kanji) are added
+by embedding a few reference drawings - no retraining, no new export.
+
+    python embedding_training.py                        # train and build the index
+    python embedding_training.py add references.json    # add characters from an export
+"""
+
+import os
+import sys
+import json
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+from tensorflow.keras import layers
+
+from data_pipeline import PKBatchSequence, StageTimingCallback, split_indices, to_float_batch
+from data_quality import load_clean_export
+from prototype_index import PrototypeIndex
+from train_japanese_model import JapaneseCharacterTrainer
+
+EMBEDDING_MODEL_PATH = 'embedding_model.h5'
+EMBEDDING_TFLITE_PATH = 'embedding_model.tflite'
+INDEX_PATH = 'prototype_index.npz'
+
+
+def batch_hard_triplet_loss(margin=0.2):
+    """Triplet loss on the hardest positive and negative of each anchor in the batch
+
+    Embeddings are unit length, so distance is 1 - cosine similarity.
+    Anchors without a positive in the batch are left out of the mean.
+    """
+    def loss(y_true, embeddings):
+        labels = tf.reshape(tf.cast(y_true, tf.int32), [-1])
+        distances = 1.0 - tf.matmul(embeddings, embeddings, transpose_b=True)
+        same = tf.equal(labels[:, None], labels[None, :])
+        not_self = tf.logical_not(tf.eye(tf.shape(labels)[0], dtype=tf.bool))
+        positives = tf.logical_and(same, not_self)
+
+        hardest_positive = tf.reduce_max(tf.where(positives, distances, 0.0), axis=1)
+        # Cosine distance is at most 2, so 4 can never be the hardest negative
+        hardest_negative = tf.reduce_min(tf.where(same, 4.0, distances), axis=1)
+
+        valid = tf.cast(tf.reduce_any(positives, axis=1), embeddings.dtype)
+        scale = tf.cast(tf.size(valid), embeddings.dtype) / tf.maximum(tf.reduce_sum(valid), 1.0)
+        # Keras averages over the batch; the scale turns that into a mean over valid anchors
+        return tf.nn.relu(hardest_positive - hardest_negative + margin) * valid * scale
+    return loss
+
+
+def create_embedding_model(trainer, embedding_dim=128, learning_rate=0.001, margin=0.2,
+                           dropout=0.25, dense_dropout=0.5, width=1.0):
+    """The classifier's trunk with a unit-length embedding head instead of softmax"""
+    model = keras.Sequential(trainer.feature_layers(dropout, dense_dropout, width) + [
+        layers.Dense(embedding_dim),
+        layers.UnitNormalization(),
+    ])
+    model.compile(
+        optimizer=keras.optimizers.Adam(learning_rate=learning_rate),
+        loss=batch_hard_triplet_loss(margin)
+    )
+    return model
+
+
+def embed(model, images, batch_size=256):
+    """Embeddings for a uint8 image array, computed one batch at a time"""
+    outputs = [
+        np.asarray(model.predict_on_batch(to_float_batch(images[start:start + batch_size])))
+        for start in range(0, len(images), batch_size)
+    ]
+    return np.vstack(outputs) if outputs else np.zeros((0, model.output_shape[-1]), np.float32)
+
+
+def train_embedding(trainer, X, y, indices=None, epochs=50, classes_per_batch=16,
+                    samples_per_class=4, embedding_dim=128, margin=0.2, learning_rate=0.001):
+    """Train the embedding model on P x K batches"""
+    model = create_embedding_model(trainer, embedding_dim, learning_rate, margin)
+    model.summary()
+
+    batches = PKBatchSequence(
+        X, y, indices, classes_per_batch=classes_per_batch,
+        samples_per_class=samples_per_class, augmenter=trainer.create_augmenter(),
+        class_names=trainer.index_to_character
+    )
+    batches.print_composition()
+
+    model.fit(
+        batches,
+        epochs=epochs,
+        callbacks=[
+            keras.callbacks.ReduceLROnPlateau(monitor='loss', factor=0.5, patience=5,
+                                              min_lr=1e-7),
+            keras.callbacks.EarlyStopping(monitor='loss', patience=10,
+                                          restore_best_weights=True),
+            StageTimingCallback(batches.batch_size),
+        ],
+        verbose=1
+    )
+    return model
+
+
+def build_index(model, X, y, index_to_character, indices=None):
+    """Prototype index from the embeddings of labeled reference images"""
+    indices = np.arange(len(y)) if indices is None else indices
+    embeddings = embed(model, X[indices])
+    index = PrototypeIndex(embeddings.shape[1])
+    index.add_many(embeddings, [index_to_character[int(label)] for label in y[indices]])
+    return index
+
+
+def prototype_accuracy(model, index, X, y, index_to_character, indices):
+    """Nearest-prototype accuracy on held-out images"""
+    predictions = index.predict(embed(model, X[indices]))
+    expected = [index_to_character[int(label)] for label in y[indices]]
+    return float(np.mean([p == e for p, e in zip(predictions, expected)]))
+
+
+def export_embedding_model(trainer, model, output_path=EMBEDDING_TFLITE_PATH):
+    """Convert the embedding model to TFLite with the raw uint8 canvas as input"""
+    trainer.model = model
+    converter = tf.lite.TFLiteConverter.from_keras_model(trainer.build_export_model(raw_input=True))
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    with open(output_path, 'wb') as f:
+        f.write(converter.convert())
+    print(f"Embedding model saved to {output_path}")
+    return output_path
+
+
+def add_characters(export_path, model_path=EMBEDDING_MODEL_PATH, index_path=INDEX_PATH):
+    """Embed the drawings in an export and insert them as reference embeddings
+
+    Any character may appear in the export; each one becomes (or refines)
+    a prototype.
+    """
+    with open(export_path, 'r', encoding='utf-8') as f:
+        characters = sorted({entry.get('character') for entry in json.load(f)['data']} - {None})
+    character_to_index = {character: i for i, character in enumerate(characters)}
+
+    images, labels = load_clean_export(export_path, character_to_index)
+    model = keras.models.load_model(model_path, compile=False)
+    index = PrototypeIndex.load(index_path)
+    before = len(index)
+
+    index.add_many(embed(model, images), [characters[int(label)] for label in labels])
+    index.save(index_path)
+    print(f"Added {len(labels)} reference drawings for {len(characters)} characters "
+          f"({len(index) - before} new); index now holds {len(index)} characters")
+    return index
+
+
+def train_and_build(data_path='training_data_export.json', epochs=50):
+    """Train the embedding model, build the prototype index and export both"""
+    trainer = JapaneseCharacterTrainer()
+    X, y = trainer.load_training_data(data_path)
+    train_idx, test_idx = split_indices(y, test_size=0.15)
+
+    model = train_embedding(trainer, X, y, train_idx, epochs=epochs)
+    model.save(EMBEDDING_MODEL_PATH)
+
+    index = build_index(model, X, y, trainer.index_to_character, train_idx)
+    if len(index) > 64:
+        index.build_ivf()
+    index.save(INDEX_PATH)
+    print(f"Prototype index with {len(index)} characters saved to {INDEX_PATH}")
+
+    accuracy = prototype_accuracy(model, index, X, y, trainer.index_to_character, test_idx)
+    print(f"Nearest-prototype accuracy on held-out samples: {accuracy:.4f}")
+
+    export_embedding_model(trainer, model)
+    return model, index
+
+
+def main():
+    """Main embedding training function"""
+    print("Japanese Character Embedding Training")
+    print("=" * 50)
+
+    if len(sys.argv) > 2 and sys.argv[1] == 'add':
+        add_characters(sys.argv[2])
+        return
+
+    if not os.path.exists('training_data_export.json'):
+        print("Training data file training_data_export.json not found!")
+        print("Please export training data from the Flutter app first.")
+        return
+
+    train_and_build()
+
+
+if __name__ == "__main__":
+    main()
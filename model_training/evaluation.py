@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Streaming Evaluation Engine
+Accumulates a confusion matrix, top-k accuracy, confusable pairs and
+per-class latency batch by batch, so memory stays constant in test set size
+"""
+
+import time
+
+import numpy as np
+
+
+class StreamingEvaluator:
+    def __init__(self, num_classes, class_names=None, top_k=(1, 3, 5)):
+        self.num_classes = num_classes
+        self.class_names = class_names
+        self.top_k = tuple(k for k in top_k if k <= num_classes)
+        self.reset()
+
+    def reset(self):
+        """Clear all accumulated statistics"""
+        self.confusion = np.zeros((self.num_classes, self.num_classes), dtype=np.int64)
+        self.top_k_hits = {k: 0 for k in self.top_k}
+        self.class_seconds = np.zeros(self.num_classes, dtype=np.float64)
+        self.total_seconds = 0.0
+        self.samples = 0
+        self.batches = 0
+
+    def name(self, index):
+        if self.class_names is None:
+            return str(index)
+        return self.class_names[int(index)]
+
+    def update(self, probabilities, labels, seconds=0.0):
+        """Add one batch of predicted probabilities and true labels"""
+        probabilities = np.asarray(probabilities)
+        labels = np.asarray(labels).astype(np.int64)
+        predicted = probabilities.argmax(axis=1)
+
+        self.confusion += np.bincount(
+            labels * self.num_classes + predicted,
+            minlength=self.num_classes * self.num_classes
+        ).reshape(self.num_classes, self.num_classes)
+
+        if self.top_k:
+            # Only the largest k scores are needed, not a full sort
+            largest = max(self.top_k)
+            top = np.argpartition(-probabilities, largest - 1, axis=1)[:, :largest]
+            top_scores = np.take_along_axis(probabilities, top, axis=1)
+            ranked = np.take_along_axis(top, np.argsort(-top_scores, axis=1), axis=1)
+            hits = ranked == labels[:, None]
+            for k in self.top_k:
+                self.top_k_hits[k] += int(hits[:, :k].any(axis=1).sum())
+
+        # Batch latency is shared evenly by the samples in the batch
+        if len(labels):
+            self.class_seconds += np.bincount(labels, minlength=self.num_classes) * (seconds / len(labels))
+        self.total_seconds += seconds
+        self.samples += len(labels)
+        self.batches += 1
+
+    def evaluate(self, predict_fn, batches):
+        """Run predict_fn over an iterable of (x, y) batches"""
+        for x, y in batches:
+            start = time.perf_counter()
+            probabilities = predict_fn(x)
+            self.update(probabilities, y, time.perf_counter() - start)
+        return self.report()
+
+    def accuracy(self):
+        if self.samples == 0:
+            return 0.0
+        return float(np.trace(self.confusion)) / self.samples
+
+    def confused_pairs(self, limit=10):
+        """Most confused character pairs, counting both directions"""
+        symmetric = self.confusion + self.confusion.T
+        upper_rows, upper_cols = np.triu_indices(self.num_classes, k=1)
+        counts = symmetric[upper_rows, upper_cols]
+        order = np.argsort(-counts, kind='stable')[:limit]
+
+        pairs = []
+        for i in order:
+            if counts[i] == 0:
+                break
+            a, b = upper_rows[i], upper_cols[i]
+            support = self.confusion[a].sum() + self.confusion[b].sum()
+            pairs.append({
+                'pair': (self.name(a), self.name(b)),
+                'errors': int(counts[i]),
+                f'{self.name(a)}->{self.name(b)}': int(self.confusion[a, b]),
+                f'{self.name(b)}->{self.name(a)}': int(self.confusion[b, a]),
+                'rate': float(counts[i]) / support if support else 0.0,
+            })
+        return pairs
+
+    def per_class(self):
+        """Precision, recall, F1, support and mean latency per class"""
+        true_positive = np.diag(self.confusion).astype(np.float64)
+        support = self.confusion.sum(axis=1)
+        predicted = self.confusion.sum(axis=0)
+
+        precision = np.divide(true_positive, predicted, out=np.zeros_like(true_positive), where=predicted > 0)
+        recall = np.divide(true_positive, support, out=np.zeros_like(true_positive), where=support > 0)
+        f1 = np.divide(2 * precision * recall, precision + recall,
+                       out=np.zeros_like(true_positive), where=(precision + recall) > 0)
+        latency_ms = np.divide(self.class_seconds * 1000.0, support,
+                               out=np.zeros_like(true_positive), where=support > 0)
+
+        return {
+            self.name(i): {
+                'precision': float(precision[i]),
+                'recall': float(recall[i]),
+                'f1': float(f1[i]),
+                'support': int(support[i]),
+                'latency_ms': float(latency_ms[i]),
+            }
+            for i in np.flatnonzero(support)
+        }
+
+    def report(self, pair_limit=10):
+        """Summary of everything accumulated so far"""
+        return {
+            'samples': self.samples,
+            'accuracy': self.accuracy(),
+            'top_k_accuracy': {
+                k: hits / self.samples if self.samples else 0.0
+                for k, hits in self.top_k_hits.items()
+            },
+            'mean_latency_ms': self.total_seconds * 1000.0 / self.samples if self.samples else 0.0,
+            'throughput_per_sec': self.samples / self.total_seconds if self.total_seconds else 0.0,
+            'per_class': self.per_class(),
+            'confused_pairs': self.confused_pairs(pair_limit),
+        }
+
+    def print_report(self, report=None):
+        """Print an evaluation report"""
+        report = report or self.report()
+        print(f"Evaluated {report['samples']} samples")
+        print(f"Accuracy: {report['accuracy']:.4f}")
+        for k, value in report['top_k_accuracy'].items():
+            print(f"Top-{k} accuracy: {value:.4f}")
+        print(f"Latency: {report['mean_latency_ms']:.3f} ms/sample "
+              f"({report['throughput_per_sec']:.0f} samples/sec)")
+
+        print("\nPer-class results:")
+        print(f"{'char':>6} {'precision':>10} {'recall':>8} {'f1':>8} {'support':>8} {'ms':>8}")
+        for name, stats in report['per_class'].items():
+            print(f"{name:>6} {stats['precision']:>10.3f} {stats['recall']:>8.3f} "
+                  f"{stats['f1']:>8.3f} {stats['support']:>8} {stats['latency_ms']:>8.3f}")
+
+        if report['confused_pairs']:
+            print("\nMost confused pairs:")
+            for pair in report['confused_pairs']:
+                a, b = pair['pair']
+                print(f"   {a}/{b}: {pair['errors']} errors "
+                      f"({pair[f'{a}->{b}']} {a}->{b}, {pair[f'{b}->{a}']} {b}->{a}, "
+                      f"rate {pair['rate']:.3f})")
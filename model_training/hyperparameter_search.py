@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Parallel Hyperparameter Search for the Japanese Character CNN
+Runs trials concurrently in a process pool (one core slice per worker) and
+prunes weak trials early with successive halving
+"""
+
+import os
+import csv
+import json
+import math
+import random
+import time
+from concurrent.futures import as_completed
+
+from parallel_workers import create_pool, open_shared_arrays, share_arrays
+
+SEARCH_SPACE = {
+    'learning_rate': [3e-4, 1e-3, 3e-3],
+    'dropout': [0.1, 0.25, 0.4],
+    'dense_dropout': [0.3, 0.5],
+    'batch_size': [16, 32, 64],
+    'width': [0.5, 0.75, 1.0],
+}
+
+
+def sample_configs(num_trials, space=SEARCH_SPACE, seed=42):
+    """Draw distinct random configurations from the search space"""
+    rng = random.Random(seed)
+    names = sorted(space)
+    grid_size = math.prod(len(space[name]) for name in names)
+    configs, seen = [], set()
+    while len(configs) < min(num_trials, grid_size):
+        config = {name: rng.choice(space[name]) for name in names}
+        key = tuple(config[name] for name in names)
+        if key not in seen:
+            seen.add(key)
+            configs.append(config)
+    return configs
+
+
+def rung_budgets(min_epochs, max_epochs, eta):
+    """Epoch budget of each successive-halving rung"""
+    budgets = []
+    budget = min_epochs
+    while budget < max_epochs:
+        budgets.append(budget)
+        budget *= eta
+    budgets.append(max_epochs)
+    return budgets
+
+
+def run_trial(trial_id, config, data_dir, work_dir, epochs, initial_epoch):
+    """Train one trial up to `epochs`, resuming from its checkpoint (worker side)"""
+    # Heavy imports happen here, after the worker has applied its thread limits
+    from parallel_workers import configure_tensorflow_threads
+    threads = configure_tensorflow_threads()
+
+    import numpy as np
+    from tensorflow import keras
+    from train_japanese_model import JapaneseCharacterTrainer
+    from data_pipeline import UInt8BatchSequence
+
+    data = open_shared_arrays(data_dir, ['images', 'labels', 'train_idx', 'val_idx'])
+    X, y = data['images'], data['labels']
+    checkpoint = os.path.join(work_dir, f'trial_{trial_id:03d}.h5')
+
+    trainer = JapaneseCharacterTrainer()
+    if initial_epoch > 0 and os.path.exists(checkpoint):
+        model = keras.models.load_model(checkpoint)
+    else:
+        initial_epoch = 0
+        model = trainer.create_model(
+            learning_rate=config['learning_rate'],
+            dropout=config['dropout'],
+            dense_dropout=config['dense_dropout'],
+            width=config['width'],
+        )
+
+    train_batches = UInt8BatchSequence(
+        X, y, data['train_idx'], batch_size=config['batch_size'],
+        augmenter=trainer.create_augmenter(), shuffle=True, seed=trial_id
+    )
+    val_batches = UInt8BatchSequence(X, y, data['val_idx'], batch_size=256)
+
+    start = time.perf_counter()
+    history = model.fit(
+        train_batches,
+        epochs=epochs,
+        initial_epoch=initial_epoch,
+        validation_data=val_batches,
+        verbose=0
+    )
+    train_seconds = time.perf_counter() - start
+    model.save(checkpoint)
+
+    # Single-sample latency, the case that matters for the app
+    sample = val_batches[0][0][:1]
+    model.predict_on_batch(sample)
+    timings = []
+    for _ in range(20):
+        t = time.perf_counter()
+        model.predict_on_batch(sample)
+        timings.append(time.perf_counter() - t)
+
+    return {
+        'trial': trial_id,
+        'config': config,
+        'epochs': epochs,
+        'val_accuracy': float(history.history['val_accuracy'][-1]),
+        'val_loss': float(history.history['val_loss'][-1]),
+        'latency_ms': float(np.median(timings) * 1000.0),
+        'params': int(model.count_params()),
+        'size_kb': os.path.getsize(checkpoint) / 1024.0,
+        'train_seconds': train_seconds,
+        'threads': threads,
+    }
+
+
+def successive_halving(configs, data_dir, work_dir, num_workers=4,
+                       min_epochs=2, max_epochs=18, eta=3):
+    """Run all configs on the first rung and promote the top 1/eta each rung"""
+    budgets = rung_budgets(min_epochs, max_epochs, eta)
+    print(f"Successive halving: {len(configs)} trials, rungs at {budgets} epochs, eta={eta}")
+
+    results = {}
+    trained_epochs = {trial_id: 0 for trial_id in range(len(configs))}
+    survivors = list(range(len(configs)))
+
+    with create_pool(num_workers) as pool:
+        for rung, budget in enumerate(budgets):
+            futures = {
+                pool.submit(run_trial, trial_id, configs[trial_id], data_dir, work_dir,
+                            budget, trained_epochs[trial_id]): trial_id
+                for trial_id in survivors
+            }
+            for future in as_completed(futures):
+                result = future.result()
+                result['rung'] = rung
+                results[result['trial']] = result
+                trained_epochs[result['trial']] = budget
+                print(f"   rung {rung} trial {result['trial']:3d}: "
+                      f"val_acc {result['val_accuracy']:.4f} after {budget} epochs "
+                      f"({result['train_seconds']:.0f}s on {result['threads']} threads)")
+
+            if rung == len(budgets) - 1:
+                break
+            ranked = sorted(survivors, key=lambda t: -results[t]['val_accuracy'])
+            keep = max(1, len(ranked) // eta)
+            for trial_id in ranked[keep:]:
+                results[trial_id]['pruned'] = True
+            survivors = ranked[:keep]
+            print(f"Rung {rung}: kept {keep}, pruned {len(ranked) - keep}")
+
+    return sorted(results.values(), key=lambda r: (-r['rung'], -r['val_accuracy']))
+
+
+def write_leaderboard(results, output_dir):
+    """Write the leaderboard as JSON and CSV and print the top entries"""
+    json_path = os.path.join(output_dir, 'leaderboard.json')
+    csv_path = os.path.join(output_dir, 'leaderboard.csv')
+
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    names = sorted(SEARCH_SPACE)
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['trial', 'rung', 'epochs', 'val_accuracy', 'latency_ms',
+                         'params', 'size_kb', 'pruned'] + names)
+        for r in results:
+            writer.writerow([r['trial'], r['rung'], r['epochs'], f"{r['val_accuracy']:.4f}",
+                             f"{r['latency_ms']:.3f}", r['params'], f"{r['size_kb']:.1f}",
+                             r.get('pruned', False)] + [r['config'][n] for n in names])
+
+    print("\nLeaderboard (accuracy vs latency and size):")
+    print(f"{'trial':>5} {'rung':>4} {'val_acc':>8} {'ms':>7} {'KB':>8}  config")
+    for r in results[:10]:
+        print(f"{r['trial']:>5} {r['rung']:>4} {r['val_accuracy']:>8.4f} "
+              f"{r['latency_ms']:>7.2f} {r['size_kb']:>8.1f}  {r['config']}")
+    print(f"Leaderboard saved to {json_path} and {csv_path}")
+    return json_path
+
+
+def run_search(data_path='training_data_export.json', output_dir='search_runs',
+               num_trials=27, num_workers=4, min_epochs=2, max_epochs=18, eta=3, seed=42):
+    """Load data once, share it with workers and run the search"""
+    from train_japanese_model import JapaneseCharacterTrainer
+    from data_pipeline import split_indices
+
+    trainer = JapaneseCharacterTrainer()
+    X, y = trainer.load_training_data(data_path)
+    train_idx, val_idx = split_indices(y, test_size=0.2, random_state=seed)
+
+    data_dir = share_arrays(os.path.join(output_dir, 'data'), images=X, labels=y,
+                            train_idx=train_idx, val_idx=val_idx)
+    work_dir = os.path.join(output_dir, 'trials')
+    os.makedirs(work_dir, exist_ok=True)
+
+    configs = sample_configs(num_trials, seed=seed)
+    start = time.perf_counter()
+    results = successive_halving(configs, data_dir, work_dir, num_workers,
+                                 min_epochs, max_epochs, eta)
+    print(f"Search finished in {(time.perf_counter() - start) / 60:.1f} minutes")
+
+    write_leaderboard(results, output_dir)
+    return results
+
+
+def main():
+    """Main search function"""
+    print("Japanese Character Model Hyperparameter Search")
+    print("=" * 50)
+
+    if not os.path.exists('training_data_export.json'):
+        print("Training data file training_data_export.json not found!")
+        print("Please export training data from the Flutter app first.")
+        return
+
+    run_search()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Streaming Training Metrics
+Appends per-batch and per-epoch metrics to JSONL/CSV while training runs and
+renders plots off the training thread with the non-interactive Agg backend,
+so headless runs never block on a plot window
+
+    python metrics_logging.py training_metrics.jsonl   # re-plot a (live) log
+"""
+
+import os
+import csv
+import sys
+import json
+import time
+import queue
+import threading
+
+CSV_FIELDS = ['event', 'epoch', 'batch', 'loss', 'accuracy', 'val_loss', 'val_accuracy',
+              'learning_rate', 'step_time', 'epoch_time', 'samples_per_sec', 'time']
+
+
+class MetricsSink:
+    """Appends metric records to a JSONL file and optionally a CSV file"""
+
+    def __init__(self, jsonl_path='training_metrics.jsonl', csv_path=None):
+        self.jsonl_path = jsonl_path
+        self.csv_path = csv_path
+        self._lock = threading.Lock()
+        # Each run starts a fresh log; records are appended as they arrive
+        self._jsonl = open(jsonl_path, 'w', encoding='utf-8')
+        self._csv_file = None
+        self._csv = None
+        if csv_path:
+            self._csv_file = open(csv_path, 'w', newline='', encoding='utf-8')
+            self._csv = csv.DictWriter(self._csv_file, CSV_FIELDS, extrasaction='ignore')
+            self._csv.writeheader()
+
+    def write(self, record):
+        """Append one record (a dict of plain numbers and strings)"""
+        record.setdefault('time', time.time())
+        with self._lock:
+            self._jsonl.write(json.dumps(record) + '\n')
+            if self._csv:
+                self._csv.writerow(record)
+
+    def flush(self):
+        """Push buffered records to disk so readers see them"""
+        with self._lock:
+            self._jsonl.flush()
+            if self._csv_file:
+                self._csv_file.flush()
+
+    def close(self):
+        with self._lock:
+            self._jsonl.close()
+            if self._csv_file:
+                self._csv_file.close()
+
+
+def read_metrics(jsonl_path):
+    """Read a metrics log, skipping a partially written last line"""
+    records = []
+    with open(jsonl_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+    return records
+
+
+def history_from_records(records):
+    """Per-epoch metric lists (the shape of keras History.history)"""
+    history = {}
+    for record in records:
+        if record.get('event') != 'epoch':
+            continue
+        for key, value in record.items():
+            if key not in ('event', 'epoch', 'time'):
+                history.setdefault(key, []).append(value)
+    return history
+
+
+def render_history_plot(history, output_path='training_history.png', batch_records=None):
+    """Render accuracy/loss curves to a PNG with the Agg backend
+
+    Uses Figure and FigureCanvasAgg directly rather than pyplot, so it never
+    opens a window and is safe to call from a background thread.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    figure = Figure(figsize=(12, 4))
+    FigureCanvasAgg(figure)
+    accuracy_axes, loss_axes = figure.subplots(1, 2)
+
+    if batch_records:
+        # Per-batch loss as a faint line under the epoch curves
+        steps = [r['epoch'] + r['batch'] / (r['steps'] or 1) for r in batch_records]
+        loss_axes.plot(steps, [r['loss'] for r in batch_records],
+                       color='lightgray', linewidth=0.5, label='Batch Loss')
+
+    for axes, metric, title in ((accuracy_axes, 'accuracy', 'Model Accuracy'),
+                                (loss_axes, 'loss', 'Model Loss')):
+        epochs = range(1, len(history.get(metric, [])) + 1)
+        if history.get(metric):
+            axes.plot(epochs, history[metric], label=f'Training {metric.title()}')
+        if history.get(f'val_{metric}'):
+            axes.plot(epochs, history[f'val_{metric}'], label=f'Validation {metric.title()}')
+        axes.set_title(title)
+        axes.set_xlabel('Epoch')
+        axes.set_ylabel(metric.title())
+        axes.legend()
+
+    figure.tight_layout()
+    figure.savefig(output_path)
+    return output_path
+
+
+class BackgroundPlotter:
+    """Re-renders the plot from the metrics log on a worker thread
+
+    request() never blocks; requests that pile up while a render is running
+    collapse into one.
+    """
+
+    def __init__(self, jsonl_path, output_path='training_history.png'):
+        self.jsonl_path = jsonl_path
+        self.output_path = output_path
+        self._requests = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='metrics-plotter', daemon=True)
+        self._thread.start()
+
+    def request(self):
+        self._requests.put(True)
+
+    def close(self, timeout=30):
+        """Render once more with the final metrics and wait for the thread"""
+        self._requests.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            keep_going = self._requests.get()
+            # Drain queued requests; only the latest state matters
+            while keep_going and not self._requests.empty():
+                keep_going = self._requests.get()
+            try:
+                records = read_metrics(self.jsonl_path)
+                batches = [r for r in records if r.get('event') == 'batch']
+                render_history_plot(history_from_records(records), self.output_path, batches)
+            except Exception as e:
+                print(f"Plotting failed: {e}")
+            if not keep_going:
+                return
+
+
+def main():
+    """Render a plot from a metrics log"""
+    jsonl_path = sys.argv[1] if len(sys.argv) > 1 else 'training_metrics.jsonl'
+    output_path = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(jsonl_path)[0] + '.png'
+    records = read_metrics(jsonl_path)
+    batches = [r for r in records if r.get('event') == 'batch']
+    render_history_plot(history_from_records(records), output_path, batches)
+    print(f"Plot saved to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
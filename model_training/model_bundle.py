@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Versioned Model Bundle
+Packs the TFLite model, its labels and the preprocessing spec into one file
+with a SHA-256 of the model, so a serving process cold-starts from a single
+mmap instead of reading the model, the labels file and the JSON separately.
+
+Layout: a fixed 32-byte preamble (magic, format version, header length,
+model offset, model size), a compact JSON header, then the model bytes at a
+page-aligned offset so they can be sliced out of the mmap without copying.
+Opening a bundle checks the checksum and that the number of labels matches
+the model's output size (read from the flatbuffer, no TensorFlow needed).
+
+    python model_bundle.py                  # bundle the exported model, time cold loads
+    python model_bundle.py model.tflite labels.txt out.bundle
+    python cli.py bundle japanese_character_model.tflite
+"""
+
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+import hashlib
+
+from preprocessing import DEFAULT_MARGIN, INK_THRESHOLD
+
+MAGIC = b'MYGANA\x00B'
+FORMAT_VERSION = 1
+PREAMBLE = struct.Struct('<8sIIQQ')
+ALIGNMENT = 4096
+BUNDLE_PATH = 'japanese_character_model.bundle'
+LABELS_PATH = 'japanese_character_labels.txt'
+
+# TFLite TensorType enum values
+TFLITE_TYPES = {0: 'float32', 1: 'float16', 2: 'int32', 3: 'uint8', 4: 'int64',
+                6: 'bool', 7: 'int16', 9: 'int8'}
+
+
+class BundleError(ValueError):
+    """A bundle that is corrupt, from a newer format or inconsistent"""
+
+
+def _table_field(buffer, table, field):
+    """Absolute position of a flatbuffer table field (None when absent)"""
+    vtable = table - struct.unpack_from('<i', buffer, table)[0]
+    vtable_size = struct.unpack_from('<H', buffer, vtable)[0]
+    if 4 + 2 * field >= vtable_size:
+        return None
+    offset = struct.unpack_from('<H', buffer, vtable + 4 + 2 * field)[0]
+    return table + offset if offset else None
+
+
+def _indirect(buffer, position):
+    return position + struct.unpack_from('<I', buffer, position)[0]
+
+
+def _vector(buffer, position):
+    """(element start, length) of the vector a field points to"""
+    start = _indirect(buffer, position)
+    return start + 4, struct.unpack_from('<I', buffer, start)[0]
+
+
+def tflite_signature(model):
+    """Shapes and types of the first subgraph's inputs and outputs
+
+    Reads the few flatbuffer fields it needs (Model.subgraphs, SubGraph.tensors,
+    inputs, outputs and Tensor.shape/type) straight from the bytes.
+    """
+    if bytes(model[4:8]) != b'TFL3':
+        raise BundleError("Not a TensorFlow Lite model")
+    root = _indirect(model, 0)
+    subgraphs, _ = _vector(model, _table_field(model, root, 2))
+    subgraph = _indirect(model, subgraphs)
+    tensors, _ = _vector(model, _table_field(model, subgraph, 0))
+
+    def describe(field):
+        start, count = _vector(model, _table_field(model, subgraph, field))
+        described = []
+        for index in struct.unpack_from(f'<{count}i', model, start):
+            tensor = _indirect(model, tensors + 4 * index)
+            shape_field = _table_field(model, tensor, 0)
+            shape = []
+            if shape_field is not None:
+                shape_start, rank = _vector(model, shape_field)
+                shape = list(struct.unpack_from(f'<{rank}i', model, shape_start))
+            type_field = _table_field(model, tensor, 1)
+            dtype = model[type_field] if type_field is not None else 0
+            described.append({'shape': shape, 'dtype': TFLITE_TYPES.get(dtype, str(dtype))})
+        return described
+
+    return {'inputs': describe(1), 'outputs': describe(2)}
+
+
+def read_labels(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def preprocessing_spec(signature, input_size=64):
+    """How a drawing becomes the model input, inferred from the input tensor
+
+    Exports from convert_to_tflite take the canvas: uint8 (rescaled in the
+    graph) or 0-1 floats, and a canvas larger than the classifier input is
+    cropped and centered in the graph. Older float exports at the classifier
+    size expect a plain resize.
+    """
+    model_input = signature['inputs'][0]
+    canvas_size = model_input['shape'][1]
+    return {
+        'canvas_size': canvas_size,
+        'input_dtype': model_input['dtype'],
+        'pixel_scale': 1.0 if model_input['dtype'] == 'uint8' else 1.0 / 255.0,
+        'background': 'white',
+        'normalization': 'in_graph' if canvas_size > input_size else 'none',
+        'margin': DEFAULT_MARGIN,
+        'ink_threshold': INK_THRESHOLD,
+    }
+
+
+def write_bundle(model_path, labels_path=LABELS_PATH, output_path=BUNDLE_PATH,
+                 preprocessing=None):
+    """Write a bundle, refusing labels that do not match the model's outputs"""
+    with open(model_path, 'rb') as f:
+        model = f.read()
+    labels = read_labels(labels_path)
+    signature = tflite_signature(model)
+    num_outputs = signature['outputs'][0]['shape'][-1]
+    if num_outputs != len(labels):
+        raise BundleError(f"{labels_path} has {len(labels)} labels for a model with "
+                          f"{num_outputs} outputs")
+
+    digest = hashlib.sha256(model).hexdigest()
+    header = json.dumps({
+        'format_version': FORMAT_VERSION,
+        'model_sha256': digest,
+        # Same version string as recognition_cache.model_version()
+        'model_version': digest[:16],
+        'labels': labels,
+        'preprocessing': preprocessing or preprocessing_spec(signature),
+        'signature': signature,
+        'source': os.path.basename(model_path),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    model_offset = -(-(PREAMBLE.size + len(header)) // ALIGNMENT) * ALIGNMENT
+    with open(output_path, 'wb') as f:
+        f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header), model_offset, len(model)))
+        f.write(header)
+        f.write(b'\0' * (model_offset - PREAMBLE.size - len(header)))
+        f.write(model)
+    print(f"Bundle saved to {output_path} ({len(labels)} labels, "
+          f"{len(model) / 1024:.1f} KB model, sha256 {digest[:12]})")
+    return output_path
+
+
+class ModelBundle:
+    """A bundle opened with one mmap; the model is a zero-copy view into it"""
+
+    def __init__(self, path=BUNDLE_PATH, verify=True):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._open(verify)
+        except Exception:
+            self.close()
+            raise
+
+    def _open(self, verify):
+        if len(self._map) < PREAMBLE.size:
+            raise BundleError(f"{self.path} is truncated")
+        magic, version, header_size, model_offset, model_size = PREAMBLE.unpack_from(self._map)
+        if magic != MAGIC:
+            raise BundleError(f"{self.path} is not a model bundle")
+        if version > FORMAT_VERSION:
+            raise BundleError(f"{self.path} has format version {version}; "
+                              f"this reader supports up to {FORMAT_VERSION}")
+        if model_offset + model_size > len(self._map):
+            raise BundleError(f"{self.path} is truncated")
+
+        self.header = json.loads(self._map[PREAMBLE.size:PREAMBLE.size + header_size])
+        self.labels = self.header['labels']
+        self.preprocessing = self.header['preprocessing']
+        self.model_version = self.header['model_version']
+        self.model = memoryview(self._map)[model_offset:model_offset + model_size]
+        if verify:
+            self.verify()
+
+    def verify(self):
+        """Check the model checksum and the label count against the model outputs"""
+        if hashlib.sha256(self.model).hexdigest() != self.header['model_sha256']:
+            raise BundleError(f"{self.path}: model checksum mismatch")
+        num_outputs = tflite_signature(self.model)['outputs'][0]['shape'][-1]
+        if num_outputs != len(self.labels):
+            raise BundleError(f"{self.path}: {len(self.labels)} labels for a model "
+                              f"with {num_outputs} outputs")
+
+    def interpreter(self, num_threads=1):
+        """A TFLite interpreter over the bundled model
+
+        tf.lite.Interpreter only accepts bytes for model_content, so this is
+        one copy of the model section; runtimes that take a buffer can use
+        self.model directly.
+        """
+        import tensorflow as tf
+        interpreter = tf.lite.Interpreter(model_content=bytes(self.model),
+                                          num_threads=num_threads)
+        interpreter.allocate_tensors()
+        return interpreter
+
+    def close(self):
+        if getattr(self, 'model', None) is not None:
+            self.model.release()
+            self.model = None
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _load_loose(model_path, labels_path):
+    """What consumers do today: read the model and parse the labels file separately"""
+    with open(model_path, 'rb') as f:
+        model = f.read()
+    return model, read_labels(labels_path)
+
+
+def main():
+    """Bundle the exported model and compare cold loads with the loose files"""
+    model_path = sys.argv[1] if len(sys.argv) > 1 else 'japanese_character_model.tflite'
+    labels_path = sys.argv[2] if len(sys.argv) > 2 else LABELS_PATH
+    output_path = sys.argv[3] if len(sys.argv) > 3 else BUNDLE_PATH
+
+    if not os.path.exists(model_path):
+        print(f"{model_path} not found! Convert a model first (python cli.py convert).")
+        return
+    write_bundle(model_path, labels_path, output_path)
+
+    repeats = 200
+    timings = {}
+    start = time.perf_counter()
+    for _ in range(repeats):
+        _load_loose(model_path, labels_path)
+    timings['loose files'] = time.perf_counter() - start
+    for name, verify in (('bundle', False), ('verified', True)):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            ModelBundle(output_path, verify=verify).close()
+        timings[name] = time.perf_counter() - start
+
+    for name, seconds in timings.items():
+        print(f"{name:>12}: {seconds / repeats * 1e6:8.1f} us per load")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Process Pool Helpers for Parallel Training Jobs
+Shares one memory-mapped dataset between worker processes and pins each
+worker to its own slice of CPU cores with matching thread limits
+"""
+
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Thread pools that otherwise each size themselves to every core on the box
+THREAD_ENV_VARS = [
+    'OMP_NUM_THREADS',
+    'MKL_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'TF_NUM_INTRAOP_THREADS',
+]
+
+_worker_cores = None
+
+
+def available_cores():
+    """CPU cores this process may run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def core_slices(num_workers, cores=None):
+    """Split the available cores into one contiguous slice per worker"""
+    cores = cores or available_cores()
+    num_workers = max(1, min(num_workers, len(cores)))
+    return [[int(c) for c in chunk] for chunk in np.array_split(cores, num_workers)]
+
+
+def limit_threads(cores):
+    """Pin this process to the given cores and cap thread pools to match
+
+    Must run before TensorFlow is imported, since it reads the thread
+    settings from the environment at import time.
+    """
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(len(cores))
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+
+
+def configure_tensorflow_threads():
+    """Apply this worker's thread limit to TensorFlow (after importing it)"""
+    import tensorflow as tf
+    threads = len(_worker_cores) if _worker_cores else len(available_cores())
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    return threads
+
+
+def worker_cores():
+    """Cores assigned to the current worker (None outside a pool)"""
+    return _worker_cores
+
+
+def _init_worker(slots):
+    global _worker_cores
+    _worker_cores = slots.get()
+    limit_threads(_worker_cores)
+
+
+def create_pool(num_workers, cores=None):
+    """Spawn-based process pool whose workers each own one core slice"""
+    slices = core_slices(num_workers, cores)
+    # TensorFlow is not fork-safe, so workers always start fresh
+    context = multiprocessing.get_context('spawn')
+    slots = context.Queue()
+    for cores_slice in slices:
+        slots.put(cores_slice)
+    print(f"Starting {len(slices)} workers with {len(slices[0])}+ cores each")
+    return ProcessPoolExecutor(
+        max_workers=len(slices), mp_context=context,
+        initializer=_init_worker, initargs=(slots,)
+    )
+
+
+def share_arrays(directory, **arrays):
+    """Save arrays as .npy files that workers can memory-map"""
+    os.makedirs(directory, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, f'{name}.npy'), np.asarray(array))
+    return directory
+
+
+def open_shared_arrays(directory, names):
+    """Memory-map arrays saved by share_arrays (pages are shared, not copied)"""
+    return {
+        name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+        for name in names
+    }
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Content-Addressed Pipeline Runner
+Runs the generate -> compile -> train -> convert -> bundle chain (and the
+Random Forest and labels side stages) as stages whose outputs are keyed by a
+hash of their input files, parameters and code. A stage whose key has not
+changed is skipped; a key seen before is restored from the stage store instead of
+re-run. The export is only generated when it is missing. Every run appends
+its per-stage timings and cache hits to pipeline_runs.jsonl.
+
+    python pipeline.py                    # everything, skipping what is up to date
+    python pipeline.py convert            # compile, train, convert as needed
+    python cli.py pipeline train --epochs 20 --force train
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+
+from characters import HIRAGANA
+from profiling import profiler
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+STORE_DIR = '.pipeline_cache'
+MANIFEST = 'manifest.json'
+RUN_LOG = 'pipeline_runs.jsonl'
+
+
+class Stage:
+    """One pipeline step: inputs, parameters and code in, output files out"""
+
+    def __init__(self, name, run, outputs, inputs=(), params=None, code=(), source=False):
+        self.name = name
+        self.run = run
+        self.outputs = list(outputs)
+        self.inputs = list(inputs)
+        self.params = params or {}
+        # Code files whose changes invalidate the stage
+        self.code = [os.path.join(MODULE_DIR, f) for f in code]
+        # A source (the JSON export) is only created when missing: it may be
+        # replaced by a real export, so it is never removed or restored
+        self.source = source
+
+
+class StageCache:
+    """Stage outputs stored under their content key, plus file digests by mtime"""
+
+    def __init__(self, store_dir=STORE_DIR):
+        self.store_dir = store_dir
+        self.manifest_path = os.path.join(store_dir, MANIFEST)
+        os.makedirs(store_dir, exist_ok=True)
+        self.manifest = {'files': {}, 'stages': {}, 'store': {}}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest.update(json.load(f))
+
+    def save(self):
+        with open(self.manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=1)
+
+    def file_digest(self, path):
+        """SHA-256 of a file, reused while its size and mtime are unchanged"""
+        stat = os.stat(path)
+        known = self.manifest['files'].get(os.path.abspath(path))
+        if known and known[:2] == [stat.st_mtime_ns, stat.st_size]:
+            return known[2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        self.manifest['files'][os.path.abspath(path)] = [stat.st_mtime_ns, stat.st_size,
+                                                         digest.hexdigest()]
+        return digest.hexdigest()
+
+    def digest(self, path):
+        """Digest of a file or a directory tree (None when missing)"""
+        if os.path.isdir(path):
+            digest = hashlib.sha256()
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    full = os.path.join(root, name)
+                    digest.update(os.path.relpath(full, path).encode())
+                    digest.update(self.file_digest(full).encode())
+            return digest.hexdigest()
+        if os.path.exists(path):
+            return self.file_digest(path)
+        return None
+
+    def key(self, stage):
+        """Content key of a stage: its name, parameters, input digests and code digests"""
+        digest = hashlib.sha256(stage.name.encode())
+        digest.update(json.dumps(stage.params, sort_keys=True, ensure_ascii=False).encode())
+        for path in stage.inputs:
+            digest.update(path.encode())
+            digest.update(str(self.digest(path)).encode())
+        for path in stage.code:
+            digest.update(os.path.basename(path).encode())
+            digest.update(str(self.digest(path)).encode())
+        return digest.hexdigest()[:24]
+
+    def up_to_date(self, stage, key):
+        """The workspace already holds this key's outputs, unmodified"""
+        record = self.manifest['stages'].get(stage.name)
+        return (record is not None and record['key'] == key
+                and all(self.digest(path) == record['outputs'].get(path)
+                        for path in stage.outputs))
+
+    def _entry(self, key):
+        return os.path.join(self.store_dir, key)
+
+    def restore(self, stage, key):
+        """Link the stored outputs of a key back into the workspace
+
+        False when the key was never stored or a stored file no longer matches
+        its digest (a hard-linked output was edited in place).
+        """
+        entry = self._entry(key)
+        stored = self.manifest['store'].get(key)
+        paths = [os.path.join(entry, str(i)) for i in range(len(stage.outputs))]
+        if stored is None or [self.digest(path) for path in paths] != stored:
+            _remove(entry)
+            self.manifest['store'].pop(key, None)
+            return False
+        for i, path in enumerate(stage.outputs):
+            _remove(path)
+            _link_tree(os.path.join(entry, str(i)), path)
+        self.record(stage, key)
+        return True
+
+    def store(self, stage, key):
+        """Keep the fresh outputs under the key (hard links, so no copy when possible)"""
+        entry = self._entry(key)
+        _remove(entry)
+        os.makedirs(entry)
+        for i, path in enumerate(stage.outputs):
+            _link_tree(path, os.path.join(entry, str(i)))
+        self.manifest['store'][key] = [self.digest(path) for path in stage.outputs]
+        self.record(stage, key)
+
+    def record(self, stage, key):
+        self.manifest['stages'][stage.name] = {
+            'key': key,
+            'outputs': {path: self.digest(path) for path in stage.outputs},
+        }
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def _link_tree(source, destination):
+    """Hard-link a file or directory tree, copying where links are not possible"""
+    if os.path.isdir(source):
+        os.makedirs(destination, exist_ok=True)
+        for name in os.listdir(source):
+            _link_tree(os.path.join(source, name), os.path.join(destination, name))
+        return
+    parent = os.path.dirname(destination)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+def _cli(*argv):
+    """Run a cli.py subcommand in this process without its summary printing"""
+    import cli
+    args = cli.build_parser().parse_args([str(a) for a in argv])
+    args.func(args)
+
+
+def _train_random_forest(samples_per_char, output_path):
+    from simple_train import SimpleJapaneseRecognizer
+    recognizer = SimpleJapaneseRecognizer(n_jobs=-1)
+    X, y = recognizer.generate_simple_data(num_samples_per_char=samples_per_char, seed=42)
+    recognizer.train_model(X, y)
+    recognizer.save_model(output_path)
+
+
+def _export_random_forest():
+    from convert_model import convert_model_to_flutter
+    convert_model_to_flutter()
+
+
+def _write_labels(path, labels):
+    with open(path, 'w', encoding='utf-8') as f:
+        for label in labels:
+            f.write(f"{label}\n")
+
+
+def default_stages(data='training_data_export.json', compiled=os.path.join('dataset', 'compiled'),
+                   epochs=50, batch_size=16, target_samples=1000,
+                   tflite='japanese_character_model.tflite', model='best_model.h5',
+                   bundle='japanese_character_model.bundle'):
+    """The training pipeline in dependency order"""
+    return [
+        Stage('generate', lambda: _cli('generate', '--output', data,
+                                       '--target-samples', target_samples),
+              outputs=[data], params={'target_samples': target_samples},
+              code=['collect_training_data.py', 'characters.py'], source=True),
+        Stage('compile', lambda: _cli('compile-data', data, '--output', compiled),
+              outputs=[compiled], inputs=[data],
+              code=['data_quality.py', 'preprocessing.py', 'parallel_workers.py',
+                    'characters.py']),
+        Stage('train', lambda: _cli('train', compiled, '--epochs', epochs,
+                                    '--batch-size', batch_size, '--no-export'),
+              outputs=[model], inputs=[compiled],
+              params={'epochs': epochs, 'batch_size': batch_size},
+              code=['train_japanese_model.py', 'data_pipeline.py']),
+        Stage('convert', lambda: _cli('convert', model, '--output', tflite),
+              outputs=[tflite], inputs=[model],
+              code=['train_japanese_model.py', 'preprocessing_layers.py']),
+        Stage('labels', lambda: _write_labels('japanese_character_labels.txt', HIRAGANA),
+              outputs=['japanese_character_labels.txt'], params={'labels': HIRAGANA}),
+        Stage('bundle', lambda: _cli('bundle', tflite, '--output', bundle),
+              outputs=[bundle], inputs=[tflite, 'japanese_character_labels.txt'],
+              code=['model_bundle.py']),
+        Stage('rf_train', lambda: _train_random_forest(50, 'simple_japanese_model.pkl'),
+              outputs=['simple_japanese_model.pkl'], params={'samples_per_char': 50},
+              code=['simple_train.py']),
+        Stage('rf_export', _export_random_forest,
+              outputs=['simple_japanese_model.json'], inputs=['simple_japanese_model.pkl'],
+              code=['convert_model.py']),
+    ]
+
+
+def upstream(stages, targets):
+    """The targets plus every stage that produces one of their inputs, in order"""
+    producers = {path: stage for stage in stages for path in stage.outputs}
+    needed = set()
+    pending = [stage for stage in stages if stage.name in targets]
+    while pending:
+        stage = pending.pop()
+        if stage.name in needed:
+            continue
+        needed.add(stage.name)
+        pending.extend(producers[path] for path in stage.inputs if path in producers)
+    return [stage for stage in stages if stage.name in needed]
+
+
+def run_pipeline(stages, targets=None, force=(), store_dir=STORE_DIR, log_path=RUN_LOG):
+    """Run stages in order, skipping or restoring those whose key is unchanged"""
+    if targets:
+        unknown = set(targets) - {stage.name for stage in stages}
+        if unknown:
+            raise ValueError(f"Unknown stages: {', '.join(sorted(unknown))}")
+        stages = upstream(stages, targets)
+
+    cache = StageCache(store_dir)
+    results = []
+    for stage in stages:
+        start = time.perf_counter()
+        # Keys are computed just before each stage, after upstream stages have run
+        key = cache.key(stage)
+        if stage.source and all(os.path.exists(path) for path in stage.outputs):
+            status = 'source'
+        elif stage.name not in force and cache.up_to_date(stage, key):
+            status = 'hit'
+        elif stage.name not in force and cache.restore(stage, key):
+            status = 'restored'
+        else:
+            print(f"\n=== {stage.name} ===")
+            for path in stage.outputs:
+                # Writers then create new files instead of truncating stored links
+                _remove(path)
+            stage.run()
+            missing = [path for path in stage.outputs if not os.path.exists(path)]
+            if missing:
+                cache.save()
+                raise RuntimeError(f"Stage {stage.name} did not produce {', '.join(missing)}")
+            if stage.source:
+                cache.record(stage, key)
+            else:
+                cache.store(stage, key)
+            status = 'run'
+        cache.save()
+        seconds = time.perf_counter() - start
+        profiler.add(f'pipeline:{stage.name}', seconds, start=start, category='pipeline')
+        results.append({'stage': stage.name, 'status': status, 'seconds': round(seconds, 3),
+                        'key': key})
+
+    print(f"\n{'stage':<12} {'status':<9} {'seconds':>9}  key")
+    for result in results:
+        print(f"{result['stage']:<12} {result['status']:<9} {result['seconds']:>9.2f}  "
+              f"{result['key'][:12]}")
+    hits = sum(result['status'] != 'run' for result in results)
+    print(f"{hits}/{len(results)} stages served from cache")
+
+    with open(log_path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'time': time.time(), 'stages': results}) + '\n')
+    return results
+
+
+def main():
+    """Run the whole pipeline or the named stages"""
+    run_pipeline(default_stages(), targets=sys.argv[1:] or None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Batched Character Normalization
+Crops each drawing to its ink bounding box, pads it to a square, centers it
+by ink mass and resamples it to the model input size.
+
+The same math is implemented with TensorFlow ops in preprocessing_layers.py
+so the exported TFLite model performs identical normalization on device.
+"""
+
+import numpy as np
+
+DEFAULT_MARGIN = 0.1
+INK_THRESHOLD = 0.5
+
+
+def to_ink(images):
+    """Convert white-background images (uint8 or 0-1 floats) to float32 ink maps"""
+    images = np.asarray(images)
+    if images.ndim == 4:
+        images = images[..., 0]
+    scale = 255.0 if images.dtype == np.uint8 else 1.0
+    return 1.0 - images.astype(np.float32) / scale
+
+
+def ink_geometry(ink, ink_threshold=INK_THRESHOLD):
+    """Ink bounding box and center of mass for a batch of ink maps"""
+    n, h, w = ink.shape
+    mask = ink > ink_threshold
+
+    rows = mask.any(axis=2)
+    cols = mask.any(axis=1)
+    has_ink = rows.any(axis=1)
+
+    top = np.where(has_ink, rows.argmax(axis=1), 0).astype(np.float32)
+    bottom = np.where(has_ink, h - rows[:, ::-1].argmax(axis=1), h).astype(np.float32)
+    left = np.where(has_ink, cols.argmax(axis=1), 0).astype(np.float32)
+    right = np.where(has_ink, w - cols[:, ::-1].argmax(axis=1), w).astype(np.float32)
+
+    # Center of mass of the thresholded ink, in continuous pixel coordinates
+    weights = ink * mask
+    total = weights.sum(axis=(1, 2))
+    safe_total = np.where(total > 0, total, 1.0)
+    center_y = (weights.sum(axis=2) * (np.arange(h, dtype=np.float32) + 0.5)).sum(axis=1) / safe_total
+    center_x = (weights.sum(axis=1) * (np.arange(w, dtype=np.float32) + 0.5)).sum(axis=1) / safe_total
+    center_y = np.where(total > 0, center_y, h / 2.0)
+    center_x = np.where(total > 0, center_x, w / 2.0)
+
+    return top, bottom, left, right, center_y, center_x
+
+
+def crop_boxes(ink, margin=DEFAULT_MARGIN, ink_threshold=INK_THRESHOLD):
+    """Square crop boxes (start_y, start_x, side) centered on ink mass"""
+    top, bottom, left, right, center_y, center_x = ink_geometry(ink, ink_threshold)
+
+    # Pad the bounding box to a square with a small margin
+    side = np.maximum(bottom - top, right - left) * (1.0 + 2.0 * margin)
+    half = side / 2.0
+
+    # Center on the ink mass, but never cut off part of the bounding box
+    center_y = np.clip(center_y, bottom - half, top + half)
+    center_x = np.clip(center_x, right - half, left + half)
+
+    return center_y - half, center_x - half, side
+
+
+def sampling_matrix(start, side, size, output_size):
+    """Separable resampling weights of shape (N, output_size, size)
+
+    Uses a triangle filter widened by the downscale factor, so shrinking a
+    large drawing averages pixels instead of aliasing. Source positions that
+    fall outside the canvas get zero weight, which reads as background.
+    """
+    step = side / float(output_size)
+    positions = start[:, None] + (np.arange(output_size, dtype=np.float32) + 0.5) * step[:, None] - 0.5
+    support = np.maximum(step, 1.0)[:, None, None]
+    distance = np.abs(positions[:, :, None] - np.arange(size, dtype=np.float32)[None, None, :])
+    return np.maximum(1.0 - distance / support, 0.0) / support
+
+
+def normalize_batch(images, output_size=64, margin=DEFAULT_MARGIN,
+                    ink_threshold=INK_THRESHOLD, batch_size=512):
+    """Crop, square-pad, mass-center and resample a batch of drawings
+
+    Accepts (N, H, W) or (N, H, W, 1) arrays, either uint8 or floats in 0-1,
+    and returns (N, output_size, output_size) in the same dtype and scale.
+    """
+    images = np.asarray(images)
+    uint8_input = images.dtype == np.uint8
+    count = len(images)
+    out = np.empty((count, output_size, output_size),
+                   dtype=np.uint8 if uint8_input else np.float32)
+
+    for start in range(0, count, batch_size):
+        ink = to_ink(images[start:start + batch_size])
+        _, h, w = ink.shape
+
+        start_y, start_x, side = crop_boxes(ink, margin, ink_threshold)
+        rows = sampling_matrix(start_y, side, h, output_size)
+        cols = sampling_matrix(start_x, side, w, output_size)
+
+        resampled = np.clip(rows @ ink @ cols.transpose(0, 2, 1), 0.0, 1.0)
+
+        if uint8_input:
+            out[start:start + batch_size] = np.rint((1.0 - resampled) * 255.0).astype(np.uint8)
+        else:
+            out[start:start + batch_size] = 1.0 - resampled
+
+    return out
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Keras preprocessing layers that are exported inside the TFLite model
+Mirrors preprocessing.py using ops the TFLite builtin op set supports
+"""
+
+import tensorflow as tf
+from tensorflow import keras
+from tensorflow.keras import layers
+
+from preprocessing import DEFAULT_MARGIN, INK_THRESHOLD
+
+
+@keras.utils.register_keras_serializable(package='MyGana')
+class CharacterNormalization(layers.Layer):
+    """Graph version of preprocessing.normalize_batch
+
+    Takes (N, H, W, 1) white-background images scaled to 0-1 and returns
+    (N, output_size, output_size, 1) normalized images in the same scale.
+    """
+
+    def __init__(self, output_size=64, margin=DEFAULT_MARGIN,
+                 ink_threshold=INK_THRESHOLD, **kwargs):
+        super().__init__(**kwargs)
+        self.output_size = output_size
+        self.margin = margin
+        self.ink_threshold = ink_threshold
+
+    def _sampling_matrix(self, start, side, size):
+        step = side / float(self.output_size)
+        positions = (start[:, None]
+                     + (tf.range(self.output_size, dtype=tf.float32) + 0.5) * step[:, None]
+                     - 0.5)
+        support = tf.maximum(step, 1.0)[:, None, None]
+        distance = tf.abs(positions[:, :, None] - tf.range(size, dtype=tf.float32)[None, None, :])
+        return tf.maximum(1.0 - distance / support, 0.0) / support
+
+    def call(self, inputs):
+        ink = 1.0 - tf.cast(inputs[..., 0], tf.float32)
+        h = int(inputs.shape[1])
+        w = int(inputs.shape[2])
+        row_index = tf.range(h, dtype=tf.float32)
+        col_index = tf.range(w, dtype=tf.float32)
+
+        mask = tf.cast(ink > self.ink_threshold, tf.float32)
+        rows = tf.reduce_max(mask, axis=2)
+        cols = tf.reduce_max(mask, axis=1)
+        has_ink = tf.reduce_max(rows, axis=1) > 0
+
+        # First/last inked row and column (min/max instead of argmax, which
+        # does not guarantee the first index on ties)
+        top = tf.reduce_min(rows * row_index + (1.0 - rows) * h, axis=1)
+        bottom = tf.reduce_max(rows * (row_index + 1.0), axis=1)
+        left = tf.reduce_min(cols * col_index + (1.0 - cols) * w, axis=1)
+        right = tf.reduce_max(cols * (col_index + 1.0), axis=1)
+        top = tf.where(has_ink, top, 0.0)
+        bottom = tf.where(has_ink, bottom, float(h))
+        left = tf.where(has_ink, left, 0.0)
+        right = tf.where(has_ink, right, float(w))
+
+        weights = ink * mask
+        total = tf.reduce_sum(weights, axis=[1, 2])
+        safe_total = tf.where(total > 0, total, 1.0)
+        center_y = tf.reduce_sum(tf.reduce_sum(weights, axis=2) * (row_index + 0.5), axis=1) / safe_total
+        center_x = tf.reduce_sum(tf.reduce_sum(weights, axis=1) * (col_index + 0.5), axis=1) / safe_total
+        center_y = tf.where(total > 0, center_y, h / 2.0)
+        center_x = tf.where(total > 0, center_x, w / 2.0)
+
+        side = tf.maximum(bottom - top, right - left) * (1.0 + 2.0 * self.margin)
+        half = side / 2.0
+        center_y = tf.clip_by_value(center_y, bottom - half, top + half)
+        center_x = tf.clip_by_value(center_x, right - half, left + half)
+
+        row_weights = self._sampling_matrix(center_y - half, side, h)
+        col_weights = self._sampling_matrix(center_x - half, side, w)
+
+        resampled = tf.matmul(tf.matmul(row_weights, ink), col_weights, transpose_b=True)
+        resampled = tf.clip_by_value(resampled, 0.0, 1.0)
+        return (1.0 - resampled)[..., None]
+
+    def compute_output_shape(self, input_shape):
+        return (input_shape[0], self.output_size, self.output_size, 1)
+
+    def get_config(self):
+        config = super().get_config()
+        config.update({
+            'output_size': self.output_size,
+            'margin': self.margin,
+            'ink_threshold': self.ink_threshold,
+        })
+        return config
+
+
+def build_raw_input_model(model, input_size=64, raw_size=128, normalize=False):
+    """Put rescaling and resizing in front of a classifier
+
+    The returned model takes the raw (raw_size, raw_size, 1) uint8 canvas, so
+    clients skip float conversion and resizing and send a 4x smaller buffer.
+    """
+    inputs = layers.Input(shape=(raw_size, raw_size, 1), dtype='uint8')
+    x = layers.Rescaling(1.0 / 255.0)(inputs)
+    if normalize:
+        x = CharacterNormalization(output_size=input_size)(x)
+    elif raw_size != input_size:
+        x = layers.Resizing(input_size, input_size, interpolation='bilinear')(x)
+    outputs = model(x)
+    return keras.Model(inputs, outputs)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Pipeline Stage Timing and Profiling
+Records wall time, CPU time, item counts and peak memory per pipeline stage,
+prints a summary table and writes a Chrome trace (open in chrome://tracing
+or https://ui.perfetto.dev)
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_memory_mb():
+    """Peak resident memory of this process in MB (None if unavailable)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    if sys.platform == 'darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+class Profiler:
+    """Collects stage timings for one run
+
+    Stages may nest and may be recorded from several threads. Timings taken
+    inside a hot loop can be accumulated by the caller and recorded once
+    with add(), which keeps the per-item overhead at two clock reads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Drop everything recorded so far"""
+        with self._lock:
+            self.origin = time.perf_counter()
+            self.events = []
+            self.totals = {}
+
+    @contextmanager
+    def stage(self, name, items=None, category='pipeline'):
+        """Time a block; set record['items'] inside it if the count is known late"""
+        record = {'items': items}
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        finally:
+            self.add(name, time.perf_counter() - start, time.process_time() - cpu_start,
+                     record['items'], start=start, category=category)
+
+    def add(self, name, wall, cpu=None, items=None, start=None, category='pipeline'):
+        """Record a timing; without a start time it only counts towards the summary"""
+        peak = peak_memory_mb()
+        with self._lock:
+            total = self.totals.setdefault(name, {
+                'category': category, 'calls': 0, 'wall': 0.0, 'cpu': None,
+                'items': 0, 'peak_mb': 0.0,
+            })
+            total['calls'] += 1
+            total['wall'] += wall
+            if cpu is not None:
+                total['cpu'] = (total['cpu'] or 0.0) + cpu
+            total['items'] += items or 0
+            total['peak_mb'] = max(total['peak_mb'], peak or 0.0)
+
+            if start is not None:
+                args = {'cpu_ms': round((cpu or 0.0) * 1000.0, 3)}
+                if items is not None:
+                    args['items'] = items
+                if peak is not None:
+                    args['peak_mb'] = round(peak, 1)
+                self.events.append({
+                    'name': name, 'cat': category, 'ph': 'X',
+                    'ts': (start - self.origin) * 1e6, 'dur': wall * 1e6,
+                    'pid': os.getpid(), 'tid': threading.get_ident(), 'args': args,
+                })
+
+    def summary(self):
+        """Per-stage totals, slowest first"""
+        rows = []
+        with self._lock:
+            totals = {name: dict(total) for name, total in self.totals.items()}
+        for name, total in totals.items():
+            total['name'] = name
+            total['items_per_sec'] = total['items'] / total['wall'] if total['wall'] > 0 else 0.0
+            rows.append(total)
+        return sorted(rows, key=lambda row: -row['wall'])
+
+    def print_summary(self):
+        """Print the stage table"""
+        rows = self.summary()
+        if not rows:
+            return
+        print("\nStage timings:")
+        print(f"{'stage':<22} {'calls':>6} {'wall s':>9} {'cpu s':>9} "
+              f"{'items':>8} {'items/s':>10} {'peak MB':>8}")
+        for row in rows:
+            cpu = f"{row['cpu']:.3f}" if row['cpu'] is not None else '-'
+            print(f"{row['name']:<22} {row['calls']:>6} {row['wall']:>9.3f} {cpu:>9} "
+                  f"{row['items']:>8} {row['items_per_sec']:>10.1f} {row['peak_mb']:>8.1f}")
+
+    def write_trace(self, path):
+        """Write a Chrome trace with the summary table under otherData"""
+        with self._lock:
+            events = list(self.events)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'traceEvents': events,
+                'displayTimeUnit': 'ms',
+                'otherData': {'summary': self.summary()},
+            }, f, ensure_ascii=False)
+        print(f"Trace saved to {path} ({len(events)} events)")
+        return path
+
+
+# Shared by every module so one run produces one trace
+profiler = Profiler()
+
+
+@contextmanager
+def cprofile(output_path=None, top=20):
+    """Run a block under cProfile and print its hottest functions"""
+    import cProfile
+    import pstats
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield profile
+    finally:
+        profile.disable()
+        stats = pstats.Stats(profile).sort_stats('cumulative')
+        stats.print_stats(top)
+        if output_path:
+            stats.dump_stats(output_path)
+            print(f"cProfile stats saved to {output_path}")
+
+
+@contextmanager
+def tensorflow_trace(logdir):
+    """Capture a TensorFlow profiler trace for TensorBoard's Profile tab"""
+    import tensorflow as tf
+
+    tf.profiler.experimental.start(logdir)
+    try:
+        yield
+    finally:
+        tf.profiler.experimental.stop()
+        print(f"TensorFlow profile saved to {logdir}")
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Prototype Index for Embedding-Based Character Recognition
+Stores reference embeddings and one prototype (normalized mean) per
+character, answers queries by vectorized cosine similarity, and switches to
+an inverted-file (IVF) index for sub-linear lookup once there are many
+classes. New characters are added by inserting reference embeddings; the
+network is not retrained.
+"""
+
+import json
+
+import numpy as np
+
+# Below this many prototypes one matrix product beats probing inverted lists
+# (single-query crossover measured at 3-5k prototypes of 128 dims)
+EXACT_SEARCH_LIMIT = 4096
+
+
+def l2_normalize(vectors):
+    """Scale rows to unit length (cosine similarity becomes a dot product)"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def top_k(scores, k):
+    """Column indices of the k highest scores per row, best first"""
+    k = min(k, scores.shape[1])
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1)
+    return np.take_along_axis(part, order, axis=1)
+
+
+def spherical_kmeans(vectors, num_clusters, iterations=20, seed=42):
+    """Cluster unit vectors by cosine similarity; returns centroids and assignments"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), num_clusters, replace=False)].copy()
+    assignments = np.zeros(len(vectors), dtype=np.int32)
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        empty = np.bincount(assignments, minlength=num_clusters) == 0
+        # Re-seed empty clusters with random points instead of dropping them
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = l2_normalize(sums)
+    return centroids, assignments
+
+
+class PrototypeIndex:
+    """Per-character prototypes over L2-normalized embeddings"""
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.labels = []
+        self.label_to_id = {}
+        self.references = np.zeros((0, dim), dtype=np.float32)
+        self.reference_ids = np.zeros(0, dtype=np.int32)
+        self.prototypes = np.zeros((0, dim), dtype=np.float32)
+        # IVF structure: centroids and, per list, the prototype ids it holds
+        self.centroids = None
+        self.list_ids = None
+        self._list_arrays = None
+
+    def __len__(self):
+        return len(self.labels)
+
+    def add(self, label, embeddings):
+        """Insert reference embeddings for one character (new or existing); returns its id"""
+        embeddings = np.atleast_2d(embeddings)
+        return self.add_many(embeddings, [label] * len(embeddings))[0]
+
+    def add_many(self, embeddings, labels):
+        """Insert a labeled batch of reference embeddings; returns the class ids touched"""
+        embeddings = l2_normalize(np.atleast_2d(embeddings))
+        if embeddings.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-d embeddings, got {embeddings.shape[1]}-d")
+        if len(embeddings) != len(labels):
+            raise ValueError(f"{len(embeddings)} embeddings but {len(labels)} labels")
+
+        new_labels = [label for label in dict.fromkeys(labels) if label not in self.label_to_id]
+        for label in new_labels:
+            self.label_to_id[label] = len(self.labels)
+            self.labels.append(label)
+        class_ids = np.array([self.label_to_id[label] for label in labels], dtype=np.int32)
+
+        self.references = np.vstack([self.references, embeddings])
+        self.reference_ids = np.concatenate([self.reference_ids, class_ids])
+
+        # Recompute prototypes (normalized means) of the touched classes only
+        touched = np.unique(class_ids)
+        sums = np.zeros((len(self.labels), self.dim), dtype=np.float32)
+        mask = np.isin(self.reference_ids, touched)
+        np.add.at(sums, self.reference_ids[mask], self.references[mask])
+        self.prototypes = np.vstack([
+            self.prototypes, np.zeros((len(new_labels), self.dim), dtype=np.float32)])
+        self.prototypes[touched] = l2_normalize(sums[touched])
+
+        if self.centroids is not None:
+            # Slot the prototypes into their nearest lists; build_ivf() rebalances
+            nearest = np.argmax(self.prototypes[touched] @ self.centroids.T, axis=1)
+            touched_set = set(touched.tolist())
+            for ids in self.list_ids:
+                ids -= touched_set
+            for class_id, list_id in zip(touched.tolist(), nearest.tolist()):
+                self.list_ids[list_id].add(class_id)
+            self._list_arrays = None
+        return touched.tolist()
+
+    def build_ivf(self, num_lists=None, seed=42):
+        """Cluster the prototypes into inverted lists for approximate search"""
+        if num_lists is None:
+            num_lists = max(1, int(np.sqrt(len(self))))
+        num_lists = min(num_lists, len(self))
+        self.centroids, assignments = spherical_kmeans(self.prototypes, num_lists, seed=seed)
+        self.list_ids = [set(np.flatnonzero(assignments == i).tolist())
+                         for i in range(num_lists)]
+        self._list_arrays = None
+        return self
+
+    def _lists(self):
+        """Inverted lists as arrays (rebuilt lazily after inserts)"""
+        if self._list_arrays is None:
+            self._list_arrays = [np.fromiter(ids, dtype=np.int64, count=len(ids))
+                                 for ids in self.list_ids]
+        return self._list_arrays
+
+    def search(self, queries, k=5, nprobe=None):
+        """Top-k characters and cosine similarities for each query embedding
+
+        Exact for small indexes; with an IVF index and more than
+        EXACT_SEARCH_LIMIT prototypes only the nprobe closest lists are
+        scanned.
+        """
+        queries = l2_normalize(np.atleast_2d(queries))
+        use_ivf = self.centroids is not None and len(self) > EXACT_SEARCH_LIMIT
+        if not use_ivf:
+            scores = queries @ self.prototypes.T
+            ids = top_k(scores, k)
+            return self._results(ids, np.take_along_axis(scores, ids, axis=1))
+
+        nprobe = nprobe or max(1, len(self.centroids) // 8)
+        probes = top_k(queries @ self.centroids.T, nprobe)
+        lists = self._lists()
+        all_ids, all_scores = [], []
+        for query, probe in zip(queries, probes):
+            candidates = np.concatenate([lists[i] for i in probe])
+            scores = self.prototypes[candidates] @ query
+            best = top_k(scores[None, :], k)[0]
+            all_ids.append(candidates[best])
+            all_scores.append(scores[best])
+        return self._results(all_ids, all_scores)
+
+    def _results(self, ids, scores):
+        return [
+            [(self.labels[int(i)], float(s)) for i, s in zip(row_ids, row_scores)]
+            for row_ids, row_scores in zip(ids, scores)
+        ]
+
+    def predict(self, queries):
+        """Best character for each query"""
+        return [matches[0][0] for matches in self.search(queries, k=1)]
+
+    def save(self, path):
+        """Persist the index as one .npz file"""
+        arrays = {
+            'references': self.references,
+            'reference_ids': self.reference_ids,
+            'prototypes': self.prototypes,
+            'meta': np.array(json.dumps({'dim': self.dim, 'labels': self.labels},
+                                        ensure_ascii=False)),
+        }
+        if self.centroids is not None:
+            arrays['centroids'] = self.centroids
+            arrays['list_assignments'] = np.array(
+                [list_id for list_id, ids in enumerate(self.list_ids) for _ in ids], np.int32)
+            arrays['list_members'] = np.array(
+                [member for ids in self.list_ids for member in sorted(ids)], np.int32)
+        np.savez(path, **arrays)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """Load an index written by save()"""
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            index = cls(meta['dim'])
+            index.labels = meta['labels']
+            index.label_to_id = {label: i for i, label in enumerate(index.labels)}
+            index.references = data['references']
+            index.reference_ids = data['reference_ids']
+            index.prototypes = data['prototypes']
+            if 'centroids' in data:
+                index.centroids = data['centroids']
+                index.list_ids = [set() for _ in range(len(index.centroids))]
+                for list_id, member in zip(data['list_assignments'], data['list_members']):
+                    index.list_ids[int(list_id)].add(int(member))
+        return index
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Quantization-Aware Training
+Fine-tunes the float classifier from its checkpoint with fake-quant nodes
+(tensorflow-model-optimization), exports a full-int8 TFLite model through
+JapaneseCharacterTrainer.convert_to_tflite and compares it side by side with
+the float32 and post-training int8 exports: accuracy, latency and size.
+
+    python quantization.py                   # best_model.h5, training_data_export.json
+    python quantization.py model.h5 export.json
+    python cli.py quantize --epochs 3
+"""
+
+import os
+import sys
+import json
+import time
+
+import numpy as np
+
+from data_pipeline import split_indices
+from data_quality import load_clean_export
+
+OUTPUT_DIR = 'quantization'
+CALIBRATION_SAMPLES = 200
+
+
+def quantize_aware_model(model, learning_rate=1e-4):
+    """Wrap a trained float Keras model with fake-quant nodes for fine-tuning"""
+    try:
+        import tensorflow_model_optimization as tfmot
+    except ImportError:
+        raise ImportError("Quantization-aware training needs tensorflow-model-optimization "
+                          "(pip install -r requirements.txt)")
+    from tensorflow import keras
+    if keras.__version__.startswith('3'):
+        raise ImportError(f"tensorflow-model-optimization needs Keras 2, found Keras "
+                          f"{keras.__version__}; install tensorflow<2.16 (requirements.txt)")
+
+    qat_model = tfmot.quantization.keras.quantize_model(model)
+    # A low learning rate: the weights are already trained, only the
+    # quantization ranges and small corrections are learned
+    qat_model.compile(
+        optimizer=keras.optimizers.Adam(learning_rate=learning_rate),
+        loss='sparse_categorical_crossentropy',
+        metrics=['accuracy']
+    )
+    return qat_model
+
+
+def int8_coverage(interpreter):
+    """How many of a converted model's ops produce int8 outputs, and which stay float
+
+    The int8 export lets ops without int8 kernels fall back to float, so
+    this is what shows whether the classifier really runs in int8.
+    """
+    types = {t['index']: np.dtype(t['dtype']) for t in interpreter.get_tensor_details()}
+    ops = interpreter._get_ops_details()
+    int8_ops = float_ops = 0
+    float_names = {}
+    for op in ops:
+        outputs = [types[i] for i in op['outputs'] if i in types]
+        if any(t in (np.int8, np.uint8) for t in outputs):
+            int8_ops += 1
+        elif any(t == np.float32 for t in outputs):
+            float_ops += 1
+            float_names[op['op_name']] = float_names.get(op['op_name'], 0) + 1
+    return {'ops': len(ops), 'int8_ops': int8_ops, 'float_ops': float_ops,
+            'float_op_types': float_names}
+
+
+def evaluate_tflite(model_path, images, labels, warmup=20):
+    """Accuracy, median single-sample latency and file size of a TFLite model"""
+    import tensorflow as tf
+
+    interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=1)
+    interpreter.allocate_tensors()
+    input_details = interpreter.get_input_details()[0]
+    output_index = interpreter.get_output_details()[0]['index']
+    shape, dtype = input_details['shape'], input_details['dtype']
+
+    for image in images[:warmup]:
+        interpreter.set_tensor(input_details['index'], image.reshape(shape).astype(dtype))
+        interpreter.invoke()
+
+    predictions = np.zeros(len(labels), dtype=np.int64)
+    seconds = np.zeros(len(labels))
+    for i, image in enumerate(images):
+        start = time.perf_counter()
+        interpreter.set_tensor(input_details['index'], image.reshape(shape).astype(dtype))
+        interpreter.invoke()
+        predictions[i] = interpreter.get_tensor(output_index)[0].argmax()
+        seconds[i] = time.perf_counter() - start
+
+    return {
+        'accuracy': float(np.mean(predictions == labels)) if len(labels) else 0.0,
+        'latency_ms': float(np.median(seconds) * 1000) if len(labels) else 0.0,
+        'size_kb': os.path.getsize(model_path) / 1024.0,
+        'int8': int8_coverage(interpreter),
+    }
+
+
+def print_report(report):
+    print(f"\n{'model':<10} {'accuracy':>9} {'latency ms':>11} {'size KB':>9} {'int8 ops':>9}  path")
+    for name, row in report['models'].items():
+        coverage = f"{row['int8']['int8_ops']}/{row['int8']['ops']}"
+        print(f"{name:<10} {row['accuracy']:>9.4f} {row['latency_ms']:>11.3f} "
+              f"{row['size_kb']:>9.1f} {coverage:>9}  {row['path']}")
+    for name, row in report['models'].items():
+        if name != 'float32' and row['int8']['float_ops']:
+            print(f"{name}: ops left in float: " + ', '.join(
+                f"{op} x{count}" for op, count in sorted(row['int8']['float_op_types'].items())))
+
+
+def quantize_and_compare(data_path='training_data_export.json', float_model_path='best_model.h5',
+                         epochs=5, batch_size=32, learning_rate=1e-4, output_dir=OUTPUT_DIR):
+    """Fine-tune with QAT, export float32/PTQ int8/QAT int8 and write the comparison"""
+    from tensorflow import keras
+    from train_japanese_model import JapaneseCharacterTrainer
+
+    if os.path.isdir(data_path):
+        print("The comparison scores the exported models on raw canvases; "
+              "pass the JSON export rather than a compiled dataset")
+        return None
+    os.makedirs(output_dir, exist_ok=True)
+
+    trainer = JapaneseCharacterTrainer()
+    X, y = trainer.load_training_data(data_path)
+    X = X.reshape(-1, trainer.input_size, trainer.input_size, 1)
+    # The exported models take the raw canvas; the gate keeps the same samples in the same order
+    canvases, _ = load_clean_export(data_path, trainer.character_to_index,
+                                    canvas_size=trainer.canvas_size,
+                                    input_size=trainer.canvas_size, normalize=False)
+    # Same held-out split as train_and_export
+    train_idx, test_idx = split_indices(y, test_size=0.15)
+    calibration = canvases[train_idx[:CALIBRATION_SAMPLES]]
+
+    float_model = keras.models.load_model(float_model_path)
+    trainer.model = float_model
+    paths = {
+        'float32': trainer.convert_to_tflite(os.path.join(output_dir, 'float32.tflite'),
+                                             model_path=None, quantize=None),
+        'ptq_int8': trainer.convert_to_tflite(os.path.join(output_dir, 'ptq_int8.tflite'),
+                                              model_path=None, quantize='int8',
+                                              representative_images=calibration),
+    }
+
+    print(f"Quantization-aware fine-tuning for {epochs} epochs...")
+    trainer.model = quantize_aware_model(float_model, learning_rate)
+    trainer.train_model(X, y, epochs=epochs, batch_size=batch_size, indices=train_idx,
+                        metrics_path=os.path.join(output_dir, 'qat_metrics.jsonl'),
+                        checkpoint_path=None)
+    paths['qat_int8'] = trainer.convert_to_tflite(os.path.join(output_dir, 'qat_int8.tflite'),
+                                                  model_path=None, quantize='int8',
+                                                  representative_images=calibration)
+
+    test_images, test_labels = canvases[test_idx], y[test_idx]
+    report = {'test_samples': int(len(test_idx)), 'epochs': epochs, 'models': {}}
+    for name, path in paths.items():
+        report['models'][name] = dict(evaluate_tflite(path, test_images, test_labels), path=path)
+
+    report_path = os.path.join(output_dir, 'quantization_report.json')
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print_report(report)
+    print(f"\nReport saved to {report_path}")
+    return report
+
+
+def main():
+    """Main quantization-aware training function"""
+    print("Japanese Character Quantization-Aware Training")
+    print("=" * 50)
+
+    model_path = sys.argv[1] if len(sys.argv) > 1 else 'best_model.h5'
+    data_path = sys.argv[2] if len(sys.argv) > 2 else 'training_data_export.json'
+
+    for path in (model_path, data_path):
+        if not os.path.exists(path):
+            print(f"{path} not found!")
+            print("Train the float model (python cli.py train) on an exported JSON file first.")
+            return
+
+    quantize_and_compare(data_path, model_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,9 @@ import io
 from PIL import Image
 import random
 
+from preprocessing_layers import build_raw_input_model
+from data_pipeline import UInt8BatchSequence, report_memory, split_indices
+
 def create_simple_model():
     """Create a simple CNN model"""
     model = keras.Sequential([
@@ -102,18 +105,21 @@ def generate_quick_data():
             noise = np.random.normal(0, 10, img_array.shape)
             img_array = np.clip(img_array + noise, 0, 255)
             
-            X.append(img_array / 255.0)
+            # Store as uint8; batches are scaled to float32 during training
+            X.append(img_array.astype(np.uint8))
             y.append(character_to_index[char])
     
-    return np.array(X), np.array(y)
+    return np.array(X, dtype=np.uint8), np.array(y)
 
 def quick_train():
     """Quick training function"""
     print("Starting quick training...")
     
     # Generate data
+    report_memory("before generating")
     X, y = generate_quick_data()
     X = X.reshape(-1, 64, 64, 1)
+    report_memory("after generating", X)
     
     print(f"Training data shape: {X.shape}")
     print(f"Labels shape: {y.shape}")
@@ -122,22 +128,23 @@ def quick_train():
     model = create_simple_model()
     model.summary()
     
-    # Train model
+    # Train model on index splits of the uint8 data
     print("Training model...")
+    train_idx, val_idx = split_indices(y, test_size=0.2)
     history = model.fit(
-        X, y,
+        UInt8BatchSequence(X, y, train_idx, batch_size=32, shuffle=True),
         epochs=20,
-        batch_size=32,
-        validation_split=0.2,
+        validation_data=UInt8BatchSequence(X, y, val_idx, batch_size=32),
         verbose=1
     )
+    report_memory("after training", X)
     
     # Save model
     model.save('quick_model.h5')
     print("Model saved as 'quick_model.h5'")
     
-    # Convert to TensorFlow Lite
-    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    # Convert to TensorFlow Lite (takes the raw uint8 canvas)
+    converter = tf.lite.TFLiteConverter.from_keras_model(build_raw_input_model(model))
     tflite_model = converter.convert()
     
     with open('quick_model.tflite', 'wb') as f:
@@ -146,7 +153,7 @@ def quick_train():
     print("TensorFlow Lite model saved as 'quick_model.tflite'")
     
     # Test accuracy
-    test_loss, test_accuracy = model.evaluate(X, y, verbose=0)
+    test_loss, test_accuracy = model.evaluate(UInt8BatchSequence(X, y, batch_size=256), verbose=0)
     print(f"Final accuracy: {test_accuracy:.4f}")
     
     return model
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Recognition Result Cache
+Retried drawings and re-graded submissions repeat the exact same input. Results
+are cached under a fast hash of the input buffer plus the model version, in a
+bounded in-memory LRU with an optional SQLite tier on disk. Loading a new model
+artifact changes the version, so stale results are never returned.
+
+    python recognition_cache.py model.tflite     # hit/miss latency on repeated canvases
+    python recognition_cache.py japanese_character_model.bundle
+"""
+
+import os
+import sys
+import time
+import pickle
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def content_key(array, model_version=''):
+    """Digest of an input buffer, its shape/dtype and the model version
+
+    SHA-256 has hardware support on current x86 and ARM CPUs and hashes a
+    128x128 canvas faster than BLAKE2b or MD5 there; 128 bits of it are kept.
+    """
+    array = np.ascontiguousarray(array)
+    digest = hashlib.sha256(model_version.encode())
+    digest.update(f'{array.dtype.str}{array.shape}'.encode())
+    digest.update(array.data)
+    return digest.hexdigest()[:32]
+
+
+def model_version(source):
+    """Version string for a model artifact: a digest of its file (path) or bytes"""
+    digest = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray)):
+        digest.update(source)
+    else:
+        with open(source, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+class RecognitionCache:
+    """LRU cache of recognition results keyed by content_key()
+
+    max_entries bounds memory (results are small, fixed-size records). With
+    disk_path, evicted and new results also live in a SQLite file that
+    survives restarts; rows of older model versions are never looked up.
+    """
+
+    def __init__(self, max_entries=4096, disk_path=None):
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+        self.version = ''
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if disk_path:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS results '
+                             '(key TEXT PRIMARY KEY, version TEXT, value BLOB)')
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def set_model_version(self, version):
+        """Switch to a new model; the in-memory tier is dropped and the disk tier pruned"""
+        with self._lock:
+            if version == self.version:
+                return
+            self.version = version
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM results WHERE version != ?', (version,))
+                self._db.commit()
+
+    def key(self, array):
+        return content_key(array, self.version)
+
+    def get(self, key):
+        """Cached result or None"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            if self._db is not None:
+                row = self._db.execute('SELECT value FROM results WHERE key = ?',
+                                       (key,)).fetchone()
+                if row is not None:
+                    value = pickle.loads(row[0])
+                    self._insert(key, value)
+                    self.disk_hits += 1
+                    return value
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._insert(key, value)
+            if self._db is not None:
+                self._db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?)',
+                                 (key, self.version, pickle.dumps(value)))
+                self._db.commit()
+
+    def _insert(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_compute(self, array, compute):
+        """Result for an input buffer, running compute(array) only on a miss"""
+        key = self.key(array)
+        value = self.get(key)
+        if value is None:
+            value = compute(array)
+            self.put(key, value)
+        return value
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class CachedTFLiteRecognizer:
+    """Single-canvas TFLite recognition with a result cache
+
+    The model file is re-read (and the cache invalidated) whenever it changes
+    on disk, so deploying a new artifact never serves old results. A .bundle
+    path (model_bundle.py) is opened with its checksum and label checks.
+    """
+
+    def __init__(self, model_path, cache=None, num_threads=1):
+        self.model_path = model_path
+        self.num_threads = num_threads
+        self.cache = cache or RecognitionCache()
+        self._stat = None
+        self.load()
+
+    def load(self):
+        """(Re)load the model file and switch the cache to its version"""
+        import tensorflow as tf
+
+        if self.model_path.endswith('.bundle'):
+            from model_bundle import ModelBundle
+            with ModelBundle(self.model_path) as bundle:
+                self.labels = bundle.labels
+                self.interpreter = bundle.interpreter(self.num_threads)
+                version = bundle.model_version
+        else:
+            self.labels = None
+            self.interpreter = tf.lite.Interpreter(model_path=self.model_path,
+                                                   num_threads=self.num_threads)
+            self.interpreter.allocate_tensors()
+            version = model_version(self.model_path)
+        self._input = self.interpreter.get_input_details()[0]
+        self._output_index = self.interpreter.get_output_details()[0]['index']
+        stat = os.stat(self.model_path)
+        self._stat = (stat.st_mtime_ns, stat.st_size)
+        self.cache.set_model_version(version)
+
+    def _check_for_update(self):
+        stat = os.stat(self.model_path)
+        if (stat.st_mtime_ns, stat.st_size) != self._stat:
+            self.load()
+
+    def _invoke(self, canvas):
+        self.interpreter.set_tensor(self._input['index'],
+                                    canvas.reshape(self._input['shape']).astype(self._input['dtype']))
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self._output_index)[0].copy()
+
+    def predict(self, canvas):
+        """Class probabilities for one canvas (cached)"""
+        self._check_for_update()
+        return self.cache.get_or_compute(np.asarray(canvas), self._invoke)
+
+
+def main():
+    """Time cached against uncached recognition of repeated canvases"""
+    if len(sys.argv) < 2:
+        print("Usage: python recognition_cache.py model.tflite|model.bundle")
+        return
+
+    recognizer = CachedTFLiteRecognizer(sys.argv[1])
+    shape, dtype = recognizer._input['shape'], recognizer._input['dtype']
+    rng = np.random.default_rng(0)
+    canvases = [rng.integers(0, 256, shape, dtype=np.uint8).astype(dtype) for _ in range(50)]
+
+    for name in ('first pass (miss)', 'repeat (hit)'):
+        start = time.perf_counter()
+        for canvas in canvases:
+            recognizer.predict(canvas)
+        print(f"{name:>18}: {(time.perf_counter() - start) / len(canvases) * 1e6:9.1f} us per canvas")
+    print(recognizer.cache.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+"""
+Bulk Re-Scoring of a Realtime Database Export
+Stream-parses a local Firebase RTDB JSON export one user at a time, takes
+the drawings stored at users/{uid}/characterProgress/{characterId}/drawingPath
+and scores them with a TFLite model (or model bundle) in batches spread over a
+process pool. Results are written as compressed column shards (one record
+per drawing, one row per user) plus per-character totals. Memory stays
+bounded by one user object, one shard of result columns and the batches in
+flight. After every shard the byte offset of the next user is checkpointed,
+so an interrupted job resumes where it stopped.
+
+    python rtdb_scoring.py rtdb_export.json                         # japanese_character_model.bundle
+    python cli.py rescore rtdb_export.json --workers 4 --output rtdb_scores
+"""
+
+import os
+import re
+import io
+import sys
+import glob
+import json
+import time
+import base64
+import codecs
+from collections import deque
+
+import numpy as np
+
+from profiling import profiler
+
+BUNDLE_PATH = 'japanese_character_model.bundle'
+LABELS_PATH = 'japanese_character_labels.txt'
+OUTPUT_DIR = 'rtdb_scores'
+CHECKPOINT = 'checkpoint.json'
+CHUNK_SIZE = 1 << 20
+BATCH_SIZE = 256
+SHARD_RECORDS = 65536
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class _JSONCursor:
+    """Buffered position in a JSON file that knows its byte offset
+
+    Values are decoded whole with json's C decoder, reading more of the file
+    when one is cut off at the end of the buffer.
+    """
+
+    def __init__(self, f, offset=0, chunk_size=CHUNK_SIZE):
+        f.seek(offset)
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+        # Byte offset of buffer[mark]; text before the mark is never re-encoded
+        self.mark = 0
+        self.mark_offset = offset
+        self.eof = False
+
+    def _fill(self, size=None):
+        if self.pos > self.chunk_size:
+            self.offset()
+            self.buffer = self.buffer[self.pos:]
+            self.pos = self.mark = 0
+        data = self.f.read(size or self.chunk_size)
+        self.eof = not data
+        self.buffer += self.utf8.decode(data, final=self.eof)
+        return not self.eof
+
+    def offset(self):
+        """Byte offset of the current position"""
+        self.mark_offset += len(self.buffer[self.mark:self.pos].encode('utf-8'))
+        self.mark = self.pos
+        return self.mark_offset
+
+    def peek(self):
+        """Next non-whitespace character ('' at the end of the file)"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or not self._fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} at byte {self.offset()}, found {found!r}")
+        self.pos += 1
+
+    def value(self):
+        """Decode the JSON value at the current position"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A number running into the end of the buffer may continue
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # Grow geometrically so a large value is re-decoded only a few times
+            self._fill(max(self.chunk_size, len(self.buffer) - self.pos))
+
+
+def _enter(cursor, root):
+    """Move into the object holding the users; False when the export has none"""
+    cursor.expect('{')
+    if not root:
+        return True
+    while True:
+        char = cursor.peek()
+        if char == ',':
+            cursor.pos += 1
+            char = cursor.peek()
+        if char in ('}', ''):
+            return False
+        key = cursor.value()
+        cursor.expect(':')
+        if key == root and cursor.peek() == '{':
+            cursor.pos += 1
+            return True
+        cursor.value()
+
+
+def iter_users(path, root='users', offset=None, chunk_size=CHUNK_SIZE):
+    """(uid, user data, byte offset after the user) for every user in an export
+
+    root is the top-level key holding the users ('' when the file is the
+    users node itself). offset is a value yielded earlier: iteration resumes
+    with the next user.
+    """
+    with open(path, 'rb') as f:
+        cursor = _JSONCursor(f, offset or 0, chunk_size)
+        if offset is None and not _enter(cursor, root):
+            return
+        while True:
+            char = cursor.peek()
+            if char == ',':
+                cursor.pos += 1
+                char = cursor.peek()
+            if char in ('}', ''):
+                return
+            uid = cursor.value()
+            cursor.expect(':')
+            user = cursor.value()
+            yield uid, user, cursor.offset()
+
+
+def drawing_records(uid, user):
+    """Character attempts of one user that carry a drawing, and how many did not"""
+    progress = user.get('characterProgress') if isinstance(user, dict) else None
+    records, missing = [], 0
+    for character_id, entry in (progress or {}).items():
+        if not isinstance(entry, dict) or not isinstance(entry.get('drawingPath'), str):
+            missing += 1
+            continue
+        score = entry.get('scorePercent')
+        updated = entry.get('updatedAt', entry.get('lastPracticed'))
+        records.append({
+            'uid': uid,
+            'character': str(entry.get('characterId', character_id)),
+            'script': str(entry.get('script', entry.get('characterType', ''))),
+            'mark': str(entry.get('mark', '')),
+            'stored_score': int(score) if isinstance(score, (int, float)) else -1,
+            'updated_at': int(updated) if isinstance(updated, (int, float)) else 0,
+            'drawing': entry['drawingPath'],
+        })
+    return records, missing
+
+
+def decode_drawing(payload, size):
+    """Grayscale size x size canvas from a base64 PNG or data URL (None otherwise)
+
+    Paths into Cloud Storage cannot be resolved offline and come back as None.
+    """
+    from PIL import Image
+    if payload.startswith('data:'):
+        payload = payload.partition(',')[2]
+    try:
+        image = Image.open(io.BytesIO(base64.b64decode(payload, validate=True)))
+        image = image.convert('L').resize((size, size))
+    except Exception:
+        return None
+    return np.asarray(image, dtype=np.uint8)
+
+
+_scorers = {}
+
+
+def _load_scorer(model_path):
+    """TFLite interpreter and preprocessing spec, loaded once per worker"""
+    import tensorflow as tf
+    from model_bundle import ModelBundle, preprocessing_spec, tflite_signature
+    from parallel_workers import worker_cores
+
+    if model_path.endswith('.bundle'):
+        with ModelBundle(model_path) as bundle:
+            content = bytes(bundle.model)
+            spec = bundle.preprocessing
+    else:
+        with open(model_path, 'rb') as f:
+            content = f.read()
+        spec = preprocessing_spec(tflite_signature(content))
+    interpreter = tf.lite.Interpreter(model_content=content,
+                                      num_threads=len(worker_cores() or [0]))
+    return {'interpreter': interpreter, 'spec': spec, 'batch': None}
+
+
+def score_batch(model_path, payloads, expected):
+    """Decode and classify one batch of drawings (runs in a worker)
+
+    expected holds the label index of each attempted character (-1 when the
+    model does not know it). Returns the predicted index, its probability,
+    the probability of the attempted character and whether the drawing decoded.
+    """
+    if model_path not in _scorers:
+        _scorers[model_path] = _load_scorer(model_path)
+    scorer = _scorers[model_path]
+    spec, interpreter = scorer['spec'], scorer['interpreter']
+    size = spec['canvas_size']
+
+    canvases = np.full((len(payloads), size, size, 1), 255, dtype=np.uint8)
+    decoded = np.zeros(len(payloads), dtype=bool)
+    for i, payload in enumerate(payloads):
+        canvas = decode_drawing(payload, size)
+        if canvas is not None:
+            canvases[i, :, :, 0] = canvas
+            decoded[i] = True
+
+    input_details = interpreter.get_input_details()[0]
+    # Batches only change size at the end of a shard, so this rarely reallocates
+    if scorer['batch'] != len(payloads):
+        interpreter.resize_tensor_input(input_details['index'], canvases.shape)
+        interpreter.allocate_tensors()
+        scorer['batch'] = len(payloads)
+    inputs = canvases if spec['input_dtype'] == 'uint8' else \
+        canvases.astype(np.float32) * np.float32(spec['pixel_scale'])
+    interpreter.set_tensor(input_details['index'], inputs)
+    interpreter.invoke()
+    probabilities = interpreter.get_tensor(interpreter.get_output_details()[0]['index'])
+
+    rows = np.arange(len(payloads))
+    expected = np.asarray(expected, dtype=np.int64)
+    known = expected >= 0
+    return {
+        'predicted': np.where(decoded, probabilities.argmax(axis=1), -1).astype(np.int16),
+        'confidence': np.where(decoded, probabilities.max(axis=1), 0.0).astype(np.float32),
+        'expected_probability': np.where(decoded & known,
+                                         probabilities[rows, np.maximum(expected, 0)],
+                                         np.nan).astype(np.float32),
+        'decoded': decoded,
+    }
+
+
+def _source_signature(path):
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _write_json(path, data):
+    """Write through a temporary file so a crash never leaves half a checkpoint"""
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+
+
+class ShardWriter:
+    """Result columns of the current shard, user rows and per-character totals"""
+
+    def __init__(self, output_dir, labels, state):
+        self.output_dir = output_dir
+        self.labels = labels
+        self.state = state
+        self.columns = {name: [] for name in ('uid', 'character', 'script', 'mark',
+                                              'stored_score', 'updated_at')}
+        self.results = []
+
+    def __len__(self):
+        return len(self.columns['uid'])
+
+    def add(self, records):
+        for record in records:
+            for name, column in self.columns.items():
+                column.append(record[name])
+
+    def flush(self, offset):
+        """Write the shard and user rows, then checkpoint the next user's offset"""
+        shard = self.state['shards']
+        if len(self):
+            records = {
+                'uid': np.array(self.columns['uid']),
+                'character': np.array(self.columns['character']),
+                'script': np.array(self.columns['script']),
+                'mark': np.array(self.columns['mark']),
+                'stored_score': np.array(self.columns['stored_score'], dtype=np.int16),
+                'updated_at': np.array(self.columns['updated_at'], dtype=np.int64),
+            }
+            for name in self.results[0]:
+                records[name] = np.concatenate([result[name] for result in self.results])
+            recognized = records['decoded'] & (records['predicted'] >= 0)
+            records['recognized'] = recognized & (
+                np.array(self.labels + [''])[records['predicted']] == records['character'])
+
+            np.savez_compressed(os.path.join(self.output_dir, f'records-{shard:05d}.npz'),
+                                **records)
+            np.savez_compressed(os.path.join(self.output_dir, f'users-{shard:05d}.npz'),
+                                **self._user_rows(records))
+            self._update_characters(records)
+            self.state['shards'] = shard + 1
+            self.state['records'] += len(self)
+
+        self.state['offset'] = offset
+        _write_json(os.path.join(self.output_dir, CHECKPOINT), self.state)
+        self.columns = {name: [] for name in self.columns}
+        self.results = []
+
+    @staticmethod
+    def _user_rows(records):
+        """One row per user; a user's records are contiguous within a shard"""
+        uids, first, inverse = np.unique(records['uid'], return_index=True, return_inverse=True)
+        order = np.argsort(first)
+        # Map np.unique's sorted order back to the order users appear in
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        group = rank[inverse]
+        decoded = records['decoded']
+
+        def total(values):
+            return np.bincount(group, weights=values, minlength=len(uids))
+
+        attempts = np.bincount(group, minlength=len(uids))
+        scored = total(decoded.astype(np.float64))
+        return {
+            'uid': uids[order],
+            'attempts': attempts.astype(np.int32),
+            'decoded': scored.astype(np.int32),
+            'recognized': total(records['recognized'].astype(np.float64)).astype(np.int32),
+            'mean_confidence': (total(np.where(decoded, records['confidence'], 0.0))
+                                / np.maximum(scored, 1)).astype(np.float32),
+            'mean_stored_score': (total(np.maximum(records['stored_score'], 0).astype(np.float64))
+                                  / np.maximum(attempts, 1)).astype(np.float32),
+        }
+
+    def _update_characters(self, records):
+        totals = self.state['characters']
+        for i, character in enumerate(records['character'].tolist()):
+            row = totals.setdefault(character, [0, 0, 0, 0.0, 0])
+            row[0] += 1
+            if records['decoded'][i]:
+                row[1] += 1
+                row[2] += int(records['recognized'][i])
+                row[3] += float(records['confidence'][i])
+            row[4] += max(int(records['stored_score'][i]), 0)
+
+    def write_characters(self):
+        totals = self.state['characters']
+        characters = sorted(totals)
+        rows = np.array([totals[c] for c in characters], dtype=np.float64).reshape(-1, 5)
+        decoded = np.maximum(rows[:, 1], 1)
+        path = os.path.join(self.output_dir, 'characters.npz')
+        np.savez_compressed(
+            path,
+            character=np.array(characters, dtype=str),
+            attempts=rows[:, 0].astype(np.int64),
+            decoded=rows[:, 1].astype(np.int64),
+            recognition_rate=(rows[:, 2] / decoded).astype(np.float32),
+            mean_confidence=(rows[:, 3] / decoded).astype(np.float32),
+            mean_stored_score=(rows[:, 4] / np.maximum(rows[:, 0], 1)).astype(np.float32),
+        )
+        return path
+
+
+def _load_state(output_dir, export_path, model_version, restart):
+    """The checkpoint to resume from, or a fresh state (clearing old shards)"""
+    source = _source_signature(export_path)
+    path = os.path.join(output_dir, CHECKPOINT)
+    if not restart and os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if state['source'] == source and state['model_version'] == model_version:
+            return state
+        print("Export or model changed since the checkpoint; starting over")
+    # Only this job's outputs: the directory may hold unrelated .npz files
+    for pattern in ('records-*.npz', 'users-*.npz', 'characters.npz'):
+        for old in glob.glob(os.path.join(output_dir, pattern)):
+            os.remove(old)
+    return {'source': source, 'model_version': model_version, 'offset': None, 'shards': 0,
+            'records': 0, 'users': 0, 'without_drawing': 0, 'characters': {},
+            'complete': False}
+
+
+def score_export(export_path, model_path=BUNDLE_PATH, output_dir=OUTPUT_DIR,
+                 labels_path=LABELS_PATH, root='users', num_workers=1, batch_size=BATCH_SIZE,
+                 shard_records=SHARD_RECORDS, restart=False):
+    """Score every stored drawing of an RTDB export, resuming from the checkpoint"""
+    from model_bundle import ModelBundle, read_labels
+    from recognition_cache import model_version
+
+    if model_path.endswith('.bundle'):
+        with ModelBundle(model_path) as bundle:
+            labels, version = bundle.labels, bundle.model_version
+    else:
+        labels, version = read_labels(labels_path), model_version(model_path)
+    label_index = {label: i for i, label in enumerate(labels)}
+
+    os.makedirs(output_dir, exist_ok=True)
+    state = _load_state(output_dir, export_path, version, restart)
+    if state['complete']:
+        print(f"{export_path} was already scored into {output_dir}/ (pass restart=True to redo)")
+        return state
+    if state['offset'] is not None:
+        print(f"Resuming at byte {state['offset']:,} after {state['records']:,} records")
+
+    writer = ShardWriter(output_dir, labels, state)
+    pool = None
+    if num_workers > 1:
+        from parallel_workers import create_pool
+        pool = create_pool(num_workers)
+    in_flight = deque()
+    # Two batches per worker keep every process busy while bounding memory
+    max_in_flight = 2 * max(num_workers, 1)
+    batch = []
+    total_bytes = state['source']['size']
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    scored = 0
+    offset = state['offset']
+
+    def submit():
+        payloads = [record.pop('drawing') for record in batch]
+        expected = [label_index.get(record['character'], -1) for record in batch]
+        if pool is None:
+            in_flight.append(score_batch(model_path, payloads, expected))
+        else:
+            in_flight.append(pool.submit(score_batch, model_path, payloads, expected))
+        batch.clear()
+
+    def collect(limit):
+        while len(in_flight) > limit:
+            result = in_flight.popleft()
+            writer.results.append(result if pool is None else result.result())
+
+    try:
+        for uid, user, offset in iter_users(export_path, root, state['offset']):
+            records, missing = drawing_records(uid, user)
+            state['users'] += 1
+            state['without_drawing'] += missing
+            writer.add(records)
+            for record in records:
+                batch.append(record)
+                if len(batch) == batch_size:
+                    submit()
+                    collect(max_in_flight)
+            scored += len(records)
+
+            # Shards end on user boundaries, so the offset resumes at the next user
+            if len(writer) >= shard_records:
+                if batch:
+                    submit()
+                collect(0)
+                writer.flush(offset)
+                seconds = time.perf_counter() - start
+                print(f"Shard {state['shards'] - 1}: {state['records']:,} records, "
+                      f"{offset / max(total_bytes, 1):6.1%} of the export, "
+                      f"{scored / max(seconds, 1e-9):,.0f} records/s")
+
+        if batch:
+            submit()
+        collect(0)
+        state['complete'] = True
+        writer.flush(offset if offset is not None else total_bytes)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    characters_path = writer.write_characters()
+    profiler.add('rtdb_scoring', time.perf_counter() - start, time.process_time() - cpu_start,
+                 scored, start=start, category='inference')
+    print(f"Scored {state['records']:,} drawings from {state['users']:,} users "
+          f"({state['without_drawing']:,} attempts without a drawing)")
+    print(f"Results in {output_dir}/: records-*.npz, users-*.npz, {os.path.basename(characters_path)}")
+    return state
+
+
+def main():
+    """Re-score the drawings in an RTDB export"""
+    if len(sys.argv) < 2:
+        print("Usage: python rtdb_scoring.py rtdb_export.json [model.bundle|model.tflite] [workers]")
+        return
+    model_path = sys.argv[2] if len(sys.argv) > 2 else BUNDLE_PATH
+    num_workers = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    score_export(sys.argv[1], model_path, num_workers=num_workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,48 +5,40 @@ Run this to quickly train a model with synthetic data
 """
 
 import os
-import sys
-import subprocess
+import importlib.util
+
+import cli
+
+REQUIRED_PACKAGES = ['tensorflow', 'numpy', 'matplotlib', 'sklearn', 'cv2', 'PIL']
 
 def check_requirements():
-    """Check if required packages are installed"""
-    try:
-        import tensorflow as tf
-        import numpy as np
-        import matplotlib.pyplot as plt
-        import sklearn
-        import cv2
-        from PIL import Image
-        print("✅ All required packages are installed!")
-        return True
-    except ImportError as e:
-        print(f"❌ Missing package: {e}")
+    """Check if required packages are installed (without importing them)"""
+    missing = [name for name in REQUIRED_PACKAGES if importlib.util.find_spec(name) is None]
+    if missing:
+        print(f"❌ Missing packages: {', '.join(missing)}")
         print("Please install requirements: pip install -r requirements.txt")
         return False
+    print("✅ All required packages are installed!")
+    return True
 
 def run_quick_training():
     """Run quick training with synthetic data"""
     print("🚀 Starting quick training...")
     
     try:
-        # Run the quick training script
-        result = subprocess.run([sys.executable, 'quick_train.py'], 
-                              capture_output=True, text=True)
+        # Train in this process so progress streams as it happens
+        cli.main(['train', '--quick'])
         
-        if result.returncode == 0:
-            print("✅ Training completed successfully!")
-            print("📁 Model files created:")
-            print("   - quick_model.h5 (Keras model)")
-            print("   - quick_model.tflite (TensorFlow Lite model)")
-            print("\n🎯 Next steps:")
-            print("   1. Copy quick_model.tflite to assets/models/ in your Flutter project")
-            print("   2. Hot restart your Flutter app")
-            print("   3. Test the recognition accuracy!")
-        else:
-            print("❌ Training failed:")
-            print(result.stderr)
+        print("✅ Training completed successfully!")
+        print("📁 Model files created:")
+        print("   - quick_model.h5 (Keras model)")
+        print("   - quick_model.tflite (TensorFlow Lite model)")
+        print("\n🎯 Next steps:")
+        print("   1. Copy quick_model.tflite to assets/models/ in your Flutter project")
+        print("   2. Hot restart your Flutter app")
+        print("   3. Test the recognition accuracy!")
             
-    except Exception as e:
+    except (Exception, SystemExit) as e:
         print(f"❌ Error running training: {e}")
 
 def run_full_training():
@@ -60,21 +52,16 @@ def run_full_training():
         return
     
     try:
-        # Run the full training script
-        result = subprocess.run([sys.executable, 'train_japanese_model.py'], 
-                              capture_output=True, text=True)
+        # Train in this process so progress streams as it happens
+        cli.main(['train', 'training_data_export.json'])
         
-        if result.returncode == 0:
-            print("✅ Full training completed successfully!")
-            print("📁 Model files created:")
-            print("   - best_model.h5 (Keras model)")
-            print("   - japanese_character_model.tflite (TensorFlow Lite model)")
-            print("   - training_history.png (Training graphs)")
-        else:
-            print("❌ Training failed:")
-            print(result.stderr)
+        print("✅ Full training completed successfully!")
+        print("📁 Model files created:")
+        print("   - best_model.h5 (Keras model)")
+        print("   - japanese_character_model.tflite (TensorFlow Lite model)")
+        print("   - training_history.png (Training graphs)")
             
-    except Exception as e:
+    except (Exception, SystemExit) as e:
         print(f"❌ Error running training: {e}")
 
 def main():
@@ -99,7 +86,7 @@ def main():
         run_full_training()
     elif choice == '3':
         print("🚀 Generating synthetic data...")
-        subprocess.run([sys.executable, 'collect_training_data.py'])
+        cli.main(['generate'])
     else:
         print("❌ Invalid choice!")
 
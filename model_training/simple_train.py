@@ -2,23 +2,41 @@
 """
 Simple Japanese Character Recognition WITHOUT TensorFlow
 Uses scikit-learn for basic ML training
+
+    python simple_train.py              # train and save simple_japanese_model.pkl
+    python simple_train.py compare      # fit time, latency, size: RF, parallel RF, warm start, HGB, HGB refit
 """
 
 import os
+import sys
 import json
+import time
 import numpy as np
-from sklearn.ensemble import RandomForestClassifier
+from sklearn.ensemble import HistGradientBoostingClassifier, RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, classification_report
 import pickle
 from PIL import Image
 import base64
 import io
+import uuid
 import random
 
+from recognition_cache import RecognitionCache, model_version
+
+CLASSIFIERS = ('random_forest', 'hist_gradient_boosting')
+
 class SimpleJapaneseRecognizer:
-    def __init__(self):
+    def __init__(self, classifier='random_forest', n_jobs=None):
+        if classifier not in CLASSIFIERS:
+            raise ValueError(f"Unknown classifier {classifier!r} (choose from {', '.join(CLASSIFIERS)})")
+        # Repeated feature vectors skip inference; keyed on the model version
+        self.cache = RecognitionCache()
         self.model = None
+        self.classifier = classifier
+        # Cores used to fit the Random Forest (-1: all of them); the trees,
+        # and so the predictions, are the same for any value
+        self.n_jobs = n_jobs
         self.characters = [
             'あ', 'い', 'う', 'え', 'お',
             'か', 'き', 'く', 'け', 'こ',
@@ -33,10 +51,26 @@ class SimpleJapaneseRecognizer:
         ]
         self.character_to_index = {char: i for i, char in enumerate(self.characters)}
     
-    def generate_simple_data(self, num_samples_per_char=100):
-        """Generate simple training data"""
+    @property
+    def model(self):
+        return self._model
+    
+    @model.setter
+    def model(self, model):
+        """Any model assigned here gets a fresh cache version"""
+        self._model = model
+        self._new_cache_version()
+    
+    def _new_cache_version(self):
+        # Cheap and unique; fitted models have no file to digest
+        self.cache.set_model_version(uuid.uuid4().hex[:16])
+    
+    def generate_simple_data(self, num_samples_per_char=100, seed=None):
+        """Generate simple training data (reproducible when a seed is given)"""
         print("🎨 Generating simple training data...")
         
+        rng = random.Random(seed) if seed is not None else random
+        
         X = []
         y = []
         
@@ -45,13 +79,13 @@ class SimpleJapaneseRecognizer:
             
             for _ in range(num_samples_per_char):
                 # Create simple features based on character
-                features = self.create_character_features(char)
+                features = self.create_character_features(char, rng)
                 X.append(features)
                 y.append(self.character_to_index[char])
         
         return np.array(X), np.array(y)
     
-    def create_character_features(self, character):
+    def create_character_features(self, character, rng=random):
         """Create simple features for a character"""
         # Simple feature extraction based on character properties
         features = []
@@ -63,18 +97,49 @@ class SimpleJapaneseRecognizer:
         for i in range(64):  # 64 features (like 8x8 image)
             if i < 10:
                 # First 10 features are character-specific
-                base_value = char_index * 0.1 + random.uniform(-0.1, 0.1)
+                base_value = char_index * 0.1 + rng.uniform(-0.1, 0.1)
             else:
                 # Rest are random variations
-                base_value = random.uniform(0, 1)
+                base_value = rng.uniform(0, 1)
             
             features.append(base_value)
         
         return features
     
+    def create_classifier(self):
+        """Create the classifier used by train_model"""
+        if self.classifier == 'hist_gradient_boosting':
+            return HistGradientBoostingClassifier(
+                max_iter=100,
+                max_leaf_nodes=15,
+                # Holds out 10% for validation only above 10000 samples; a
+                # smaller split can have fewer samples than characters
+                early_stopping='auto',
+                random_state=42
+            )
+        return RandomForestClassifier(
+            n_estimators=100,
+            random_state=42,
+            max_depth=10,
+            n_jobs=self.n_jobs
+        )
+    
+    def _fitted(self):
+        """Finish a fit: serial single-row predictions and a new cache version
+
+        fit() changes the model in place, so the setter has not seen it.
+        """
+        if isinstance(self.model, RandomForestClassifier):
+            # Dispatching one row to a thread pool costs more than predicting it
+            self.model.set_params(n_jobs=None)
+        self._new_cache_version()
+    
     def train_model(self, X, y):
-        """Train a simple Random Forest model"""
-        print("🌲 Training Random Forest model...")
+        """Train a simple Random Forest (or gradient boosting) model"""
+        if self.classifier == 'hist_gradient_boosting':
+            print("🌲 Training histogram gradient boosting model...")
+        else:
+            print(f"🌲 Training Random Forest model (n_jobs={self.n_jobs})...")
         
         # Split data
         X_train, X_test, y_train, y_test = train_test_split(
@@ -82,13 +147,9 @@ class SimpleJapaneseRecognizer:
         )
         
         # Train model
-        self.model = RandomForestClassifier(
-            n_estimators=100,
-            random_state=42,
-            max_depth=10
-        )
-        
+        self.model = self.create_classifier()
         self.model.fit(X_train, y_train)
+        self._fitted()
         
         # Evaluate
         y_pred = self.model.predict(X_test)
@@ -103,6 +164,33 @@ class SimpleJapaneseRecognizer:
         
         return accuracy
     
+    def add_trees(self, X, y, count=25):
+        """Grow count more Random Forest trees on new data, keeping the existing ones
+
+        Much cheaper than refitting on all data as it grows. The new data must
+        cover the same characters, since the existing trees vote over them.
+        Gradient boosting has to be refit on the old and new data together:
+        a warm-started fit rebins the features on the new data, and the
+        existing trees' thresholds no longer match the new bins.
+        """
+        if self.model is None:
+            raise ValueError("Train or load a model before adding trees")
+        if not isinstance(self.model, RandomForestClassifier):
+            raise ValueError(f"add_trees only grows Random Forests; refit "
+                             f"{type(self.model).__name__} on the old and new data with train_model")
+        missing = np.setdiff1d(self.model.classes_, np.unique(y))
+        if len(missing):
+            raise ValueError(f"New data is missing {len(missing)} of the model's characters")
+        
+        before = len(self.model.estimators_)
+        self.model.set_params(warm_start=True, n_estimators=before + count,
+                              n_jobs=self.n_jobs)
+        self.model.fit(X, y)
+        added = len(self.model.estimators_) - before
+        self._fitted()
+        print(f"🌱 Added {added} trees on {len(y)} new samples")
+        return self.model
+    
     def save_model(self, filename='simple_japanese_model.pkl'):
         """Save the trained model"""
         if self.model is not None:
@@ -112,16 +200,99 @@ class SimpleJapaneseRecognizer:
         else:
             print("❌ No model to save!")
     
+    def load_model(self, filename='simple_japanese_model.pkl'):
+        """Load a saved model; cached predictions of the previous model are dropped"""
+        with open(filename, 'rb') as f:
+            data = f.read()
+        self.model = pickle.loads(data)
+        self.cache.set_model_version(model_version(data))
+        print(f"📂 Model loaded from: {filename}")
+    
     def predict_character(self, features):
-        """Predict character from features"""
+        """Predict character from features (repeated inputs come from the cache)"""
         if self.model is not None:
-            prediction = self.model.predict([features])[0]
-            confidence = self.model.predict_proba([features])[0].max()
-            return self.characters[prediction], confidence
+            return self.cache.get_or_compute(np.asarray(features, dtype=np.float64),
+                                             self._predict_uncached)
         return 'あ', 0.5
+    
+    def _predict_uncached(self, features):
+        probabilities = self.model.predict_proba(features[None, :])[0]
+        prediction = int(probabilities.argmax())
+        return self.characters[self.model.classes_[prediction]], float(probabilities[prediction])
+
+def _prediction_costs(model, X, repeats=50):
+    """Median single-row latency (ms) and batch throughput (rows/s) of predict_proba"""
+    timings = np.empty(repeats)
+    for i in range(repeats):
+        row = X[i % len(X)][None, :]
+        start = time.perf_counter()
+        model.predict_proba(row)
+        timings[i] = time.perf_counter() - start
+    start = time.perf_counter()
+    model.predict_proba(X)
+    return float(np.median(timings) * 1000), len(X) / (time.perf_counter() - start)
+
+def compare_classifiers(num_samples_per_char=50, new_fraction=0.2, seed=42):
+    """Fit time, predict latency, size and accuracy of each training option
+
+    The update rows train on the older (1 - new_fraction) of the data and
+    then take in the newest part: the forest grows 25 trees on it, gradient
+    boosting (which cannot warm start on new data) refits on everything.
+    Their fit time is that update step.
+    """
+    recognizer = SimpleJapaneseRecognizer()
+    X, y = recognizer.generate_simple_data(num_samples_per_char, seed=seed)
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=42, stratify=y
+    )
+    X_old, X_new, y_old, y_new = train_test_split(
+        X_train, y_train, test_size=new_fraction, random_state=42, stratify=y_train
+    )
+    
+    rows = []
+    for name, classifier, n_jobs in (('random_forest', 'random_forest', None),
+                                     ('random_forest_parallel', 'random_forest', -1),
+                                     ('random_forest_warm_start', 'random_forest', -1),
+                                     ('hist_gradient_boosting', 'hist_gradient_boosting', None),
+                                     ('hist_gradient_boosting_refit', 'hist_gradient_boosting', None)):
+        recognizer = SimpleJapaneseRecognizer(classifier, n_jobs)
+        if name.endswith('warm_start'):
+            recognizer.model = recognizer.create_classifier().fit(X_old, y_old)
+            start = time.perf_counter()
+            recognizer.add_trees(X_new, y_new)
+        elif name.endswith('refit'):
+            recognizer.model = recognizer.create_classifier().fit(X_old, y_old)
+            start = time.perf_counter()
+            recognizer.model = recognizer.create_classifier().fit(
+                np.concatenate([X_old, X_new]), np.concatenate([y_old, y_new]))
+            recognizer._fitted()
+        else:
+            start = time.perf_counter()
+            recognizer.model = recognizer.create_classifier().fit(X_train, y_train)
+            recognizer._fitted()
+        fit_seconds = time.perf_counter() - start
+        latency_ms, rows_per_second = _prediction_costs(recognizer.model, X_test)
+        rows.append({
+            'classifier': name,
+            'fit_s': fit_seconds,
+            'latency_ms': latency_ms,
+            'rows_per_s': rows_per_second,
+            'size_kb': len(pickle.dumps(recognizer.model)) / 1024.0,
+            'accuracy': float(accuracy_score(y_test, recognizer.model.predict(X_test))),
+        })
+    
+    print(f"\n{'classifier':<30} {'fit s':>7} {'1-row ms':>9} {'rows/s':>9} {'size KB':>8} {'accuracy':>9}")
+    for row in rows:
+        print(f"{row['classifier']:<30} {row['fit_s']:>7.2f} {row['latency_ms']:>9.2f} "
+              f"{row['rows_per_s']:>9.0f} {row['size_kb']:>8.0f} {row['accuracy']:>9.3f}")
+    return rows
 
 def main():
     """Main training function"""
+    if len(sys.argv) > 1 and sys.argv[1] == 'compare':
+        compare_classifiers()
+        return
+    
     print("🇯🇵 Simple Japanese Character Recognition")
     print("=" * 50)
     
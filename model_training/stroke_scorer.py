@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Stroke Order and Shape Scorer
+Parses the AnimCJK stroke median paths in assets/HiraganaSVG and
+assets/KatakanaSVG once into resampled NumPy arrays and scores handwritten
+stroke sequences against them in batches: stroke count, stroke order,
+stroke direction and shape (DTW and discrete Frechet distance computed with
+wavefront-vectorized dynamic programming)
+
+    python stroke_scorer.py                       # self-check and timing
+    python stroke_scorer.py submissions.json      # score [{"character", "strokes"}]
+    python cli.py recognize drawings.json         # top matches for [{"strokes"}]
+"""
+
+import os
+import re
+import sys
+import json
+import glob
+import time
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'assets')
+SVG_DIRS = [os.path.join(ASSETS_DIR, 'HiraganaSVG'), os.path.join(ASSETS_DIR, 'KatakanaSVG')]
+TEMPLATE_CACHE = 'stroke_templates.npz'
+SVG_NAMESPACE = '{http://www.w3.org/2000/svg}'
+VIEWBOX = 1024.0
+
+# Several asset files (1_a_hira.svg, 4_tsu_kata.svg, ...) hold the AnimCJK
+# small-kana glyph. The app shows them for the full-size kana, and the
+# strokes are the same once normalized, so they are stored under the
+# full-size character (one code point higher).
+SMALL_KANA = 'ぁぃぅぇぉっゃゅょゎァィゥェォッャュョヮ'
+
+POINTS_PER_STROKE = 32
+# Mean DTW deviation (in units of the character box) that scores zero shape
+SHAPE_TOLERANCE = 0.25
+SCORE_WEIGHTS = {'shape': 0.5, 'count': 0.2, 'order': 0.15, 'direction': 0.15}
+
+
+def parse_polyline(d):
+    """Points of an absolute M/L/H/V path (the only commands median paths use)"""
+    points = []
+    command = 'L'
+    tokens = re.findall(r'[MLHV]|-?\d+(?:\.\d+)?', d.upper())
+    i = 0
+    while i < len(tokens):
+        if tokens[i] in 'MLHV':
+            command = tokens[i]
+            i += 1
+            continue
+        if command == 'H':
+            points.append((float(tokens[i]), points[-1][1]))
+            i += 1
+        elif command == 'V':
+            points.append((points[-1][0], float(tokens[i])))
+            i += 1
+        else:
+            points.append((float(tokens[i]), float(tokens[i + 1])))
+            i += 2
+    return np.array(points, dtype=np.float32)
+
+
+def parse_median_paths(svg_path):
+    """Character and stroke median polylines (in viewBox units) from an AnimCJK SVG"""
+    root = ET.parse(svg_path).getroot()
+    character = chr(int(root.get('id').lstrip('z')))
+    if character in SMALL_KANA:
+        character = chr(ord(character) + 1)
+
+    strokes = {}
+    # Median paths are the clipped ones; the id'd paths are the filled outlines.
+    # Strokes that cross themselves are split into clips c<n>a, c<n>b, ...
+    # whose later parts are animation helpers; only the first is the median.
+    for path in root.iter(f'{SVG_NAMESPACE}path'):
+        clip = re.search(r'c(\d+)[a-z]?\)', path.get('clip-path') or '')
+        if clip and int(clip.group(1)) not in strokes:
+            strokes[int(clip.group(1))] = parse_polyline(path.get('d'))
+    return character, [strokes[number] for number in sorted(strokes)]
+
+
+def resample(points, n=POINTS_PER_STROKE):
+    """n points evenly spaced by arc length along a polyline"""
+    points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+    segment = np.linalg.norm(np.diff(points, axis=0), axis=1)
+    distance = np.concatenate(([0.0], np.cumsum(segment)))
+    if distance[-1] <= 0:
+        # A tap (or a single point) stays a point
+        return np.repeat(points[:1], n, axis=0)
+    targets = np.linspace(0.0, distance[-1], n)
+    return np.stack([np.interp(targets, distance, points[:, 0]),
+                     np.interp(targets, distance, points[:, 1])], axis=1).astype(np.float32)
+
+
+def normalize_strokes(strokes):
+    """Center a character's strokes on its bounding box and scale the longer side to 1"""
+    points = np.concatenate([s.reshape(-1, 2) for s in strokes])
+    low, high = points.min(axis=0), points.max(axis=0)
+    scale = max(float((high - low).max()), 1e-6)
+    center = (low + high) / 2.0
+    return [(s - center) / scale for s in strokes]
+
+
+def build_templates(svg_dirs=SVG_DIRS, n=POINTS_PER_STROKE):
+    """Parse every SVG into {character: (strokes, n, 2) array}"""
+    templates = {}
+    for directory in svg_dirs:
+        for svg_path in sorted(glob.glob(os.path.join(directory, '*.svg'))):
+            character, strokes = parse_median_paths(svg_path)
+            if strokes:
+                templates[character] = np.stack(
+                    [resample(s, n) for s in normalize_strokes(strokes)])
+    return templates
+
+
+def load_templates(cache_path=TEMPLATE_CACHE, svg_dirs=SVG_DIRS, n=POINTS_PER_STROKE):
+    """Templates from the .npz cache, re-parsing the SVGs when they are newer"""
+    svg_files = [f for d in svg_dirs for f in glob.glob(os.path.join(d, '*.svg'))]
+    newest = max((os.path.getmtime(f) for f in svg_files), default=0.0)
+    if cache_path and os.path.exists(cache_path) and os.path.getmtime(cache_path) >= newest:
+        with np.load(cache_path) as data:
+            if int(data['points_per_stroke']) == n:
+                characters = json.loads(str(data['characters']))
+                return {c: data[f't{i}'] for i, c in enumerate(characters)}
+
+    templates = build_templates(svg_dirs, n)
+    if cache_path:
+        characters = list(templates)
+        np.savez(cache_path, characters=np.array(json.dumps(characters, ensure_ascii=False)),
+                 points_per_stroke=np.array(n),
+                 **{f't{i}': templates[c] for i, c in enumerate(characters)})
+    return templates
+
+
+def _wavefront(cost, combine):
+    """Fill a (batch, n, m) DP table one anti-diagonal at a time
+
+    Cells on an anti-diagonal only depend on the previous two, so each
+    diagonal is one vectorized update over the whole batch.
+    """
+    batch, n, m = cost.shape
+    table = np.full((batch, n + 1, m + 1), np.inf, dtype=np.float32)
+    table[:, 0, 0] = 0.0
+    for k in range(2, n + m + 1):
+        i = np.arange(max(1, k - m), min(n, k - 1) + 1)
+        j = k - i
+        best = np.minimum(np.minimum(table[:, i - 1, j], table[:, i, j - 1]),
+                          table[:, i - 1, j - 1])
+        table[:, i, j] = combine(cost[:, i - 1, j - 1], best)
+    return table[:, n, m]
+
+
+def pairwise_cost(a, b):
+    """Point-to-point distances between two batches of polylines: (batch, n, m)"""
+    return np.linalg.norm(a[:, :, None, :] - b[:, None, :, :], axis=-1)
+
+
+def dtw_distance(a, b):
+    """Mean DTW alignment cost for each pair of polylines in the batch"""
+    a, b = np.asarray(a, np.float32), np.asarray(b, np.float32)
+    return _wavefront(pairwise_cost(a, b), np.add) / (a.shape[1] + b.shape[1])
+
+
+def frechet_distance(a, b):
+    """Discrete Frechet distance for each pair of polylines in the batch"""
+    a, b = np.asarray(a, np.float32), np.asarray(b, np.float32)
+    return _wavefront(pairwise_cost(a, b), np.maximum)
+
+
+class StrokeScorer:
+    """Scores handwritten strokes against the AnimCJK median templates"""
+
+    def __init__(self, templates=None, points_per_stroke=POINTS_PER_STROKE):
+        self.points_per_stroke = points_per_stroke
+        self.templates = templates if templates is not None else load_templates(n=points_per_stroke)
+        self._candidate_index = None
+
+    @property
+    def candidate_index(self):
+        """Stroke-count and aspect index over the templates, built on first use"""
+        if self._candidate_index is None:
+            from candidate_index import template_index
+            self._candidate_index = template_index(self)
+        return self._candidate_index
+
+    def stroke_count(self, character):
+        """Expected number of strokes (None for unknown characters)"""
+        template = self.templates.get(character)
+        return None if template is None else len(template)
+
+    def prepare(self, strokes):
+        """Normalize and resample user strokes given as lists of (x, y) points"""
+        strokes = [np.asarray(s, dtype=np.float32).reshape(-1, 2) for s in strokes if len(s)]
+        if not strokes:
+            return np.zeros((0, self.points_per_stroke, 2), dtype=np.float32)
+        return np.stack([resample(s, self.points_per_stroke) for s in normalize_strokes(strokes)])
+
+    def score(self, character, strokes):
+        """Score one submission"""
+        return self.score_batch([(character, strokes)])[0]
+
+    def recognize(self, strokes, candidates=None, k=5, prune=True):
+        """Best-scoring characters for one drawing
+
+        Without explicit candidates only the templates the candidate index
+        keeps for the drawing's stroke count and aspect are scored (every
+        template with prune=False).
+        """
+        if candidates is None:
+            drawn = [s for s in strokes if len(s)]
+            if prune and drawn:
+                from candidate_index import stroke_aspect
+                candidates = self.candidate_index.candidates(len(drawn), stroke_aspect(drawn))
+            else:
+                candidates = list(self.templates)
+        candidates = [c for c in candidates if c in self.templates]
+        results = self.score_batch([(c, strokes) for c in candidates])
+        ranked = sorted((r['score'], c) for c, r in zip(candidates, results) if 'score' in r)
+        return [(c, score) for score, c in ranked[::-1][:k]]
+
+    def score_batch(self, submissions):
+        """Score many (character, strokes) submissions with one set of array passes"""
+        results = [None] * len(submissions)
+        users, refs = [], []
+        for k, (character, strokes) in enumerate(submissions):
+            template = self.templates.get(character)
+            user = self.prepare(strokes)
+            if template is None:
+                results[k] = {'character': character, 'error': 'no stroke template'}
+            elif len(user) == 0:
+                results[k] = {'character': character, 'error': 'no strokes'}
+            else:
+                users.append((k, user))
+                refs.append(template)
+        if not users:
+            return results
+
+        n = self.points_per_stroke
+        max_strokes = max(max(len(u) for _, u in users), max(len(t) for t in refs))
+        count = len(users)
+
+        # Pad every submission and template to the same stroke count
+        user_array = np.zeros((count, max_strokes, n, 2), dtype=np.float32)
+        ref_array = np.zeros((count, max_strokes, n, 2), dtype=np.float32)
+        user_counts = np.array([len(u) for _, u in users])
+        ref_counts = np.array([len(t) for t in refs])
+        for row, ((_, user), template) in enumerate(zip(users, refs)):
+            user_array[row, :len(user)] = user
+            ref_array[row, :len(template)] = template
+        slots = np.arange(max_strokes)
+        user_valid = slots[None, :] < user_counts[:, None]
+        ref_valid = slots[None, :] < ref_counts[:, None]
+
+        # Order: which template stroke each user stroke resembles most
+        # (mean point distance over all user x template stroke pairs)
+        pair = np.linalg.norm(user_array[:, :, None] - ref_array[:, None, :], axis=-1).mean(axis=-1)
+        pair = np.where(ref_valid[:, None, :], pair, np.inf)
+        nearest = pair.argmin(axis=2)
+
+        # Shape and direction on the aligned pairs (user stroke i vs template stroke i)
+        aligned = user_valid & ref_valid
+        rows, cols = np.nonzero(aligned)
+        user_strokes = user_array[rows, cols]
+        ref_strokes = ref_array[rows, cols]
+        dtw = dtw_distance(user_strokes, ref_strokes)
+        frechet = frechet_distance(user_strokes, ref_strokes)
+        forward = np.linalg.norm(user_strokes - ref_strokes, axis=-1).mean(axis=1)
+        backward = np.linalg.norm(user_strokes - ref_strokes[:, ::-1], axis=-1).mean(axis=1)
+        reversed_stroke = backward < forward
+
+        for row, (k, _) in enumerate(users):
+            character = submissions[k][0]
+            mine = rows == row
+            drawn, expected = int(user_counts[row]), int(ref_counts[row])
+            matched = int(mine.sum())
+
+            shape = float(np.clip(1.0 - dtw[mine] / SHAPE_TOLERANCE, 0.0, 1.0).mean())
+            count_score = max(0.0, 1.0 - abs(drawn - expected) / expected)
+            in_order = nearest[row, :matched] == np.arange(matched)
+            order = float(in_order.mean())
+            direction = float(1.0 - reversed_stroke[mine].mean())
+            parts = {'shape': shape, 'count': count_score, 'order': order,
+                     'direction': direction}
+            total = sum(SCORE_WEIGHTS[name] * value for name, value in parts.items())
+
+            results[k] = {
+                'character': character,
+                'score': round(100.0 * total, 1),
+                'components': {name: round(value, 3) for name, value in parts.items()},
+                'strokes_drawn': drawn,
+                'strokes_expected': expected,
+                'strokes': [
+                    {
+                        'dtw': float(d), 'frechet': float(f),
+                        'reversed': bool(r), 'in_order': bool(o),
+                    }
+                    for d, f, r, o in zip(dtw[mine], frechet[mine], reversed_stroke[mine],
+                                          in_order)
+                ],
+            }
+        return results
+
+
+def _self_check(scorer):
+    """Score the templates against themselves and distorted copies, with timing"""
+    rng = np.random.default_rng(0)
+    characters = sorted(scorer.templates)
+    perfect = [(c, [s * 400 + 200 for s in scorer.templates[c]]) for c in characters]
+    noisy = [(c, [s * 400 + 200 + rng.normal(0, 6, s.shape) for s in scorer.templates[c]])
+             for c in characters]
+    reversed_order = [(c, strokes[::-1]) for c, strokes in perfect]
+    backwards = [(c, [s[::-1] for s in strokes]) for c, strokes in perfect]
+
+    for name, batch in (('exact', perfect), ('noisy', noisy),
+                        ('reversed order', reversed_order), ('drawn backwards', backwards)):
+        start = time.perf_counter()
+        results = scorer.score_batch(batch)
+        seconds = time.perf_counter() - start
+        scores = [r['score'] for r in results]
+        print(f"{name:>16}: mean score {np.mean(scores):5.1f} "
+              f"({len(batch)} submissions, {seconds / len(batch) * 1000:.2f} ms each)")
+
+
+def main():
+    """Score submissions from a JSON file, or run the self-check"""
+    scorer = StrokeScorer()
+    print(f"Loaded stroke templates for {len(scorer.templates)} characters")
+
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'r', encoding='utf-8') as f:
+            submissions = [(s['character'], s['strokes']) for s in json.load(f)]
+        for result in scorer.score_batch(submissions):
+            print(json.dumps(result, ensure_ascii=False))
+    else:
+        _self_check(scorer)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,11 +3,56 @@
 Test the trained model to verify it's working correctly
 """
 
+import os
 import pickle
 import json
+import time
 import numpy as np
 from simple_train import SimpleJapaneseRecognizer
 
+# Frozen evaluation set, generated once and memory-mapped on every run
+EVAL_DIR = 'eval_data'
+EVAL_SEED = 1234
+EVAL_SAMPLES_PER_CHAR = 100
+
+def load_eval_set(eval_dir=EVAL_DIR, seed=EVAL_SEED, num_samples_per_char=EVAL_SAMPLES_PER_CHAR):
+    """Load the frozen evaluation set, building it on first use"""
+    recognizer = SimpleJapaneseRecognizer()
+    features_path = os.path.join(eval_dir, 'features.npy')
+    labels_path = os.path.join(eval_dir, 'labels.npy')
+    meta_path = os.path.join(eval_dir, 'meta.json')
+    
+    expected = {
+        'seed': seed,
+        'num_samples_per_char': num_samples_per_char,
+        'characters': recognizer.characters,
+    }
+    
+    meta = None
+    if os.path.exists(meta_path):
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    
+    if meta != expected:
+        print(f"🧊 Building frozen evaluation set in {eval_dir}/ (seed {seed})...")
+        os.makedirs(eval_dir, exist_ok=True)
+        X, y = recognizer.generate_simple_data(num_samples_per_char, seed=seed)
+        np.save(features_path, X.astype(np.float32))
+        np.save(labels_path, y.astype(np.int32))
+        # Metadata goes last so an interrupted build is rebuilt next time
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(expected, f, ensure_ascii=False)
+    
+    return np.load(features_path, mmap_mode='r'), np.load(labels_path, mmap_mode='r')
+
+def score_model(model, X, y, batch_size=4096):
+    """Accuracy over the evaluation set, predicted in fixed-size chunks"""
+    correct = 0
+    for start in range(0, len(y), batch_size):
+        predictions = model.predict(X[start:start + batch_size])
+        correct += int((predictions == y[start:start + batch_size]).sum())
+    return correct / len(y)
+
 def test_model():
     """Test the trained model"""
     print("🧪 Testing the trained model...")
@@ -19,7 +64,7 @@ def test_model():
         print("✅ Model loaded successfully!")
     except FileNotFoundError:
         print("❌ Model not found. Training first...")
-        recognizer = SimpleJapaneseRecognizer()
+        recognizer = SimpleJapaneseRecognizer(n_jobs=-1)
         X, y = recognizer.generate_simple_data(num_samples_per_char=50)
         recognizer.train_model(X, y)
         recognizer.save_model()
@@ -45,19 +90,30 @@ def test_model():
         
         print(f"   {char} -> {predicted_char} (confidence: {confidence:.3f})")
     
+    # Score on the same frozen samples every run
+    X_eval, y_eval = load_eval_set()
+    start = time.perf_counter()
+    accuracy = score_model(model, X_eval, y_eval)
+    elapsed = time.perf_counter() - start
+    
     print(f"\n📊 Model Statistics:")
-    print(f"   - Accuracy: {model.score(recognizer.generate_simple_data()[0], recognizer.generate_simple_data()[1]):.3f}")
+    print(f"   - Accuracy: {accuracy:.3f} ({len(y_eval)} frozen samples, scored in {elapsed:.2f}s)")
     print(f"   - Features: {model.n_features_in_}")
-    print(f"   - Trees: {model.n_estimators}")
+    if hasattr(model, 'n_iter_'):
+        # HistGradientBoosting: one tree per class in every iteration
+        print(f"   - Boosting iterations: {model.n_iter_}")
+    else:
+        print(f"   - Trees: {model.n_estimators}")
     print(f"   - Classes: {len(model.classes_)}")
     
-    # Test feature importances
-    print(f"\n🔍 Top 10 Most Important Features:")
-    feature_importances = model.feature_importances_
-    top_features = np.argsort(feature_importances)[-10:][::-1]
-    
-    for i, feature_idx in enumerate(top_features):
-        print(f"   {i+1}. Feature {feature_idx}: {feature_importances[feature_idx]:.4f}")
+    # Test feature importances (gradient boosting has none built in)
+    if hasattr(model, 'feature_importances_'):
+        print(f"\n🔍 Top 10 Most Important Features:")
+        feature_importances = model.feature_importances_
+        top_features = np.argsort(feature_importances)[-10:][::-1]
+        
+        for i, feature_idx in enumerate(top_features):
+            print(f"   {i+1}. Feature {feature_idx}: {feature_importances[feature_idx]:.4f}")
     
     print("\n✅ Model testing complete!")
 
@@ -5,130 +5,120 @@ Using TensorFlow/Keras for accurate character recognition
 """
 
 import os
-import json
 import numpy as np
 import tensorflow as tf
 from tensorflow import keras
 from tensorflow.keras import layers
-import matplotlib.pyplot as plt
-from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
-import cv2
-from PIL import Image
-import base64
-import io
+
+from characters import HIRAGANA_TO_INDEX
+from data_quality import load_clean_export
+from data_pipeline import (ClassBalancedSequence, HardExampleSequence, MetricsLoggingCallback,
+                           StageTimingCallback, UInt8BatchSequence, report_memory, split_indices)
+from evaluation import StreamingEvaluator
+from metrics_logging import BackgroundPlotter, MetricsSink, render_history_plot
+from parallel_workers import open_shared_arrays
+from profiling import profiler
+from preprocessing_layers import CharacterNormalization, build_raw_input_model
 
 class JapaneseCharacterTrainer:
-    def __init__(self):
+    def __init__(self, normalize=True):
         self.model = None
         self.label_encoder = LabelEncoder()
         self.input_size = 64
         self.num_classes = 46  # Basic hiragana characters
         
+        # Crop/center drawings before resampling; decode at a larger canvas
+        # so small characters keep their detail
+        self.normalize = normalize
+        self.canvas_size = 128 if normalize else self.input_size
+        
         # Character mapping
-        self.character_to_index = {
-            'あ': 0, 'い': 1, 'う': 2, 'え': 3, 'お': 4,
-            'か': 5, 'き': 6, 'く': 7, 'け': 8, 'こ': 9,
-            'さ': 10, 'し': 11, 'す': 12, 'せ': 13, 'そ': 14,
-            'た': 15, 'ち': 16, 'つ': 17, 'て': 18, 'と': 19,
-            'な': 20, 'に': 21, 'ぬ': 22, 'ね': 23, 'の': 24,
-            'は': 25, 'ひ': 26, 'ふ': 27, 'へ': 28, 'ほ': 29,
-            'ま': 30, 'み': 31, 'む': 32, 'め': 33, 'も': 34,
-            'や': 35, 'ゆ': 36, 'よ': 37,
-            'ら': 38, 'り': 39, 'る': 40, 'れ': 41, 'ろ': 42,
-            'わ': 43, 'を': 44, 'ん': 45,
-        }
+        self.character_to_index = dict(HIRAGANA_TO_INDEX)
         
         self.index_to_character = {v: k for k, v in self.character_to_index.items()}
         
     def load_training_data(self, data_path):
-        """Load training data from JSON file"""
+        """Load training data from a JSON export or a compiled dataset directory"""
         print(f"Loading training data from {data_path}...")
         
-        with open(data_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        images = []
-        labels = []
-        
-        for entry in data['data']:
-            try:
-                # Decode base64 image
-                image_data = base64.b64decode(entry['imageData'])
-                image = Image.open(io.BytesIO(image_data))
-                
-                # Convert to grayscale and resize
-                image = image.convert('L')
-                image = image.resize((self.input_size, self.input_size))
-                
-                # Convert to numpy array and normalize
-                image_array = np.array(image) / 255.0
-                images.append(image_array)
-                
-                # Get character label
-                character = entry['character']
-                if character in self.character_to_index:
-                    labels.append(self.character_to_index[character])
-                else:
-                    print(f"Unknown character: {character}")
-                    
-            except Exception as e:
-                print(f"Error processing entry: {e}")
-                continue
-        
+        with profiler.stage('load', category='data') as stage:
+            if os.path.isdir(data_path):
+                # Output of `cli.py compile-data`: already gated and normalized
+                data = open_shared_arrays(data_path, ['images', 'labels'])
+                images, labels = data['images'], data['labels']
+            else:
+                # Decode, drop bad samples and normalize
+                images, labels = load_clean_export(
+                    data_path, self.character_to_index,
+                    canvas_size=self.canvas_size, input_size=self.input_size,
+                    normalize=self.normalize
+                )
+            stage['items'] = len(labels)
+        
+        # Images stay uint8; batches are scaled to float32 as they are drawn
         print(f"Loaded {len(images)} training samples")
-        return np.array(images), np.array(labels)
+        report_memory("after loading", images)
+        return images, labels
     
-    def create_model(self):
-        """Create CNN model for character recognition"""
-        print("Creating CNN model...")
+    def feature_layers(self, dropout=0.25, dense_dropout=0.5, width=1.0):
+        """Convolutional trunk and dense layers shared by the classifier and embedding models"""
+        # width scales the number of filters/units in every layer
+        def units(n):
+            return max(8, int(round(n * width)))
         
-        model = keras.Sequential([
+        return [
             # Input layer
             layers.Input(shape=(self.input_size, self.input_size, 1)),
             
             # First convolutional block
-            layers.Conv2D(32, (3, 3), activation='relu'),
+            layers.Conv2D(units(32), (3, 3), activation='relu'),
             layers.BatchNormalization(),
             layers.MaxPooling2D((2, 2)),
-            layers.Dropout(0.25),
+            layers.Dropout(dropout),
             
             # Second convolutional block
-            layers.Conv2D(64, (3, 3), activation='relu'),
+            layers.Conv2D(units(64), (3, 3), activation='relu'),
             layers.BatchNormalization(),
             layers.MaxPooling2D((2, 2)),
-            layers.Dropout(0.25),
+            layers.Dropout(dropout),
             
             # Third convolutional block
-            layers.Conv2D(128, (3, 3), activation='relu'),
+            layers.Conv2D(units(128), (3, 3), activation='relu'),
             layers.BatchNormalization(),
             layers.MaxPooling2D((2, 2)),
-            layers.Dropout(0.25),
+            layers.Dropout(dropout),
             
             # Fourth convolutional block
-            layers.Conv2D(256, (3, 3), activation='relu'),
+            layers.Conv2D(units(256), (3, 3), activation='relu'),
             layers.BatchNormalization(),
-            layers.Dropout(0.25),
+            layers.Dropout(dropout),
             
             # Global average pooling
             layers.GlobalAveragePooling2D(),
             
             # Dense layers
-            layers.Dense(512, activation='relu'),
+            layers.Dense(units(512), activation='relu'),
             layers.BatchNormalization(),
-            layers.Dropout(0.5),
+            layers.Dropout(dense_dropout),
             
-            layers.Dense(256, activation='relu'),
+            layers.Dense(units(256), activation='relu'),
             layers.BatchNormalization(),
-            layers.Dropout(0.5),
-            
+            layers.Dropout(dense_dropout),
+        ]
+    
+    def create_model(self, learning_rate=0.001, dropout=0.25, dense_dropout=0.5, width=1.0):
+        """Create CNN model for character recognition"""
+        print("Creating CNN model...")
+        
+        model = keras.Sequential(self.feature_layers(dropout, dense_dropout, width) + [
             # Output layer
             layers.Dense(self.num_classes, activation='softmax')
         ])
         
         # Compile model
         model.compile(
-            optimizer=keras.optimizers.Adam(learning_rate=0.001),
+            optimizer=keras.optimizers.Adam(learning_rate=learning_rate),
             loss='sparse_categorical_crossentropy',
             metrics=['accuracy']
         )
@@ -137,17 +127,9 @@ class JapaneseCharacterTrainer:
         print("Model created successfully!")
         return model
     
-    def train_model(self, X, y, epochs=100, batch_size=32, validation_split=0.2):
-        """Train the model"""
-        print(f"Training model for {epochs} epochs...")
-        
-        # Split data
-        X_train, X_val, y_train, y_val = train_test_split(
-            X, y, test_size=validation_split, random_state=42, stratify=y
-        )
-        
-        # Data augmentation
-        datagen = keras.preprocessing.image.ImageDataGenerator(
+    def create_augmenter(self):
+        """Random transforms applied to training batches"""
+        return keras.preprocessing.image.ImageDataGenerator(
             rotation_range=10,
             width_shift_range=0.1,
             height_shift_range=0.1,
@@ -155,6 +137,44 @@ class JapaneseCharacterTrainer:
             horizontal_flip=False,  # Don't flip Japanese characters
             fill_mode='nearest'
         )
+    
+    def train_model(self, X, y, epochs=100, batch_size=32, validation_split=0.2, balanced=True,
+                    indices=None, metrics_path='training_metrics.jsonl',
+                    checkpoint_path='best_model.h5', hard_mining=False):
+        """Train the model (on all samples, or only the given indices)
+        
+        Batch and epoch metrics stream to metrics_path (plus a .csv next to
+        it) and training_history.png is redrawn in the background each epoch.
+        The best epoch is saved to checkpoint_path unless it is None.
+        hard_mining biases batches toward high-loss samples and confused pairs.
+        """
+        print(f"Training model for {epochs} epochs...")
+        
+        # Split indices so the uint8 dataset is never copied
+        train_idx, val_idx = split_indices(y, test_size=validation_split, indices=indices)
+        
+        # Data augmentation
+        datagen = self.create_augmenter()
+        
+        if hard_mining:
+            train_batches = HardExampleSequence(
+                X, y, train_idx, batch_size=batch_size, augmenter=datagen,
+                num_classes=self.num_classes, class_names=self.index_to_character
+            )
+            train_batches.print_composition()
+        elif balanced:
+            # Equal share per class each epoch; rare classes are oversampled
+            # through augmentation rather than duplicated in the dataset
+            train_batches = ClassBalancedSequence(
+                X, y, train_idx, batch_size=batch_size, augmenter=datagen,
+                class_names=self.index_to_character
+            )
+            train_batches.print_composition()
+        else:
+            train_batches = UInt8BatchSequence(
+                X, y, train_idx, batch_size=batch_size, augmenter=datagen, shuffle=True
+            )
+        val_batches = UInt8BatchSequence(X, y, val_idx, batch_size=batch_size)
         
         # Callbacks
         callbacks = [
@@ -169,91 +189,214 @@ class JapaneseCharacterTrainer:
                 patience=5,
                 min_lr=1e-7
             ),
-            keras.callbacks.ModelCheckpoint(
-                'best_model.h5',
+            StageTimingCallback(batch_size)
+        ]
+        if hard_mining:
+            callbacks.append(train_batches.mining_callback())
+        if checkpoint_path:
+            callbacks.append(keras.callbacks.ModelCheckpoint(
+                checkpoint_path,
                 monitor='val_accuracy',
                 save_best_only=True
-            )
-        ]
+            ))
+        if metrics_path:
+            sink = MetricsSink(metrics_path, os.path.splitext(metrics_path)[0] + '.csv')
+            plotter = BackgroundPlotter(metrics_path, 'training_history.png')
+            callbacks.append(MetricsLoggingCallback(sink, batch_size, plotter=plotter))
+            print(f"Streaming metrics to {metrics_path}")
         
         # Train model
-        history = self.model.fit(
-            datagen.flow(X_train, y_train, batch_size=batch_size),
-            steps_per_epoch=len(X_train) // batch_size,
-            epochs=epochs,
-            validation_data=(X_val, y_val),
-            callbacks=callbacks,
-            verbose=1
-        )
-        
+        try:
+            with profiler.stage('train', category='train'):
+                history = self.model.fit(
+                    train_batches,
+                    epochs=epochs,
+                    validation_data=val_batches,
+                    callbacks=callbacks,
+                    verbose=1
+                )
+        finally:
+            # on_train_end does not run when fit raises or is interrupted
+            if metrics_path:
+                sink.close()
+                plotter.close()
+        
+        # EarlyStopping only restores the best weights when it stops the run,
+        # so load the checkpoint that convert_to_tflite will export
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            self.model.load_weights(checkpoint_path)
+        
+        report_memory("after training", X)
         return history
     
-    def evaluate_model(self, X_test, y_test):
-        """Evaluate model performance"""
-        print("Evaluating model...")
+    def train_distributed(self, X, y, strategy, epochs=100, batch_size=32, validation_split=0.2,
+                          indices=None, learning_rate=0.001, warmup_epochs=2, model_config=None):
+        """Data-parallel training under a tf.distribute strategy
+        
+        batch_size is per replica. The global batch is batch_size times the
+        number of replicas and the learning rate is scaled by the same factor,
+        ramped up linearly over the first warmup_epochs. Each worker streams
+        only its own shard of the training indices.
+        """
+        replicas = strategy.num_replicas_in_sync
+        global_batch = batch_size * replicas
+        scaled_rate = learning_rate * replicas
+        print(f"Data-parallel training on {replicas} replicas: "
+              f"global batch {global_batch}, learning rate {scaled_rate:g}")
+        
+        train_idx, val_idx = split_indices(y, test_size=validation_split, indices=indices)
+        # Every worker must run the same number of steps
+        steps_per_epoch = max(1, len(train_idx) // global_batch)
+        validation_steps = max(1, len(val_idx) // global_batch)
+        signature = (
+            tf.TensorSpec((None, self.input_size, self.input_size, 1), tf.float32),
+            tf.TensorSpec((None,), tf.as_dtype(y.dtype)),
+        )
         
-        # Load best model
-        self.model = keras.models.load_model('best_model.h5')
+        def make_dataset_fn(sample_idx, training):
+            def dataset_fn(input_context):
+                per_replica = input_context.get_per_replica_batch_size(global_batch)
+                shard = sample_idx[input_context.input_pipeline_id::input_context.num_input_pipelines]
+                if training:
+                    batches = ClassBalancedSequence(
+                        X, y, shard, batch_size=per_replica, augmenter=self.create_augmenter(),
+                        steps_per_epoch=steps_per_epoch, seed=input_context.input_pipeline_id,
+                        verbose=False
+                    )
+                else:
+                    batches = UInt8BatchSequence(X, y, shard, batch_size=per_replica)
+                steps = steps_per_epoch if training else validation_steps
+                
+                def generate():
+                    while True:
+                        for i in range(steps):
+                            yield batches[i % len(batches)]
+                        batches.on_epoch_end()
+                
+                return tf.data.Dataset.from_generator(generate, output_signature=signature).prefetch(2)
+            return dataset_fn
         
-        # Evaluate
-        test_loss, test_accuracy = self.model.evaluate(X_test, y_test, verbose=0)
+        train_data = strategy.distribute_datasets_from_function(make_dataset_fn(train_idx, True))
+        val_data = strategy.distribute_datasets_from_function(make_dataset_fn(val_idx, False))
         
-        print(f"Test Accuracy: {test_accuracy:.4f}")
-        print(f"Test Loss: {test_loss:.4f}")
+        with strategy.scope():
+            self.create_model(learning_rate=scaled_rate, **(model_config or {}))
         
-        # Predictions
-        predictions = self.model.predict(X_test)
-        predicted_classes = np.argmax(predictions, axis=1)
+        def warmup(epoch, rate):
+            if epoch < warmup_epochs:
+                return learning_rate + (scaled_rate - learning_rate) * (epoch + 1) / warmup_epochs
+            return rate
         
-        # Confusion matrix
-        from sklearn.metrics import confusion_matrix, classification_report
+        callbacks = [
+            keras.callbacks.LearningRateScheduler(warmup),
+            keras.callbacks.EarlyStopping(
+                monitor='val_accuracy',
+                patience=10,
+                restore_best_weights=True
+            ),
+            keras.callbacks.ReduceLROnPlateau(
+                monitor='val_loss',
+                factor=0.5,
+                patience=5,
+                min_lr=1e-7
+            ),
+            StageTimingCallback(global_batch),
+        ]
         
-        cm = confusion_matrix(y_test, predicted_classes)
+        with profiler.stage('train', category='train'):
+            history = self.model.fit(
+                train_data,
+                epochs=epochs,
+                steps_per_epoch=steps_per_epoch,
+                validation_data=val_data,
+                validation_steps=validation_steps,
+                callbacks=callbacks,
+                verbose=1
+            )
+        history.samples_per_epoch = steps_per_epoch * global_batch
+        return history
+    
+    def evaluate_model(self, X_test, y_test, indices=None, batch_size=256):
+        """Evaluate model performance on held-out samples"""
+        print("Evaluating model...")
         
-        # Print classification report
-        target_names = [self.index_to_character[i] for i in range(self.num_classes)]
-        print("\nClassification Report:")
-        print(classification_report(y_test, predicted_classes, target_names=target_names))
+        # Stream float32 batches from uint8 storage; train_model left the
+        # checkpointed best weights in self.model
+        test_batches = UInt8BatchSequence(X_test, y_test, indices, batch_size=batch_size)
+        evaluator = StreamingEvaluator(self.num_classes, self.index_to_character)
+        with profiler.stage('evaluate', len(test_batches.indices), 'eval'):
+            report = evaluator.evaluate(
+                lambda x: self.model.predict_on_batch(x),
+                (test_batches[i] for i in range(len(test_batches)))
+            )
+        evaluator.print_report(report)
         
-        return test_accuracy, cm
+        return report['accuracy'], evaluator.confusion
     
-    def plot_training_history(self, history):
-        """Plot training history"""
-        plt.figure(figsize=(12, 4))
-        
-        plt.subplot(1, 2, 1)
-        plt.plot(history.history['accuracy'], label='Training Accuracy')
-        plt.plot(history.history['val_accuracy'], label='Validation Accuracy')
-        plt.title('Model Accuracy')
-        plt.xlabel('Epoch')
-        plt.ylabel('Accuracy')
-        plt.legend()
-        
-        plt.subplot(1, 2, 2)
-        plt.plot(history.history['loss'], label='Training Loss')
-        plt.plot(history.history['val_loss'], label='Validation Loss')
-        plt.title('Model Loss')
-        plt.xlabel('Epoch')
-        plt.ylabel('Loss')
-        plt.legend()
-        
-        plt.tight_layout()
-        plt.savefig('training_history.png')
-        plt.show()
+    def plot_training_history(self, history, output_path='training_history.png'):
+        """Save training curves to a PNG (headless; never opens a window)"""
+        render_history_plot(history.history, output_path)
+        print(f"Training history saved to {output_path}")
     
-    def convert_to_tflite(self, output_path='japanese_character_model.tflite'):
-        """Convert model to TensorFlow Lite format"""
+    def build_export_model(self, raw_input=False):
+        """Wrap the classifier with the on-device preprocessing stage"""
+        if raw_input:
+            # uint8 canvas in; rescaling, resizing/normalization run in the graph
+            return build_raw_input_model(
+                self.model, self.input_size, self.canvas_size, normalize=self.normalize
+            )
+        
+        if not self.normalize:
+            return self.model
+        
+        # Client feeds the raw canvas; normalization runs inside the graph
+        inputs = layers.Input(shape=(self.canvas_size, self.canvas_size, 1))
+        x = CharacterNormalization(output_size=self.input_size)(inputs)
+        outputs = self.model(x)
+        return keras.Model(inputs, outputs)
+    
+    def convert_to_tflite(self, output_path='japanese_character_model.tflite', raw_input=True,
+                          model_path='best_model.h5', quantize='dynamic',
+                          representative_images=None):
+        """Convert model to TensorFlow Lite format
+
+        With raw_input the model takes the uint8 canvas directly. model_path=None
+        converts self.model as it is (e.g. a quantization-aware model).
+        quantize is None (float32), 'dynamic' (int8 weights) or 'int8' (int8
+        weights and activations); representative_images, inputs of the export
+        model, calibrate activation ranges for models trained without
+        fake-quant nodes.
+        """
         print("Converting model to TensorFlow Lite...")
         
         # Load best model
-        self.model = keras.models.load_model('best_model.h5')
+        if model_path:
+            with profiler.stage('load_model', category='export'):
+                self.model = keras.models.load_model(model_path)
         
         # Convert to TensorFlow Lite
-        converter = tf.lite.TFLiteConverter.from_keras_model(self.model)
-        converter.optimizations = [tf.lite.Optimize.DEFAULT]
-        
-        # Convert
-        tflite_model = converter.convert()
+        with profiler.stage('tflite_convert', category='export'):
+            export_model = self.build_export_model(raw_input)
+            converter = tf.lite.TFLiteConverter.from_keras_model(export_model)
+            if quantize:
+                converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            if quantize == 'int8':
+                if representative_images is not None:
+                    shape = (1,) + tuple(export_model.input_shape[1:])
+                    dtype = export_model.inputs[0].dtype.as_numpy_dtype
+                    converter.representative_dataset = lambda: (
+                        [image.reshape(shape).astype(dtype)] for image in representative_images
+                    )
+                # The network runs in int8; preprocessing ops without int8
+                # kernels stay float, and the output stays float32 for the app.
+                # Other ops could silently fall back too, so the int8 op count
+                # is printed below and recorded in the quantization report
+                converter.target_spec.supported_ops = [
+                    tf.lite.OpsSet.TFLITE_BUILTINS_INT8, tf.lite.OpsSet.TFLITE_BUILTINS
+                ]
+            
+            # Convert
+            tflite_model = converter.convert()
         
         # Save
         with open(output_path, 'wb') as f:
@@ -262,15 +405,22 @@ class JapaneseCharacterTrainer:
         print(f"TensorFlow Lite model saved to {output_path}")
         
         # Test the converted model
-        interpreter = tf.lite.Interpreter(model_path=output_path)
-        interpreter.allocate_tensors()
+        with profiler.stage('tflite_load', category='export'):
+            interpreter = tf.lite.Interpreter(model_path=output_path)
+            interpreter.allocate_tensors()
         
         input_details = interpreter.get_input_details()
         output_details = interpreter.get_output_details()
         
         print("TensorFlow Lite model details:")
         print(f"Input shape: {input_details[0]['shape']}")
+        print(f"Input type: {input_details[0]['dtype'].__name__}")
         print(f"Output shape: {output_details[0]['shape']}")
+        if quantize == 'int8':
+            from quantization import int8_coverage
+            coverage = int8_coverage(interpreter)
+            print(f"Int8 ops: {coverage['int8_ops']} of {coverage['ops']} "
+                  f"({coverage['float_ops']} left in float)")
         
         return output_path
     
@@ -282,26 +432,28 @@ class JapaneseCharacterTrainer:
         # For now, we'll use the existing data
         pass
 
-def main():
-    """Main training function"""
-    print("Japanese Character Recognition Model Training")
-    print("=" * 50)
-    
+def train_and_export(data_path='training_data_export.json', epochs=50, batch_size=16,
+                     tflite_path='japanese_character_model.tflite', hard_mining=False,
+                     export=True):
+    """Load, train, evaluate on a held-out split and export to TensorFlow Lite
+
+    With export=False training stops at best_model.h5 (conversion is its own step).
+    """
     # Initialize trainer
     trainer = JapaneseCharacterTrainer()
     
     # Load training data
-    data_path = 'training_data_export.json'
     if not os.path.exists(data_path):
         print(f"Training data file {data_path} not found!")
         print("Please export training data from the Flutter app first.")
-        return
+        return None
     
+    report_memory("before loading")
     X, y = trainer.load_training_data(data_path)
     
     if len(X) < 50:
         print(f"Not enough training data ({len(X)} samples). Need at least 50 samples.")
-        return
+        return None
     
     # Reshape data for CNN
     X = X.reshape(-1, trainer.input_size, trainer.input_size, 1)
@@ -314,21 +466,36 @@ def main():
     model = trainer.create_model()
     model.summary()
     
-    # Train model
-    history = trainer.train_model(X, y, epochs=50, batch_size=16)
+    # Hold out a test split that training never sees
+    train_idx, test_idx = split_indices(y, test_size=0.15)
     
-    # Plot training history
-    trainer.plot_training_history(history)
+    # Train model; metrics stream to training_metrics.jsonl and
+    # training_history.png is redrawn in the background as epochs finish
+    history = trainer.train_model(X, y, epochs=epochs, batch_size=batch_size, indices=train_idx,
+                                  hard_mining=hard_mining)
     
     # Evaluate model
-    test_accuracy, cm = trainer.evaluate_model(X, y)
+    test_accuracy, cm = trainer.evaluate_model(X, y, indices=test_idx)
+    
+    if not export:
+        print("\nTraining completed successfully!")
+        print(f"Final test accuracy: {test_accuracy:.4f}")
+        return 'best_model.h5'
     
     # Convert to TensorFlow Lite
-    tflite_path = trainer.convert_to_tflite()
+    tflite_path = trainer.convert_to_tflite(tflite_path)
     
     print("\nTraining completed successfully!")
     print(f"Final test accuracy: {test_accuracy:.4f}")
     print(f"TensorFlow Lite model saved to: {tflite_path}")
+    return tflite_path
+
+def main():
+    """Main training function"""
+    print("Japanese Character Recognition Model Training")
+    print("=" * 50)
+    
+    train_and_export()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()